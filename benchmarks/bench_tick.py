@@ -0,0 +1,592 @@
+"""
+Benchmark suite for the tick package. Every numba kernel of tick.jit_compiled_functions and the public methods of the
+tick building blocks are timed on scenarios sweeping the size of the graph, the number of stages, the density of
+hosts and the number of feeding timesteps. SamPy objects are replaced by the stand-ins of benchmarks.standins.
+
+For each benchmark, the first call (which includes numba compilation for kernels that have not been compiled yet for
+the given types) is timed separately from the steady-state calls. The results are written as JSON.
+
+Usage:
+    python -m benchmarks.bench_tick [--full] [--repeats N] [--filter SUBSTRING] [--output PATH]
+"""
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+
+import numba as nb
+import numpy as np
+from numba.typed import List as NumbaList
+
+import tick.jit_compiled_functions as jit_compiled_functions
+from tick.base import BaseTickFourPhases
+from tick.stage_transition import ProportionBasedStageTransition, TransitionPlan
+from tick.mortality import ProportionBasedTickMortality
+from tick.combined_dynamics import ProportionBasedCombinedDynamics
+from tick.feeding import FeedingSingleGraph, FeedingVertexCohorts, HostTickVertexMapping
+from tick.dispersal import ProportionBasedDispersal
+from tick.transmission import HostTickTransmission
+from tick.engine import SeasonalDynamicsEngine, SeasonalSchedule
+from .standins import StandInGraph, StandInHost, assemble_tick_class
+
+
+SWEEPS = {
+    'quick': {'nb_vertex': [10000, 100000],
+              'stages_as_tupple': [(1, 1, 1, 1), (2, 4, 4, 2)],
+              'host_density': [0.5, 5.],
+              'nb_timesteps_feeding': [3]},
+    'full': {'nb_vertex': [10000, 100000, 1000000],
+             'stages_as_tupple': [(1, 1, 1, 1), (2, 4, 4, 2), (5, 10, 10, 5)],
+             'host_density': [0.1, 1., 10.],
+             'nb_timesteps_feeding': [1, 3, 5]},
+}
+
+TickClass = assemble_tick_class(BaseTickFourPhases,
+                                ProportionBasedStageTransition,
+                                ProportionBasedTickMortality,
+                                ProportionBasedCombinedDynamics,
+                                FeedingSingleGraph,
+                                ProportionBasedDispersal,
+                                HostTickTransmission,
+                                SeasonalDynamicsEngine)
+
+CohortTickClass = assemble_tick_class(BaseTickFourPhases,
+                                      FeedingVertexCohorts)
+
+
+class Scenario:
+    """
+    Tick population, host population and parameters shared by the benchmarks of one point of the sweep.
+    """
+    def __init__(self, nb_vertex, stages_as_tupple, host_density, nb_timesteps_feeding, seed=0):
+        self.params = {'nb_vertex': nb_vertex, 'stages_as_tupple': list(stages_as_tupple),
+                       'host_density': host_density, 'nb_timesteps_feeding': nb_timesteps_feeding}
+        rng = np.random.default_rng(seed)
+
+        self.graph = StandInGraph(nb_vertex)
+        self.host = StandInHost(nb_vertex, int(host_density * nb_vertex), rng)
+        self.nb_stages = sum(stages_as_tupple)
+        # every stage but the eggs feeds on the host
+        self.feeding_stages = list(range(stages_as_tupple[0], self.nb_stages))
+        self.tick = TickClass(graph=self.graph, stages_as_tupple=stages_as_tupple,
+                              dict_hosts={'host': [self.host, self.feeding_stages]},
+                              nb_timesteps_feeding=nb_timesteps_feeding, parallel_threshold=None)
+
+        self.initial_pop = rng.integers(0, 1000, self.tick.pop_per_vertex.shape).astype(self.tick.tick_count_dtype)
+        self.array_proportion = np.full(self.nb_stages, 0.05)
+        self.array_proportion_vertex = rng.random((nb_vertex, self.nb_stages)) * 0.1
+        self.array_vertex_class = rng.integers(0, 20, nb_vertex).astype(np.uint8)
+        self.table_proportion_class = rng.random((20, self.nb_stages)) * 0.1
+        self.geographic_condition = rng.random(nb_vertex) < 0.5
+        self.matrix_transitions = np.full((self.nb_stages, self.nb_stages), 0.)
+        for i in range(self.nb_stages - 1):
+            self.matrix_transitions[i, i + 1] = 0.1
+        self.transition_plan = TransitionPlan(self.matrix_transitions)
+        self.dict_transitions = {('larva', 0, 'nymph', 0): 0.1, ('nymph', 0, 'adult', 0): 0.1}
+        self.list_stage_hosts_prob = [[stage, ('host', 0.001)] for stage in self.feeding_stages]
+        self.array_tick_fed = rng.integers(0, 5, self.host.df_attributes.nb_rows)
+        self.host.df_attributes['infected'] = rng.random(self.host.df_attributes.nb_rows) < 0.1
+        self.schedule = SeasonalSchedule(self.nb_stages, ['winter'] * 90 + ['summer'] * 275,
+                                         dict_mortality={'winter': {key: self.array_proportion
+                                                                    for key in ALL_COMPARTMENTS}},
+                                         dict_transitions={'summer': {key: self.transition_plan
+                                                                      for key in ALL_COMPARTMENTS}})
+        self.moved_positions = self.host.df_attributes['position'].copy()
+        is_moving = rng.random(self.moved_positions.shape[0]) < 0.05
+        self.moved_positions[is_moving] = np.clip(self.moved_positions[is_moving] + 1, 0, nb_vertex - 1)
+
+        self.tick_cohorts = None
+
+    def get_tick_cohorts(self):
+        # only built for the benchmarks that need it, since it holds a second copy of the tick population
+        if self.tick_cohorts is None:
+            self.tick_cohorts = CohortTickClass(graph=self.graph, stages_as_tupple=self.params['stages_as_tupple'],
+                                                dict_hosts={'host': [self.host, self.feeding_stages]},
+                                                nb_timesteps_feeding=self.params['nb_timesteps_feeding'],
+                                                parallel_threshold=None)
+            self.reset()
+        return self.tick_cohorts
+
+    def reset(self):
+        self.tick.pop_per_vertex[:] = self.initial_pop
+        self.tick.invalidate_tick_count_cache()
+        if self.tick_cohorts is not None:
+            self.tick_cohorts.pop_per_vertex[:] = self.initial_pop
+            self.tick_cohorts.invalidate_tick_count_cache()
+            for arr_cohort in self.tick_cohorts.dict_feeding_cohorts.values():
+                arr_cohort[:] = 3
+            self.tick_cohorts.dict_cohort_positions = {}
+            self.tick_cohorts.move_feeding_cohorts()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# arguments of the kernels. Each function takes a Scenario and returns a tuple of arguments, built so that the kernel
+# can be called repeatedly.
+
+def _args_count(sc):
+    return sc.tick.pop_per_vertex, 0, sc.nb_stages - 1
+
+
+def _args_count_on_vertices(sc):
+    return sc.tick.pop_per_vertex, 0, sc.nb_stages - 1, np.arange(0, sc.graph.number_vertices, 10)
+
+
+def _args_find_active(sc):
+    return (sc.tick.pop_per_vertex,)
+
+
+def _args_aggregate(sc):
+    return sc.tick.pop_per_vertex, sc.tick.arr_phase_of_stage
+
+
+def _args_aggregate_on_vertices(sc):
+    return _args_aggregate(sc) + (np.arange(0, sc.graph.number_vertices, 10),)
+
+
+def _args_transition_plan(sc):
+    plan = sc.transition_plan
+    return plan.arr_start, plan.arr_end, plan.arr_proportion, sc.tick.pop_per_vertex_unfed
+
+
+def _args_transition_plan_on_vertices(sc):
+    return _args_transition_plan(sc) + (np.arange(0, sc.graph.number_vertices, 10),)
+
+
+def _args_mortality(sc):
+    return sc.array_proportion, sc.tick.pop_per_vertex_unfed, sc.geographic_condition
+
+
+def _args_mortality_on_vertices(sc):
+    return _args_mortality(sc) + (np.arange(0, sc.graph.number_vertices, 10),)
+
+
+def _args_vertex_specific_mortality(sc):
+    return sc.array_proportion_vertex, sc.tick.pop_per_vertex_unfed
+
+
+def _args_vertex_specific_mortality_on_vertices(sc):
+    return _args_vertex_specific_mortality(sc) + (np.arange(0, sc.graph.number_vertices, 10),)
+
+
+def _args_class_mortality(sc):
+    return sc.table_proportion_class, sc.array_vertex_class, sc.tick.pop_per_vertex_unfed
+
+
+def _args_class_mortality_on_vertices(sc):
+    return _args_class_mortality(sc) + (np.arange(0, sc.graph.number_vertices, 10),)
+
+
+def _args_release(sc):
+    return sc.tick.pop_per_vertex_fed, sc.host.df_attributes['position'], sc.array_tick_fed, sc.feeding_stages[0]
+
+
+def _args_build_index(sc):
+    return sc.host.df_attributes['position'], sc.graph.number_vertices
+
+
+def _args_update_index(sc):
+    arr_pos = sc.host.df_attributes['position']
+    arr_offsets, arr_agent_ids = jit_compiled_functions.feeding_build_vertex_agent_index(arr_pos,
+                                                                                        sc.graph.number_vertices)
+    arr_slot = np.full(arr_agent_ids.shape[0], 0, dtype=np.int64)
+    arr_slot[arr_agent_ids] = np.arange(arr_agent_ids.shape[0])
+    arr_moved = np.where(arr_pos != sc.moved_positions)[0]
+    return arr_offsets, arr_agent_ids, arr_slot, arr_moved, arr_pos.astype(np.int64), sc.moved_positions
+
+
+def _args_release_from_index(sc):
+    arr_offsets, arr_agent_ids = jit_compiled_functions.feeding_build_vertex_agent_index(*_args_build_index(sc))
+    return sc.tick.pop_per_vertex_fed, arr_offsets, arr_agent_ids, sc.array_tick_fed, sc.feeding_stages[0]
+
+
+def _args_release_from_index_replicates(sc):
+    # the tick population of the scenarios has a single replicate
+    args = _args_release_from_index(sc)
+    return args[:3] + (sc.array_tick_fed[None, :], args[4])
+
+
+def _args_split_hosts(sc):
+    return 1000, np.array([0.2, 0.3, 0.1]), np.full(3, 0, dtype=np.int64)
+
+
+def _args_split_agents(sc):
+    nb_agents = sc.host.df_attributes.nb_rows
+    return 1000, np.arange(nb_agents), 0, nb_agents, np.full(nb_agents, 0, dtype=np.int64)
+
+
+def _args_attach(sc):
+    arr_offsets, arr_agent_ids = jit_compiled_functions.feeding_build_vertex_agent_index(*_args_build_index(sc))
+    list_offsets = NumbaList([arr_offsets])
+    list_agent_ids = NumbaList([arr_agent_ids])
+    list_col = NumbaList([np.full(arr_agent_ids.shape[0], 0, dtype=np.int64)])
+    list_col_inf = NumbaList([np.full(arr_agent_ids.shape[0], 0, dtype=np.int64)])
+    return (0, list_offsets, list_agent_ids, sc.tick.pop_per_vertex_unfed, sc.tick.pop_per_vertex_unfed_inf,
+            sc.feeding_stages[0], np.array([0.001]), list_col, list_col_inf)
+
+
+def _args_attach_replicates(sc):
+    _, list_offsets, list_agent_ids, _, _, stage, arr_proba, list_col, list_col_inf = _args_attach(sc)
+    return (np.array([0], dtype=np.uint32), list_offsets, list_agent_ids, sc.tick.pop_per_vertex_unfed[None],
+            sc.tick.pop_per_vertex_unfed_inf[None], stage, arr_proba, NumbaList([list_col[0][None]]),
+            NumbaList([list_col_inf[0][None]]))
+
+
+def _cohort_arrays(sc):
+    return np.full((2, sc.graph.number_vertices, len(sc.feeding_stages), sc.params['nb_timesteps_feeding']), 3,
+                   dtype=sc.tick.tick_count_dtype)
+
+
+def _args_release_from_cohorts(sc):
+    return sc.tick.pop_per_vertex_fed, _cohort_arrays(sc)[0], np.array(sc.feeding_stages, dtype=np.int64), 0
+
+
+def _args_attach_in_cohorts(sc):
+    arr_count = np.bincount(sc.host.df_attributes['position'], minlength=sc.graph.number_vertices)
+    return (0, NumbaList([arr_count]), sc.tick.pop_per_vertex_unfed, sc.tick.pop_per_vertex_unfed_inf,
+            sc.feeding_stages[0], np.array([0.001]), NumbaList([_cohort_arrays(sc)]), np.array([0]), 0)
+
+
+def _args_move_cohorts(sc):
+    arr_pos = sc.host.df_attributes['position'].astype(np.int64)
+    arr_moved = np.where(arr_pos != sc.moved_positions)[0]
+    arr_moved = arr_moved[np.argsort(arr_pos[arr_moved], kind='stable')]
+    return (_cohort_arrays(sc), np.bincount(arr_pos, minlength=sc.graph.number_vertices), arr_pos[arr_moved],
+            sc.moved_positions[arr_moved])
+
+
+def _args_dispersal_outflow(sc):
+    sc.tick.build_dispersal_adjacency()
+    return (sc.tick.pop_per_vertex_unfed, sc.array_proportion, sc.tick.arr_dispersal_offsets,
+            sc.graph.number_vertices, sc.tick.arr_dispersal_outflow)
+
+
+def _args_dispersal_outflow_on_vertices(sc):
+    return _args_dispersal_outflow(sc) + (np.arange(0, sc.graph.number_vertices, 10),)
+
+
+def _args_dispersal_inflow(sc):
+    sc.tick.build_dispersal_adjacency()
+    arr_outflow = np.full(sc.tick.pop_per_vertex_unfed.shape, 7, dtype=np.int64)
+    return (sc.tick.pop_per_vertex_unfed, arr_outflow, sc.tick.arr_dispersal_offsets, sc.tick.arr_dispersal_in_offsets,
+            sc.tick.arr_dispersal_in_sources, sc.tick.arr_dispersal_in_edges, sc.graph.number_vertices, 0)
+
+
+def _args_dispersal_inflow_on_vertices(sc):
+    return _args_dispersal_inflow(sc) + (np.arange(0, sc.graph.number_vertices, 10),)
+
+
+def _args_dispersal_reachable(sc):
+    sc.tick.build_dispersal_adjacency()
+    return (sc.tick.arr_dispersal_offsets, sc.tick.arr_dispersal_neighbours, sc.graph.number_vertices,
+            np.arange(0, sc.graph.number_vertices, 10), sc.graph.number_vertices)
+
+
+def _coarse_mapping(sc):
+    # host graph whose vertices gather 4 consecutive vertices of the tick graph
+    nb_host_vertex = (sc.graph.number_vertices + 3) // 4
+    return HostTickVertexMapping.from_host_vertex_of_tick_vertex(nb_host_vertex,
+                                                                 np.arange(sc.graph.number_vertices) // 4)
+
+
+def _args_release_through_mapping(sc):
+    mapping = _coarse_mapping(sc)
+    arr_pos = sc.host.df_attributes['position'] // 4
+    return (sc.tick.pop_per_vertex_fed, arr_pos, sc.array_tick_fed, sc.feeding_stages[0], mapping.nb_host_vertex,
+            mapping.arr_tick_offsets, mapping.arr_tick_host_vertices, mapping.arr_tick_cum_low,
+            mapping.arr_tick_cum_high)
+
+
+def _args_attach_through_mapping(sc):
+    mapping = _coarse_mapping(sc)
+    arr_offsets, arr_agent_ids = jit_compiled_functions.feeding_build_vertex_agent_index(
+        sc.host.df_attributes['position'] // 4, mapping.nb_host_vertex)
+    nb_agents = arr_agent_ids.shape[0]
+    return (0, NumbaList([mapping.arr_tick_offsets]), NumbaList([mapping.arr_tick_host_vertices]),
+            NumbaList([mapping.arr_tick_weights]), NumbaList([arr_offsets]), NumbaList([arr_agent_ids]),
+            sc.tick.pop_per_vertex_unfed, sc.tick.pop_per_vertex_unfed_inf, sc.feeding_stages[0], np.array([0.001]),
+            NumbaList([np.full(nb_agents, 0, dtype=np.int64)]), NumbaList([np.full(nb_agents, 0, dtype=np.int64)]))
+
+
+def _args_transmission(sc):
+    nb_agents = sc.host.df_attributes.nb_rows
+    list_col = NumbaList([sc.array_tick_fed.copy() for _ in sc.feeding_stages])
+    list_col_inf = NumbaList([sc.array_tick_fed.copy() for _ in sc.feeding_stages])
+    return 0, np.random.default_rng(0).random(nb_agents) < 0.1, list_col, list_col_inf, 0.1, 0.01, 0.001
+
+
+def _combined_arrays(sc):
+    arr_mortality = np.full((2, 2, sc.nb_stages), 0.05)
+    plan = sc.transition_plan
+    arr_edge_offsets = np.cumsum([0] + [plan.nb_edges] * 4)
+    return (sc.tick.pop_per_vertex, arr_mortality, arr_edge_offsets, np.tile(plan.arr_start, 4),
+            np.tile(plan.arr_end, 4), np.tile(plan.arr_proportion, 4), np.full(sc.graph.number_vertices, True))
+
+
+def _args_combined_on_vertices(sc):
+    return _combined_arrays(sc) + (np.arange(0, sc.graph.number_vertices, 10),)
+
+
+def _args_seasonal_dynamics(sc):
+    schedule = sc.schedule
+    # ten timesteps starting at the end of winter, so that both seasons are used
+    return (sc.tick.pop_per_vertex, schedule.arr_season_of_day, 85, 10, schedule.arr_mortality,
+            schedule.arr_edge_offsets, schedule.arr_start, schedule.arr_end, schedule.arr_proportion,
+            np.full(sc.graph.number_vertices, True))
+
+
+def _args_seasonal_dynamics_on_vertices(sc):
+    return _args_seasonal_dynamics(sc) + (np.arange(0, sc.graph.number_vertices, 10),)
+
+
+def _args_seasonal_dynamics_with_feeding(sc):
+    # every feeding stage releases the same ticks, during the nb_timesteps_feeding first timesteps
+    host_index = sc.tick.get_host_vertex_index('host')
+    nb_entries = len(sc.feeding_stages)
+    nb_agents = host_index.arr_agent_ids.shape[0]
+    arr_released = np.tile(sc.array_tick_fed[host_index.arr_agent_ids],
+                           (sc.params['nb_timesteps_feeding'], 2, 1, nb_entries))
+    return _args_seasonal_dynamics(sc) + (host_index.arr_offsets[None, :], np.full(nb_entries, 0, dtype=np.int64),
+                                          np.array(sc.feeding_stages, dtype=np.int64),
+                                          nb_agents * np.arange(nb_entries, dtype=np.int64), arr_released)
+
+
+def _args_seasonal_dynamics_with_feeding_on_vertices(sc):
+    return _args_seasonal_dynamics_with_feeding(sc) + (np.arange(0, sc.graph.number_vertices, 10),)
+
+
+KERNEL_ARGS = {
+    'base_count_tick_per_vertex_with_stages': _args_count,
+    'base_count_tick_per_vertex_with_stages_on_vertices': _args_count_on_vertices,
+    'base_find_active_vertices': _args_find_active,
+    'base_aggregate_tick_counts': _args_aggregate,
+    'base_aggregate_tick_counts_on_vertices': _args_aggregate_on_vertices,
+    'stage_transition_apply_transition_plan': _args_transition_plan,
+    'stage_transition_apply_transition_plan_on_vertices': _args_transition_plan_on_vertices,
+    'mortality_proportion_based_mortality_all_graph': _args_mortality,
+    'mortality_proportion_based_mortality_on_vertices': _args_mortality_on_vertices,
+    'mortality_vertex_specific_mortality': _args_vertex_specific_mortality,
+    'mortality_vertex_specific_mortality_on_vertices': _args_vertex_specific_mortality_on_vertices,
+    'mortality_class_based_mortality': _args_class_mortality,
+    'mortality_class_based_mortality_on_vertices': _args_class_mortality_on_vertices,
+    'feeding_release_fed_ticks': _args_release,
+    'feeding_build_vertex_agent_index': _args_build_index,
+    'feeding_update_vertex_agent_index': _args_update_index,
+    'feeding_release_fed_ticks_from_index': _args_release_from_index,
+    'feeding_release_fed_ticks_from_index_replicates': _args_release_from_index_replicates,
+    'feeding_split_ticks_between_hosts': _args_split_hosts,
+    'feeding_split_ticks_between_agents': _args_split_agents,
+    'feeding_attach_to_host_to_feed': _args_attach,
+    'feeding_attach_to_host_to_feed_replicates': _args_attach_replicates,
+    'feeding_release_fed_ticks_from_cohorts': _args_release_from_cohorts,
+    'feeding_attach_to_host_to_feed_in_cohorts': _args_attach_in_cohorts,
+    'feeding_move_cohorts_with_hosts': _args_move_cohorts,
+    'combined_dynamics_mortality_and_transitions': _combined_arrays,
+    'feeding_release_fed_ticks_through_mapping': _args_release_through_mapping,
+    'feeding_attach_to_host_to_feed_through_mapping': _args_attach_through_mapping,
+    'transmission_hosts_and_feeding_ticks': _args_transmission,
+    'dispersal_compute_outflow': _args_dispersal_outflow,
+    'dispersal_compute_outflow_on_vertices': _args_dispersal_outflow_on_vertices,
+    'dispersal_gather_inflow': _args_dispersal_inflow,
+    'dispersal_gather_inflow_on_vertices': _args_dispersal_inflow_on_vertices,
+    'dispersal_find_reachable_vertices': _args_dispersal_reachable,
+    'combined_dynamics_mortality_and_transitions_on_vertices': _args_combined_on_vertices,
+    'engine_run_seasonal_dynamics': _args_seasonal_dynamics,
+    'engine_run_seasonal_dynamics_on_vertices': _args_seasonal_dynamics_on_vertices,
+    'engine_run_seasonal_dynamics_with_feeding': _args_seasonal_dynamics_with_feeding,
+    'engine_run_seasonal_dynamics_with_feeding_on_vertices': _args_seasonal_dynamics_with_feeding_on_vertices,
+}
+
+
+def list_kernels():
+    """
+    Names of all the numba kernels defined in tick.jit_compiled_functions.
+    """
+    return sorted(name for name, obj in vars(jit_compiled_functions).items()
+                  if isinstance(obj, nb.core.registry.CPUDispatcher))
+
+
+def kernel_cases():
+    """
+    Yield (name, setup, run) for each kernel that has an argument builder. Multi-threaded twins reuse the builder of
+    their serial version.
+    """
+    for name in list_kernels():
+        args_builder = KERNEL_ARGS.get(name[:-len('_parallel')] if name.endswith('_parallel') else name)
+        if args_builder is None:
+            continue
+        kernel = getattr(jit_compiled_functions, name)
+
+        def setup(sc, args_builder=args_builder):
+            sc.reset()
+            return args_builder(sc)
+
+        def run(args, kernel=kernel):
+            kernel(*args)
+
+        yield 'kernel.' + name, setup, run
+
+
+ALL_COMPARTMENTS = [(feeding_status, disease_status) for feeding_status in ['fed', 'unfed']
+                    for disease_status in ['infected', 'susceptible']]
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# public methods of the building blocks. Each entry maps a name to a function taking a Scenario and returning the
+# callable to time. The population is reset before each call.
+
+METHOD_CALLS = {
+    'BaseTickFourPhases.count_tick_per_vertex':
+        lambda sc: lambda: sc.tick.count_tick_per_vertex(),
+    'BaseTickFourPhases.count_tick_per_vertex[stage]':
+        lambda sc: lambda: sc.tick.count_tick_per_vertex(stage='nymph', feeding_status='unfed',
+                                                         disease_status='susceptible'),
+    'BaseTickFourPhases.get_tick_count_tensor':
+        lambda sc: lambda: sc.tick.get_tick_count_tensor(),
+    'BaseTickFourPhases.update_active_vertices':
+        lambda sc: lambda: (sc.tick.enable_active_vertex_tracking(0.5), sc.tick.disable_active_vertex_tracking()),
+    'BaseTickFourPhases.set_parallel_execution':
+        lambda sc: lambda: sc.tick.set_parallel_execution(parallel_threshold=None),
+    'ProportionBasedTickMortality.proportion_based_mortality_all_graph':
+        lambda sc: lambda: sc.tick.proportion_based_mortality_all_graph('unfed', 'susceptible', sc.array_proportion,
+                                                                        sc.geographic_condition),
+    'ProportionBasedTickMortality.vertex_specific_proportion_based_mortality':
+        lambda sc: lambda: sc.tick.vertex_specific_proportion_based_mortality('unfed', 'susceptible',
+                                                                              sc.array_proportion_vertex),
+    'ProportionBasedTickMortality.class_based_mortality':
+        lambda sc: lambda: sc.tick.class_based_mortality('unfed', 'susceptible', sc.array_vertex_class,
+                                                         sc.table_proportion_class),
+    'ProportionBasedStageTransition.proportion_based_transitions':
+        lambda sc: lambda: sc.tick.proportion_based_transitions('unfed', 'susceptible', sc.dict_transitions),
+    'ProportionBasedStageTransition.proportion_based_transition_from_matrix':
+        lambda sc: lambda: sc.tick.proportion_based_transition_from_matrix('unfed', 'susceptible',
+                                                                           sc.matrix_transitions),
+    'ProportionBasedStageTransition.proportion_based_transition_from_plan':
+        lambda sc: lambda: sc.tick.proportion_based_transition_from_plan('unfed', 'susceptible', sc.transition_plan),
+    'ProportionBasedStageTransition.compile_transition_plan':
+        lambda sc: lambda: sc.tick.compile_transition_plan(sc.dict_transitions),
+    'ProportionBasedCombinedDynamics.proportion_based_mortality_and_transitions':
+        lambda sc: lambda: sc.tick.proportion_based_mortality_and_transitions(
+            dict_mortality={key: sc.array_proportion for key in ALL_COMPARTMENTS},
+            dict_transitions={key: sc.transition_plan for key in ALL_COMPARTMENTS}),
+    'SeasonalDynamicsEngine.run[10 steps]':
+        lambda sc: lambda: sc.tick.run(10, sc.schedule),
+    'SeasonalDynamicsEngine.run[10 steps, feeding]':
+        lambda sc: lambda: sc.tick.run(10, sc.schedule, increment_feeding=True),
+    'ProportionBasedDispersal.proportion_based_dispersal':
+        lambda sc: lambda: sc.tick.proportion_based_dispersal('unfed', 'susceptible', sc.array_proportion),
+    'HostTickTransmission.transmission_between_hosts_and_ticks':
+        lambda sc: lambda: sc.tick.transmission_between_hosts_and_ticks(0, [('host', 0.1, 0.01, 0.001)]),
+    'FeedingSingleGraph.attach_to_host_to_feed':
+        lambda sc: lambda: sc.tick.attach_to_host_to_feed(0, sc.list_stage_hosts_prob),
+    'FeedingSingleGraph.increment_feeding_stage':
+        lambda sc: lambda: sc.tick.increment_feeding_stage(),
+    'FeedingSingleGraph.get_host_vertex_index':
+        lambda sc: lambda: sc.tick.get_host_vertex_index('host'),
+    'FeedingVertexCohorts.attach_to_host_to_feed':
+        lambda sc: lambda: sc.get_tick_cohorts().attach_to_host_to_feed(0, sc.list_stage_hosts_prob),
+    'FeedingVertexCohorts.increment_feeding_stage':
+        lambda sc: lambda: sc.get_tick_cohorts().increment_feeding_stage(),
+}
+
+
+def method_cases():
+    """
+    Yield (name, setup, run) for each public method of the building blocks.
+    """
+    for name, make_call in METHOD_CALLS.items():
+
+        def setup(sc, make_call=make_call):
+            sc.reset()
+            return make_call(sc)
+
+        def run(call):
+            call()
+
+        yield 'method.' + name, setup, run
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+
+def time_case(scenario, setup, run, repeats):
+    """
+    Time a benchmark on a scenario.
+
+    :return: dict with the duration of the first call (which includes JIT compilation if needed), and statistics on
+             the steady-state calls. If the benchmark raises an error, it is reported in the dict instead.
+    """
+    try:
+        state = setup(scenario)
+        start = time.perf_counter()
+        run(state)
+        first_call = time.perf_counter() - start
+
+        list_durations = []
+        for _ in range(repeats):
+            state = setup(scenario)
+            start = time.perf_counter()
+            run(state)
+            list_durations.append(time.perf_counter() - start)
+    except Exception as error:
+        return {'error': type(error).__name__ + ': ' + str(error)}
+
+    median = statistics.median(list_durations)
+    return {'first_call_s': first_call,
+            'compile_estimate_s': max(first_call - median, 0.),
+            'median_s': median,
+            'min_s': min(list_durations),
+            'repeats': repeats}
+
+
+def run_suite(sweep, repeats, name_filter=None, verbose=True):
+    """
+    Run every benchmark on every point of the sweep.
+
+    :return: dict, ready to be serialized as JSON.
+    """
+    list_results = []
+    keys = list(sweep.keys())
+    for values in itertools.product(*(sweep[key] for key in keys)):
+        scenario = Scenario(**dict(zip(keys, values)))
+        for name, setup, run in itertools.chain(kernel_cases(), method_cases()):
+            if name_filter is not None and name_filter not in name:
+                continue
+            result = time_case(scenario, setup, run, repeats)
+            result.update({'benchmark': name, 'params': scenario.params})
+            list_results.append(result)
+            if verbose:
+                summary = result['error'] if 'error' in result else '%.6f s' % result['median_s']
+                print(name, scenario.params, summary, file=sys.stderr)
+
+    return {'metadata': {'python': platform.python_version(),
+                         'numpy': np.__version__,
+                         'numba': nb.__version__,
+                         'numba_num_threads': nb.config.NUMBA_NUM_THREADS,
+                         'machine': platform.machine(),
+                         'date': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'uncovered_kernels': [name for name in list_kernels()
+                                  if (name[:-len('_parallel')] if name.endswith('_parallel') else name)
+                                  not in KERNEL_ARGS],
+            'results': list_results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark suite for the tick package.")
+    parser.add_argument('--full', action='store_true', help="use the full sweep instead of the quick one.")
+    parser.add_argument('--repeats', type=int, default=5, help="number of steady-state calls per benchmark.")
+    parser.add_argument('--filter', default=None, help="only run benchmarks whose name contains this string.")
+    parser.add_argument('--output', default=None, help="path of the JSON output. Printed on stdout if not given.")
+    args = parser.parse_args(argv)
+
+    results = run_suite(SWEEPS['full' if args.full else 'quick'], args.repeats, name_filter=args.filter)
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=1)
+    else:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Lightweight stand-ins for the SamPy objects the tick building blocks interact with, so that the benchmarks can run
+without SamPy. They only implement the attributes and methods used by the tick package.
+"""
+import numpy as np
+
+
+class StandInGraph:
+    """
+    Square grid graph with 4-neighbours connectivity. Mimics the attributes of SamPy graphs used by the tick package.
+
+    attributes:
+        - number_vertices: integer, number of vertices.
+        - connections: 2D array of int of shape (number_vertices, 4). connections[i] are the indexes of the
+                       neighbours of the vertex i, padded with -1.
+        - weights: 2D array of float of shape (number_vertices, 4), cumulative probabilities of moving toward each
+                   neighbour, as used by SamPy.
+    """
+    def __init__(self, nb_vertex):
+        side = int(np.ceil(np.sqrt(nb_vertex)))
+        self.number_vertices = nb_vertex
+
+        arr_index = np.arange(nb_vertex)
+        row, col = arr_index // side, arr_index % side
+        self.connections = np.full((nb_vertex, 4), -1, dtype=np.int64)
+        for k, (d_row, d_col) in enumerate([(-1, 0), (1, 0), (0, -1), (0, 1)]):
+            neighbour = (row + d_row) * side + col + d_col
+            is_valid = (row + d_row >= 0) & (col + d_col >= 0) & (col + d_col < side) & (neighbour < nb_vertex)
+            self.connections[is_valid, k] = neighbour[is_valid]
+
+        nb_neighbours = (self.connections >= 0).sum(axis=1)
+        self.weights = np.where(self.connections >= 0, 1., 0.)
+        self.weights = np.cumsum(self.weights, axis=1) / np.maximum(nb_neighbours, 1)[:, None]
+
+
+class StandInDataFrame(dict):
+    """
+    Dictionary of columns mimicking SamPy DataFrameXS. Assigning a scalar to a column broadcasts it to all rows.
+    """
+    def __init__(self, nb_rows):
+        super().__init__()
+        self.nb_rows = nb_rows
+
+    def __setitem__(self, key, value):
+        if np.isscalar(value):
+            value = np.full(self.nb_rows, value, dtype=np.int64)
+        super().__setitem__(key, np.asarray(value))
+
+
+class StandInHost:
+    """
+    Host population whose agents only have a position.
+
+    :param nb_vertex: integer, number of vertices of the graph.
+    :param nb_agents: integer, number of agents.
+    :param rng: numpy Generator used to draw the positions.
+    """
+    def __init__(self, nb_vertex, nb_agents, rng):
+        self.df_attributes = StandInDataFrame(nb_agents)
+        self.df_attributes['position'] = np.sort(rng.integers(0, nb_vertex, nb_agents))
+
+    def count_pop_per_vertex(self, position_attribute='position', nb_vertex=None):
+        return np.bincount(self.df_attributes[position_attribute], minlength=nb_vertex)
+
+
+def assemble_tick_class(*building_blocks):
+    """
+    Stand-in for sampy_class: create a class inheriting from the given building blocks, whose constructor calls the
+    constructor of each of them with all the kwargs.
+    """
+    def __init__(self, **kwargs):
+        for block in building_blocks:
+            block.__init__(self, **kwargs)
+    return type('StandInTick', building_blocks, {'__init__': __init__})
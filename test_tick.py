@@ -1,2 +1,1220 @@
-from tick.base import BaseTick
+from tick.base import BaseTickFourPhases
+import os
+import tempfile
 import unittest
+from unittest import mock
+import numba as nb
+import numpy as np
+from tick.feeding import (FeedingSingleGraph, FeedingMultiGraph, FeedingVertexCohorts, HostTickVertexMapping,
+                          HostVertexIndex)
+from tick.stage_transition import ProportionBasedStageTransition, TransitionPlan
+from tick.mortality import ProportionBasedTickMortality
+from tick.combined_dynamics import ProportionBasedCombinedDynamics
+from tick.dispersal import ProportionBasedDispersal
+from tick.transmission import HostTickTransmission
+from tick.engine import SeasonalDynamicsEngine, SeasonalSchedule, get_sync_chunks
+from tick.profiling import TickInstrumentation
+from tick.compilation import get_kernel_signatures, warmup
+import tick.jit_compiled_functions as jit_compiled_functions
+from tick.recorder import TickCountRecorder, load_tick_counts
+from tick.domain_decomposition import DomainDecomposition, partition_vertices, _get_worker_block_names
+from benchmarks.bench_tick import Scenario, method_cases, run_suite
+from benchmarks.standins import StandInGraph, StandInHost, StandInDataFrame, assemble_tick_class
+
+
+def create_random_population(tick, seed=0, high=100):
+    rng = np.random.default_rng(seed)
+    tick.pop_per_vertex[:] = rng.integers(0, high, tick.pop_per_vertex.shape)
+    tick.invalidate_tick_count_cache()
+    tick.update_active_vertices()
+
+
+class TestCompartmentTensor(unittest.TestCase):
+    def setUp(self):
+        self.tick = BaseTickFourPhases(graph=StandInGraph(30), stages_as_tupple=(1, 2, 3, 1))
+
+    def test_views_share_memory(self):
+        self.assertEqual(self.tick.pop_per_vertex.shape, (2, 2, 30, 7))
+        self.assertTrue(self.tick.pop_per_vertex.flags['C_CONTIGUOUS'])
+        for index, name in enumerate(['unfed', 'unfed_inf', 'fed', 'fed_inf']):
+            view = getattr(self.tick, 'pop_per_vertex_' + name)
+            self.assertTrue(np.shares_memory(view, self.tick.pop_per_vertex))
+            view[3, 4] = index + 1
+            self.assertEqual(self.tick.pop_per_vertex[index // 2, index % 2, 3, 4], index + 1)
+        self.assertIs(self.tick._get_compartment('fed', 'infected').base, self.tick.pop_per_vertex)
+        with self.assertRaises(ValueError):
+            self.tick._get_compartment('all', 'infected')
+
+    def test_count_tick_per_vertex(self):
+        create_random_population(self.tick)
+        pop = self.tick.pop_per_vertex
+        np.testing.assert_array_equal(self.tick.count_tick_per_vertex(), pop.sum(axis=(0, 1, 3)))
+        np.testing.assert_array_equal(self.tick.count_tick_per_vertex('nymph', 'fed', 'all'),
+                                      pop[1, :, :, 3:6].sum(axis=(0, 2)))
+        np.testing.assert_array_equal(self.tick.count_tick_per_vertex('adult', 'unfed', 'infected'), pop[0, 1, :, 6])
+        with self.assertRaises(ValueError):
+            self.tick.count_tick_per_vertex('pupa')
+
+
+class TestTickCountTensor(unittest.TestCase):
+    def setUp(self):
+        self.tick = assemble_tick_class(BaseTickFourPhases, ProportionBasedTickMortality)(
+            graph=StandInGraph(40), stages_as_tupple=(1, 2, 3, 1))
+        create_random_population(self.tick)
+
+    def test_matches_count_tick_per_vertex(self):
+        expected = {(stage, feeding_status, disease_status):
+                    self.tick.count_tick_per_vertex(stage, feeding_status, disease_status)
+                    for stage in [None, 'egg', 'larva', 'nymph', 'adult']
+                    for feeding_status in ['all', 'fed', 'unfed']
+                    for disease_status in ['all', 'infected', 'susceptible']}
+        tensor = self.tick.get_tick_count_tensor()
+        self.assertEqual(tensor.shape, (40, 4, 2, 2))
+        self.assertFalse(tensor.flags.writeable)
+        np.testing.assert_array_equal(tensor[:, 2, 1, 0], self.tick.pop_per_vertex_fed[:, 3:6].sum(axis=1))
+        # count_tick_per_vertex now reads the cached tensor
+        for (stage, feeding_status, disease_status), count in expected.items():
+            np.testing.assert_array_equal(self.tick.count_tick_per_vertex(stage, feeding_status, disease_status),
+                                          count)
+
+    def test_cache_invalidation(self):
+        tensor = self.tick.get_tick_count_tensor()
+        self.assertIs(self.tick.get_tick_count_tensor(), tensor)
+        self.tick.proportion_based_mortality_all_graph('unfed', 'susceptible', np.full(7, 0.5))
+        self.assertIsNone(self.tick.cached_tick_count_tensor)
+        np.testing.assert_array_equal(self.tick.get_tick_count_tensor().sum(axis=(1, 2, 3)),
+                                      self.tick.pop_per_vertex.sum(axis=(0, 1, 3)))
+
+        self.tick.pop_per_vertex[1] = 0
+        self.tick.invalidate_tick_count_cache()
+        self.assertEqual(self.tick.get_tick_count_tensor()[:, :, 1].sum(), 0)
+        self.assertEqual(self.tick.count_tick_per_vertex(feeding_status='fed').sum(), 0)
+
+
+class TestSaveLoadState(unittest.TestCase):
+    def setUp(self):
+        self.graph = StandInGraph(100)
+        self.host = StandInHost(100, 50, np.random.default_rng(1))
+        self.tick_class = assemble_tick_class(BaseTickFourPhases, FeedingSingleGraph)
+
+    def create_tick(self):
+        return self.tick_class(graph=self.graph, stages_as_tupple=(1, 2, 2, 1), nb_timesteps_feeding=2,
+                               dict_hosts={'host': [self.host, [1, 3]]})
+
+    def test_round_trip(self):
+        tick = self.create_tick()
+        create_random_population(tick)
+        column_name = tick.get_feeding_column_name(3, 1, infected=True)
+        self.host.df_attributes[column_name] = np.arange(50)
+        for compress in [False, True]:
+            with tempfile.TemporaryDirectory() as path:
+                tick.save_state(path, compress=compress)
+                loaded_tick = self.create_tick()
+                self.host.df_attributes[column_name] = 0
+                loaded_tick.load_state(path)
+                np.testing.assert_array_equal(loaded_tick.pop_per_vertex, tick.pop_per_vertex)
+                np.testing.assert_array_equal(self.host.df_attributes[column_name], np.arange(50))
+
+    def test_save_over_loaded_directory(self):
+        tick = self.create_tick()
+        create_random_population(tick)
+        with tempfile.TemporaryDirectory() as path:
+            tick.save_state(path)
+            loaded_tick = self.create_tick()
+            loaded_tick.load_state(path, mmap=True)
+            loaded_tick.pop_per_vertex_fed[:, 2] += 7
+            expected_pop = np.array(loaded_tick.pop_per_vertex)
+
+            loaded_tick.save_state(path)
+            np.testing.assert_array_equal(loaded_tick.pop_per_vertex, expected_pop)
+            reloaded_tick = self.create_tick()
+            reloaded_tick.load_state(path)
+            np.testing.assert_array_equal(reloaded_tick.pop_per_vertex, expected_pop)
+            self.assertFalse([name for name in os.listdir(path) if name.endswith('.tmp')])
+
+    def test_incompatible_state(self):
+        tick = self.create_tick()
+        with tempfile.TemporaryDirectory() as path:
+            tick.save_state(path)
+            other_tick = self.tick_class(graph=self.graph, stages_as_tupple=(1, 2, 2, 2), nb_timesteps_feeding=2,
+                                         dict_hosts={'host': [self.host, [1, 3]]})
+            with self.assertRaises(ValueError):
+                other_tick.load_state(path)
+
+
+class TestFeedingSingleGraph(unittest.TestCase):
+    def create_tick(self, **kwargs):
+        tick = assemble_tick_class(BaseTickFourPhases, FeedingSingleGraph)(
+            graph=StandInGraph(100), stages_as_tupple=(1, 1, 1, 1), nb_timesteps_feeding=3,
+            dict_hosts={'host': [StandInHost(100, 300, np.random.default_rng(2)), [1, 2]]}, **kwargs)
+        create_random_population(tick, high=1000)
+        return tick
+
+    def count_attached_ticks(self, tick, stage, infected=False):
+        host = tick.dict_hosts['host'][0]
+        return sum(host.df_attributes[tick.get_feeding_column_name(stage, timestep, infected=infected)].sum()
+                   for timestep in range(tick.nb_timesteps_feeding))
+
+    def test_ring_buffer(self):
+        tick = self.create_tick()
+        host = tick.dict_hosts['host'][0]
+        nb_unfed = tick.pop_per_vertex_unfed[:, 1].sum()
+        nb_fed = tick.pop_per_vertex_fed[:, 1].sum()
+        tick.attach_to_host_to_feed(0, [[1, ('host', 0.2)]])
+        column_attached = host.df_attributes[tick.get_feeding_column_name(1, 0)].copy()
+        self.assertEqual(column_attached.sum(), nb_unfed - tick.pop_per_vertex_unfed[:, 1].sum())
+        self.assertGreater(column_attached.sum(), 0)
+
+        for timestep in range(1, tick.nb_timesteps_feeding):
+            tick.increment_feeding_stage()
+            np.testing.assert_array_equal(host.df_attributes[tick.get_feeding_column_name(1, timestep)],
+                                          column_attached)
+            np.testing.assert_array_equal(tick.get_feeding_column('host', 'tick_stage_1_timestep_' + str(timestep)),
+                                          column_attached)
+            self.assertEqual(host.df_attributes[tick.get_feeding_column_name(1, 0)].sum(), 0)
+        self.assertEqual(tick.pop_per_vertex_fed[:, 1].sum(), nb_fed)
+
+        expected_fed = tick.pop_per_vertex_fed[:, 1] + np.bincount(host.df_attributes['position'],
+                                                                   weights=column_attached, minlength=100)
+        tick.increment_feeding_stage()
+        np.testing.assert_array_equal(tick.pop_per_vertex_fed[:, 1], expected_fed)
+        self.assertEqual(self.count_attached_ticks(tick, 1), 0)
+        with self.assertRaises(ValueError):
+            tick.get_feeding_column_name(1, 3)
+
+    def test_conservation_over_timesteps(self):
+        tick = self.create_tick()
+        parallel_tick = self.create_tick(parallel_threshold=0)
+        nb_ticks = tick.pop_per_vertex.sum()
+        for timestep in range(7):
+            for t in [tick, parallel_tick]:
+                t.increment_feeding_stage()
+                t.attach_to_host_to_feed(timestep, [[1, ('host', 0.1)], [2, ('host', 0.3)]])
+            np.testing.assert_array_equal(parallel_tick.pop_per_vertex, tick.pop_per_vertex)
+            self.assertEqual(tick.pop_per_vertex.sum() + sum(self.count_attached_ticks(tick, stage, infected)
+                                                             for stage in [1, 2] for infected in [False, True]),
+                             nb_ticks)
+
+    def test_release_marks_vertices_active(self):
+        tick = self.create_tick(active_vertex_threshold=0.5)
+        host = tick.dict_hosts['host'][0]
+        tick.pop_per_vertex[:] = 0
+        tick.update_active_vertices()
+        self.assertEqual(tick._get_active_vertices().shape[0], 0)
+        host.df_attributes[tick.get_feeding_column_name(2, 2, infected=True)] = np.where(np.arange(300) == 17, 4, 0)
+        tick.increment_feeding_stage()
+        np.testing.assert_array_equal(tick._get_active_vertices(), [host.df_attributes['position'][17]])
+
+    def test_attachment_distribution(self):
+        tick = self.create_tick()
+        host = tick.dict_hosts['host'][0]
+        host.df_attributes['position'] = np.repeat([0, 1, 2], [10, 30, 260])
+        tick.pop_per_vertex[:] = 0
+        tick.pop_per_vertex_unfed[:3, 1] = 100000
+        tick.pop_per_vertex_unfed_inf[:3, 1] = 1000
+        tick.attach_to_host_to_feed(3, [[1, ('host', 0.05)]])
+
+        # 10 agents on the vertex 0 catch half of the ticks, while the 30 agents of vertex 1 catch them all
+        column_attached = host.df_attributes[tick.get_feeding_column_name(1, 0)]
+        self.assertAlmostEqual(column_attached[:10].sum() / 100000, 0.5, delta=0.01)
+        np.testing.assert_allclose(column_attached[:10], 5000, rtol=0.05)
+        self.assertEqual(column_attached[10:40].sum(), 100000)
+        self.assertEqual(tick.pop_per_vertex_unfed[1, 1], 0)
+        self.assertEqual(tick.pop_per_vertex_unfed[0, 1] + column_attached[:10].sum(), 100000)
+        self.assertEqual(host.df_attributes[tick.get_feeding_column_name(1, 0, infected=True)][10:40].sum(), 1000)
+
+        other_tick = self.create_tick()
+        other_host = other_tick.dict_hosts['host'][0]
+        other_host.df_attributes['position'] = host.df_attributes['position']
+        other_tick.pop_per_vertex[:] = 0
+        other_tick.pop_per_vertex_unfed[:3, 1] = 100000
+        other_tick.pop_per_vertex_unfed_inf[:3, 1] = 1000
+        other_tick.attach_to_host_to_feed(3, [[1, ('host', 0.05)]])
+        np.testing.assert_array_equal(other_host.df_attributes[tick.get_feeding_column_name(1, 0)], column_attached)
+
+
+class TestActiveVertices(unittest.TestCase):
+    def create_tick(self, **kwargs):
+        tick = assemble_tick_class(BaseTickFourPhases, ProportionBasedTickMortality, ProportionBasedStageTransition,
+                                   ProportionBasedCombinedDynamics)(
+            graph=StandInGraph(400), stages_as_tupple=(1, 2, 2, 1), parallel_threshold=None, **kwargs)
+        tick.pop_per_vertex[:, :, 50:70] = np.random.default_rng(0).integers(0, 1000, (2, 2, 20, 6))
+        tick.update_active_vertices()
+        return tick
+
+    def run_timestep(self, tick):
+        tick.proportion_based_mortality_all_graph('unfed', 'susceptible', np.full(6, 0.1))
+        tick.vertex_specific_proportion_based_mortality('fed', 'infected', np.full((400, 6), 0.3))
+        tick.class_based_mortality('fed', 'susceptible', np.arange(400) % 2, np.full((2, 6), 0.2))
+        tick.proportion_based_transition_from_matrix('unfed', 'infected', np.diag([0.5] * 5, k=1))
+        tick.proportion_based_mortality_and_transitions(
+            dict_mortality={('unfed', 'infected'): np.full(6, 0.2)},
+            dict_transitions={('fed', 'susceptible'): np.diag([0.4] * 5, k=1)})
+
+    def test_active_path_matches_dense_path(self):
+        tick = self.create_tick()
+        active_tick = self.create_tick(active_vertex_threshold=0.1)
+        parallel_tick = self.create_tick(active_vertex_threshold=0.1)
+        parallel_tick.set_parallel_execution(parallel_threshold=0)
+        np.testing.assert_array_equal(active_tick._get_active_vertices(), np.arange(50, 70))
+        for _ in range(3):
+            for t in [tick, active_tick, parallel_tick]:
+                self.run_timestep(t)
+            for t in [active_tick, parallel_tick]:
+                np.testing.assert_array_equal(t.pop_per_vertex, tick.pop_per_vertex)
+                np.testing.assert_array_equal(t.count_tick_per_vertex('nymph', 'fed'),
+                                              tick.count_tick_per_vertex('nymph', 'fed'))
+                np.testing.assert_array_equal(t.get_tick_count_tensor(), tick.get_tick_count_tensor())
+
+    def test_active_vertices_tracking(self):
+        tick = self.create_tick(active_vertex_threshold=0.1)
+        tick.pop_per_vertex[:, :, 60:] = 0
+        self.assertEqual(tick._get_active_vertices().shape[0], 20)
+        tick.update_active_vertices()
+        np.testing.assert_array_equal(tick._get_active_vertices(), np.arange(50, 60))
+
+        tick._mark_vertices_active(np.arange(100))
+        self.assertIsNone(tick._get_active_vertices())
+        tick.disable_active_vertex_tracking()
+        self.assertIsNone(tick._get_active_vertices())
+        with self.assertRaises(ValueError):
+            tick.enable_active_vertex_tracking(threshold=2.)
+
+
+class TestFeedingMultiGraph(unittest.TestCase):
+    def create_tick(self, mapping, nb_host_vertex, **kwargs):
+        host = StandInHost(nb_host_vertex, 200, np.random.default_rng(4))
+        tick = assemble_tick_class(BaseTickFourPhases, FeedingMultiGraph)(
+            graph=StandInGraph(100), stages_as_tupple=(1, 1, 1, 1), nb_timesteps_feeding=2,
+            dict_hosts={'host': [host, [1, 2]]}, dict_vertex_mappings={'host': mapping}, **kwargs)
+        create_random_population(tick, high=1000)
+        return tick
+
+    def count_attached_ticks(self, tick):
+        host = tick.dict_hosts['host'][0]
+        return sum(host.df_attributes[tick.get_feeding_column_name(stage, timestep, infected=infected)].sum()
+                   for stage in [1, 2] for timestep in range(2) for infected in [False, True])
+
+    def test_identity_mapping_matches_single_graph(self):
+        mapping = HostTickVertexMapping.from_host_vertex_of_tick_vertex(100, np.arange(100))
+        tick = self.create_tick(mapping, 100)
+        single_graph_tick = assemble_tick_class(BaseTickFourPhases, FeedingSingleGraph)(
+            graph=StandInGraph(100), stages_as_tupple=(1, 1, 1, 1), nb_timesteps_feeding=2,
+            dict_hosts={'host': [StandInHost(100, 200, np.random.default_rng(4)), [1, 2]]})
+        create_random_population(single_graph_tick, high=1000)
+        for timestep in range(4):
+            for t in [tick, single_graph_tick]:
+                t.increment_feeding_stage()
+                t.attach_to_host_to_feed(timestep, [[1, ('host', 0.1)], [2, ('host', 0.4)]])
+            np.testing.assert_array_equal(tick.pop_per_vertex, single_graph_tick.pop_per_vertex)
+
+    def test_coarse_host_graph(self):
+        # each host vertex is a block of 2 x 2 tick vertices
+        arr_index = np.arange(100)
+        mapping = HostTickVertexMapping.from_host_vertex_of_tick_vertex(25, (arr_index // 20) * 5 +
+                                                                        (arr_index % 10) // 2)
+        np.testing.assert_array_equal(np.diff(mapping.arr_host_offsets), 4)
+        tick = self.create_tick(mapping, 25)
+        parallel_tick = self.create_tick(mapping, 25, parallel_threshold=0)
+        nb_ticks = tick.pop_per_vertex.sum()
+        for timestep in range(5):
+            for t in [tick, parallel_tick]:
+                t.increment_feeding_stage()
+                t.attach_to_host_to_feed(timestep, [[1, ('host', 0.05)], [2, ('host', 0.2)]])
+            np.testing.assert_array_equal(parallel_tick.pop_per_vertex, tick.pop_per_vertex)
+            self.assertEqual(tick.pop_per_vertex.sum() + self.count_attached_ticks(tick), nb_ticks)
+
+        # ticks released on a host vertex are evenly spread over its tick vertices
+        host = tick.dict_hosts['host'][0]
+        for column_name in host.df_attributes:
+            if column_name.startswith('tick_stage'):
+                host.df_attributes[column_name] = 0
+        host.df_attributes['position'] = np.full(200, 6)
+        host.df_attributes[tick.get_feeding_column_name(2, 1)] = np.where(np.arange(200) == 0, 10, 0)
+        tick.pop_per_vertex[:] = 0
+        tick.increment_feeding_stage()
+        self.assertEqual(sorted(tick.pop_per_vertex_fed[[22, 23, 32, 33], 2]), [2, 2, 3, 3])
+        self.assertEqual(tick.pop_per_vertex.sum(), 10)
+
+    def test_mapping_checks(self):
+        with self.assertRaises(ValueError):
+            HostTickVertexMapping(3, 4, [0, 1], [0, 1])
+        with self.assertRaises(ValueError):
+            HostTickVertexMapping(2, 4, [0, 1], [0, 4])
+        mapping = HostTickVertexMapping(2, 4, [0, 0, 1], [0, 1, 1], arr_weights=[1., 3., 1.])
+        np.testing.assert_allclose(mapping.arr_host_weights, [0.25, 0.75, 1.])
+        np.testing.assert_array_equal(mapping.get_tick_vertices(np.array([1])), [False, True, False, False])
+        with self.assertRaises(ValueError):
+            self.create_tick(mapping, 2)
+
+
+class TestFeedingVertexCohorts(unittest.TestCase):
+    def create_tick(self, host=None, **kwargs):
+        host = StandInHost(100, 300, np.random.default_rng(5)) if host is None else host
+        tick = assemble_tick_class(BaseTickFourPhases, FeedingVertexCohorts)(
+            graph=StandInGraph(100), stages_as_tupple=(1, 1, 1, 1), nb_timesteps_feeding=3,
+            dict_hosts={'host': [host, [1, 2]]}, **kwargs)
+        create_random_population(tick, high=1000)
+        return tick
+
+    def count_ticks(self, tick):
+        return tick.pop_per_vertex.sum() + tick.dict_feeding_cohorts['host'].sum()
+
+    def test_conservation_with_moving_hosts(self):
+        tick = self.create_tick()
+        parallel_tick = self.create_tick(parallel_threshold=0)
+        host = tick.dict_hosts['host'][0]
+        rng = np.random.default_rng(6)
+        nb_ticks = self.count_ticks(tick)
+        for timestep in range(6):
+            arr_moving = rng.random(300) < 0.2
+            for t in [tick, parallel_tick]:
+                array_pos = t.dict_hosts['host'][0].df_attributes['position']
+                array_pos[arr_moving] = (array_pos[arr_moving] + 1) % 100
+                t.increment_feeding_stage()
+                t.attach_to_host_to_feed(timestep, [[1, ('host', 0.1)], [2, ('host', 0.3)]])
+            np.testing.assert_array_equal(parallel_tick.pop_per_vertex, tick.pop_per_vertex)
+            np.testing.assert_array_equal(parallel_tick.dict_feeding_cohorts['host'],
+                                          tick.dict_feeding_cohorts['host'])
+            self.assertEqual(self.count_ticks(tick), nb_ticks)
+            # ticks only feed on the vertices where there are hosts
+            arr_host_count = np.bincount(host.df_attributes['position'], minlength=100)
+            self.assertEqual(tick.dict_feeding_cohorts['host'][:, arr_host_count == 0].sum(), 0)
+
+    def test_cohorts_follow_hosts(self):
+        host = StandInHost(100, 4, np.random.default_rng(0))
+        host.df_attributes['position'] = np.array([10, 10, 10, 20])
+        tick = self.create_tick(host=host)
+        tick.move_feeding_cohorts()
+        cohort = tick.get_feeding_cohort('host', 2, 1, infected=True)
+        cohort[[10, 20]] = [9, 5]
+
+        # a third of the agents of the vertex 10 leave with a third of its ticks
+        host.df_attributes['position'] = np.array([10, 11, 10, 21])
+        tick.move_feeding_cohorts()
+        np.testing.assert_array_equal(cohort[[10, 11, 20, 21]], [6, 3, 0, 5])
+
+        # ticks of the agents that died are lost
+        host.df_attributes['position'] = np.array([10, 11, 21])
+        tick.move_feeding_cohorts()
+        np.testing.assert_array_equal(cohort[[10, 11, 21]], [3, 3, 5])
+
+    def test_save_load(self):
+        tick = self.create_tick()
+        for timestep in range(2):
+            tick.increment_feeding_stage()
+            tick.attach_to_host_to_feed(timestep, [[1, ('host', 0.1)], [2, ('host', 0.3)]])
+        list_keys = [(stage, timestep, infected) for stage in [1, 2] for timestep in range(3)
+                     for infected in [False, True]]
+        list_cohorts = [tick.get_feeding_cohort('host', *key).copy() for key in list_keys]
+        with tempfile.TemporaryDirectory() as path:
+            tick.save_state(path)
+            loaded_tick = self.create_tick()
+            loaded_tick.load_state(path)
+        np.testing.assert_array_equal(loaded_tick.pop_per_vertex, tick.pop_per_vertex)
+        np.testing.assert_array_equal(tick.dict_cohort_host_counts['host'], loaded_tick.dict_cohort_host_counts['host'])
+        for key, cohort in zip(list_keys, list_cohorts):
+            np.testing.assert_array_equal(loaded_tick.get_feeding_cohort('host', *key), cohort)
+
+        for t in [tick, loaded_tick]:
+            t.increment_feeding_stage()
+        np.testing.assert_array_equal(loaded_tick.pop_per_vertex, tick.pop_per_vertex)
+
+
+class TestTransitionPlans(unittest.TestCase):
+    def setUp(self):
+        self.tick = assemble_tick_class(BaseTickFourPhases, ProportionBasedStageTransition)(
+            graph=StandInGraph(50), stages_as_tupple=(1, 2, 2, 1))
+        create_random_population(self.tick, high=1000)
+
+    def test_plan_moves_each_tick_once(self):
+        matrix_transitions = np.diag([0.5] * 5, k=1)
+        self.tick.pop_per_vertex_unfed[:] = 0
+        self.tick.pop_per_vertex_unfed[:, 0] = 100
+        self.tick.proportion_based_transition_from_plan('unfed', 'susceptible', TransitionPlan(matrix_transitions))
+        np.testing.assert_array_equal(self.tick.pop_per_vertex_unfed[0], [50, 50, 0, 0, 0, 0])
+
+    def test_loop_rejected(self):
+        matrix_transitions = np.full((6, 6), 0.)
+        matrix_transitions[1, 2] = matrix_transitions[2, 3] = matrix_transitions[3, 1] = 0.1
+        with self.assertRaises(ValueError):
+            TransitionPlan(matrix_transitions)
+
+    def test_dict_matches_matrix(self):
+        # stages inside a phase are counted from the first stage of the phase
+        dict_transitions = {('larva', 1, 'nymph', 0): 0.3, ('larva', 0, 'larva', 1): 0.2,
+                            ('nymph', 1, 'adult', 0): 0.7}
+        matrix_transitions = np.full((6, 6), 0.)
+        matrix_transitions[2, 3] = 0.3
+        matrix_transitions[1, 2] = 0.2
+        matrix_transitions[4, 5] = 0.7
+        expected_pop = self.tick.pop_per_vertex_fed.copy()
+        for end_stage, start_stage in [(5, 4), (3, 2), (2, 1)]:
+            pop_moved = np.floor(expected_pop[:, start_stage] * matrix_transitions[start_stage, end_stage])
+            expected_pop[:, start_stage] -= pop_moved.astype(np.int64)
+            expected_pop[:, end_stage] += pop_moved.astype(np.int64)
+
+        other_tick = assemble_tick_class(BaseTickFourPhases, ProportionBasedStageTransition)(
+            graph=StandInGraph(50), stages_as_tupple=(1, 2, 2, 1))
+        other_tick.pop_per_vertex[:] = self.tick.pop_per_vertex
+        self.tick.proportion_based_transitions('fed', 'susceptible', dict_transitions)
+        other_tick.proportion_based_transition_from_matrix('fed', 'susceptible', matrix_transitions)
+        np.testing.assert_array_equal(self.tick.pop_per_vertex_fed, expected_pop)
+        np.testing.assert_array_equal(other_tick.pop_per_vertex, self.tick.pop_per_vertex)
+
+    def test_cache_keyed_on_transition_structure(self):
+        other_tick = assemble_tick_class(BaseTickFourPhases, ProportionBasedStageTransition)(
+            graph=StandInGraph(50), stages_as_tupple=(1, 2, 2, 1))
+        other_tick.pop_per_vertex[:] = self.tick.pop_per_vertex
+        for proportion in [0.1, 0.5, 0.9]:
+            dict_transitions = {('egg', 0, 'larva', 0): proportion, ('larva', 0, 'larva', 1): 1. - proportion}
+            self.tick.proportion_based_transitions('unfed', 'infected', dict_transitions)
+            other_tick.proportion_based_transition_from_plan('unfed', 'infected',
+                                                             other_tick.compile_transition_plan(dict_transitions))
+        self.assertEqual(len(self.tick.dict_cached_transition_plans), 1)
+        np.testing.assert_array_equal(other_tick.pop_per_vertex, self.tick.pop_per_vertex)
+
+        # a transition with a null proportion is not part of the structure of the plan
+        self.tick.proportion_based_transitions('unfed', 'infected', {('egg', 0, 'larva', 0): 0.5,
+                                                                     ('larva', 0, 'larva', 1): 0.})
+        self.assertEqual(len(self.tick.dict_cached_transition_plans), 2)
+
+    def test_cache_is_bounded(self):
+        list_dict_transitions = [{('larva', 0, 'larva', 1): 0.1, ('nymph', 0, 'nymph', 1): 0.1},
+                                 {('larva', 0, 'larva', 1): 0.1}, {('nymph', 0, 'nymph', 1): 0.1}]
+        with mock.patch('tick.stage_transition.MAX_CACHED_TRANSITION_PLANS', 2):
+            for dict_transitions in list_dict_transitions + list_dict_transitions[1:2]:
+                self.tick.proportion_based_transitions('fed', 'infected', dict_transitions)
+        # the first plan is the least recently used one, so it is the one evicted
+        self.assertEqual(list(self.tick.dict_cached_transition_plans),
+                         [frozenset(list_dict_transitions[2]), frozenset(list_dict_transitions[1])])
+        self.tick.clear_transition_plan_cache()
+        self.assertEqual(len(self.tick.dict_cached_transition_plans), 0)
+
+
+class TestCombinedDynamics(unittest.TestCase):
+    def setUp(self):
+        self.tick_class = assemble_tick_class(BaseTickFourPhases, ProportionBasedTickMortality,
+                                              ProportionBasedStageTransition, ProportionBasedCombinedDynamics)
+        self.graph = StandInGraph(60)
+
+    def test_matches_separate_steps(self):
+        tick = self.tick_class(graph=self.graph, stages_as_tupple=(1, 2, 2, 1))
+        other_tick = self.tick_class(graph=self.graph, stages_as_tupple=(1, 2, 2, 1))
+        create_random_population(tick, high=1000)
+        other_tick.pop_per_vertex[:] = tick.pop_per_vertex
+        nb_ticks_infected = tick.pop_per_vertex[:, 1].sum()
+
+        matrix_transitions = np.diag([0.3, 0.4, 0.5, 0.6, 0.7], k=1)
+        plan = TransitionPlan(np.diag([0.1, 0., 0.9, 0., 0.2], k=1))
+        dict_mortality = {('unfed', 'susceptible'): np.linspace(0., 0.5, 6), ('fed', 'susceptible'): np.full(6, 0.2)}
+        dict_transitions = {('unfed', 'susceptible'): matrix_transitions, ('fed', 'infected'): plan,
+                            ('unfed', 'infected'): matrix_transitions}
+        geographic_condition = np.arange(60) % 3 != 0
+
+        tick.proportion_based_mortality_and_transitions(dict_mortality=dict_mortality,
+                                                        dict_transitions=dict_transitions,
+                                                        geographic_condition=geographic_condition)
+        for (feeding_status, disease_status), array_proportion in dict_mortality.items():
+            other_tick.proportion_based_mortality_all_graph(feeding_status, disease_status, array_proportion,
+                                                            geographic_condition=geographic_condition)
+        other_tick.proportion_based_transition_from_matrix('unfed', 'susceptible', matrix_transitions)
+        other_tick.proportion_based_transition_from_plan('fed', 'infected', plan)
+        other_tick.proportion_based_transition_from_matrix('unfed', 'infected', matrix_transitions)
+
+        np.testing.assert_array_equal(tick.pop_per_vertex, other_tick.pop_per_vertex)
+        self.assertEqual(tick.pop_per_vertex[:, 1].sum(), nb_ticks_infected)
+
+    def test_empty_dictionaries(self):
+        tick = self.tick_class(graph=self.graph, stages_as_tupple=(1, 1, 1, 1))
+        create_random_population(tick)
+        expected_pop = tick.pop_per_vertex.copy()
+        tick.proportion_based_mortality_and_transitions()
+        np.testing.assert_array_equal(tick.pop_per_vertex, expected_pop)
+
+
+class TestParallelKernels(unittest.TestCase):
+    def create_tick(self, parallel_threshold):
+        tick = assemble_tick_class(BaseTickFourPhases, ProportionBasedTickMortality, ProportionBasedStageTransition,
+                                   ProportionBasedCombinedDynamics)(
+            graph=StandInGraph(200), stages_as_tupple=(1, 2, 2, 1), parallel_threshold=parallel_threshold)
+        create_random_population(tick, high=1000)
+        return tick
+
+    def test_parallel_matches_serial(self):
+        serial_tick = self.create_tick(None)
+        parallel_tick = self.create_tick(0)
+        parallel_tick.set_parallel_execution(nb_threads=nb.config.NUMBA_NUM_THREADS, parallel_threshold=0)
+        array_vertex_class = np.arange(200) % 3
+        table_proportion = np.linspace(0., 0.9, 18).reshape((3, 6))
+        for tick in [serial_tick, parallel_tick]:
+            tick.proportion_based_mortality_all_graph('unfed', 'susceptible', np.full(6, 0.1))
+            tick.vertex_specific_proportion_based_mortality('fed', 'infected', np.full((200, 6), 0.3))
+            tick.class_based_mortality('fed', 'susceptible', array_vertex_class, table_proportion)
+            tick.proportion_based_transition_from_matrix('unfed', 'infected', np.diag([0.5] * 5, k=1))
+            tick.proportion_based_mortality_and_transitions(
+                dict_mortality={('unfed', 'infected'): np.full(6, 0.2)},
+                dict_transitions={('fed', 'susceptible'): np.diag([0.4] * 5, k=1)})
+        np.testing.assert_array_equal(parallel_tick.pop_per_vertex, serial_tick.pop_per_vertex)
+        np.testing.assert_array_equal(parallel_tick.count_tick_per_vertex('larva'),
+                                      serial_tick.count_tick_per_vertex('larva'))
+        np.testing.assert_array_equal(parallel_tick.get_tick_count_tensor(), serial_tick.get_tick_count_tensor())
+
+    def test_parallel_execution_settings(self):
+        tick = self.create_tick(None)
+        self.assertFalse(tick._use_parallel_kernels(10 ** 9))
+        tick.set_parallel_execution(parallel_threshold=100)
+        self.assertFalse(tick._use_parallel_kernels(99))
+        self.assertTrue(tick._use_parallel_kernels(100))
+        with self.assertRaises(ValueError):
+            tick.set_parallel_execution(nb_threads=0)
+        with self.assertRaises(ValueError):
+            tick.set_parallel_execution(parallel_threshold=-1)
+
+    def test_thread_count_restored(self):
+        tick = self.create_tick(0)
+        tick.set_parallel_execution(nb_threads=1, parallel_threshold=0)
+        list_nb_threads = []
+        with mock.patch.object(nb, 'get_num_threads', return_value=3), \
+                mock.patch.object(nb, 'set_num_threads', side_effect=list_nb_threads.append):
+            self.assertTrue(tick._use_parallel_kernels(10))
+            self.assertEqual(list_nb_threads, [])
+            self.assertEqual(tick._run_parallel_kernel(lambda x: 2 * x, 4), 8)
+            with self.assertRaises(ZeroDivisionError):
+                tick._run_parallel_kernel(lambda x: 1 / x, 0)
+        self.assertEqual(list_nb_threads, [1, 3, 1, 3])
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_small_sweep(self):
+        sweep = {'nb_vertex': [400], 'stages_as_tupple': [(1, 2, 2, 1)], 'host_density': [1.],
+                 'nb_timesteps_feeding': [2]}
+        results = run_suite(sweep, 1, verbose=False)
+        self.assertEqual(results['uncovered_kernels'], [])
+        self.assertEqual([result['benchmark'] for result in results['results'] if 'error' in result], [])
+        self.assertTrue(any(result['benchmark'].startswith('method.') for result in results['results']))
+
+
+class TestCompilation(unittest.TestCase):
+    def test_signatures_cover_kernels(self):
+        # those kernels are only called by other kernels, and are compiled along with them
+        set_inner_kernels = {'feeding_split_ticks_between_hosts', 'feeding_split_ticks_between_agents'}
+        set_kernels = {name for name, obj in vars(jit_compiled_functions).items()
+                       if isinstance(obj, nb.core.registry.CPUDispatcher) and not name.endswith('_parallel')}
+        self.assertEqual(set(get_kernel_signatures(np.uint32)), set_kernels - set_inner_kernels)
+
+    def test_warmup_matches_method_calls(self):
+        dict_times = warmup(parallel=False)
+        self.assertIn('engine_run_seasonal_dynamics', dict_times)
+        self.assertNotIn('engine_run_seasonal_dynamics_parallel', dict_times)
+
+        # once warmed up, the methods of the building blocks should not trigger any new compilation
+        dict_kernels = {name: obj for name, obj in vars(jit_compiled_functions).items()
+                        if isinstance(obj, nb.core.registry.CPUDispatcher)}
+        dict_nb_signatures = {name: len(kernel.signatures) for name, kernel in dict_kernels.items()}
+        scenario = Scenario(400, (1, 2, 2, 1), 1., 2)
+        for _, setup, run in method_cases():
+            run(setup(scenario))
+        self.assertEqual({name: len(kernel.signatures) for name, kernel in dict_kernels.items()}, dict_nb_signatures)
+
+
+class TestMortality(unittest.TestCase):
+    def create_tick(self, tick_count_dtype=np.int64):
+        tick = assemble_tick_class(BaseTickFourPhases, ProportionBasedTickMortality, ProportionBasedStageTransition)(
+            graph=StandInGraph(50), stages_as_tupple=(1, 2, 2, 1), tick_count_dtype=tick_count_dtype)
+        create_random_population(tick, high=1000)
+        return tick
+
+    def test_class_based_matches_vertex_specific(self):
+        tick = self.create_tick()
+        other_tick = self.create_tick()
+        array_vertex_class = (np.arange(50) % 4).astype(np.uint8)
+        table_proportion = np.linspace(0., 1., 24).reshape((4, 6))
+        tick.class_based_mortality('unfed', 'infected', array_vertex_class, table_proportion)
+        other_tick.vertex_specific_proportion_based_mortality('unfed', 'infected', table_proportion[array_vertex_class])
+        np.testing.assert_array_equal(tick.pop_per_vertex, other_tick.pop_per_vertex)
+        self.assertEqual(tick.pop_per_vertex_unfed_inf[3::4, 5].sum(), 0)
+
+        with self.assertRaises(ValueError):
+            tick._sampy_debug_class_based_mortality('unfed', 'infected', array_vertex_class, table_proportion[:3])
+
+    def test_narrow_dtypes(self):
+        tick = self.create_tick()
+        for tick_count_dtype in [np.int32, np.uint32]:
+            other_tick = self.create_tick(tick_count_dtype=tick_count_dtype)
+            self.assertEqual(other_tick.pop_per_vertex.dtype, tick_count_dtype)
+            other_tick.vertex_specific_proportion_based_mortality('fed', 'susceptible', np.full((50, 6), 0.3))
+            other_tick.proportion_based_transition_from_matrix('fed', 'susceptible', np.diag([0.5] * 5, k=1))
+            np.testing.assert_array_equal(other_tick.count_tick_per_vertex(), tick.count_tick_per_vertex() -
+                                          (tick.pop_per_vertex_fed * 0.3).astype(np.int64).sum(axis=1))
+        with self.assertRaises(ValueError):
+            self.create_tick(tick_count_dtype=np.int16)
+
+    def test_overflow_check(self):
+        tick = self.create_tick(tick_count_dtype=np.uint32)
+        tick._check_tick_count_overflow(np.array([0, 2 ** 32 - 1]))
+        for array_count in [np.array([2 ** 32]), np.array([-1])]:
+            with self.assertRaises(OverflowError):
+                tick._check_tick_count_overflow(array_count)
+
+        # transitions can gather all the ticks of a vertex in a single stage
+        tick = self.create_tick(tick_count_dtype=np.int32)
+        tick.pop_per_vertex_unfed[7] = 2 ** 30
+        matrix_transitions = np.diag([1.] * 5, k=1)
+        tick._sampy_debug_proportion_based_transition_from_matrix('fed', 'susceptible', matrix_transitions)
+        with self.assertRaises(OverflowError):
+            tick._sampy_debug_proportion_based_transition_from_matrix('unfed', 'susceptible', matrix_transitions)
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tick = assemble_tick_class(BaseTickFourPhases, ProportionBasedStageTransition,
+                                        ProportionBasedTickMortality, TickInstrumentation)(
+            graph=StandInGraph(50), stages_as_tupple=(1, 1, 1, 1))
+        create_random_population(self.tick, high=1000)
+
+    def run_timestep(self):
+        self.tick.proportion_based_mortality_all_graph('unfed', 'susceptible', np.full(4, 0.5))
+        self.tick.proportion_based_transitions('fed', 'infected', {('larva', 0, 'nymph', 0): 0.5})
+        self.tick.count_tick_per_vertex()
+        return self.tick.end_profiling_timestep()
+
+    def test_tick_flows(self):
+        nb_ticks = int(self.tick.pop_per_vertex.sum())
+        nb_moved = int(np.floor(self.tick.pop_per_vertex_fed_inf[:, 1] * 0.5).sum())
+        self.tick.enable_profiling(track_tick_flows=True)
+        records = self.run_timestep()
+        self.tick.disable_profiling()
+
+        self.assertEqual(records['proportion_based_mortality_all_graph']['ticks_killed'],
+                         nb_ticks - int(self.tick.pop_per_vertex.sum()))
+        self.assertEqual(records['proportion_based_transitions']['ticks_moved'], nb_moved)
+        self.assertEqual(records['count_tick_per_vertex']['nb_calls'], 1)
+        self.assertEqual(records['count_tick_per_vertex']['vertices_touched'], 50)
+        self.assertNotIn('proportion_based_transitions', self.tick.__dict__)
+
+    def test_tick_flows_not_tracked_by_default(self):
+        self.tick.enable_profiling()
+        records = self.run_timestep()
+        self.tick.disable_profiling()
+        self.assertEqual(records['proportion_based_mortality_all_graph']['nb_calls'], 1)
+        self.assertEqual(records['proportion_based_mortality_all_graph']['ticks_killed'], 0)
+        self.assertEqual(records['proportion_based_transitions']['ticks_moved'], 0)
+
+    def test_kernel_profiling(self):
+        self.tick.enable_profiling(profile_kernels=True)
+        self.run_timestep()
+        self.tick.disable_profiling()
+        list_names = [row['name'] for row in self.tick.get_profiling_summary()]
+        self.assertIn('kernel.mortality_proportion_based_mortality_all_graph', list_names)
+        self.assertIn('kernel.stage_transition_apply_transition_plan', list_names)
+
+
+class TestDispersal(unittest.TestCase):
+    def create_tick(self, **kwargs):
+        tick = assemble_tick_class(BaseTickFourPhases, ProportionBasedDispersal)(
+            graph=StandInGraph(100), stages_as_tupple=(1, 1, 1, 1), parallel_threshold=None, **kwargs)
+        tick.pop_per_vertex_unfed[:10] = np.random.default_rng(0).integers(0, 1000, (10, 4))
+        tick.update_active_vertices()
+        return tick
+
+    def test_conservation_and_split(self):
+        tick = self.create_tick()
+        tick.pop_per_vertex_unfed[:] = 0
+        tick.pop_per_vertex_unfed[55, 1] = 10
+        tick.proportion_based_dispersal('unfed', 'susceptible', np.array([0., 0.5, 0., 0.]))
+        self.assertEqual(tick.pop_per_vertex_unfed[55, 1], 5)
+        self.assertEqual(sorted(tick.pop_per_vertex_unfed[[45, 65, 54, 56], 1]), [1, 1, 1, 2])
+        self.assertEqual(tick.pop_per_vertex_unfed[:, 1].sum(), 10)
+
+    def test_active_vertices_match_full_graph(self):
+        tick = self.create_tick()
+        active_tick = self.create_tick(active_vertex_threshold=0.5)
+        parallel_tick = self.create_tick(active_vertex_threshold=0.5)
+        parallel_tick.set_parallel_execution(parallel_threshold=0)
+        nb_ticks = tick.pop_per_vertex.sum()
+        for _ in range(12):
+            for t in [tick, active_tick, parallel_tick]:
+                t.proportion_based_dispersal('unfed', 'susceptible', np.array([0., 0.3, 0.2, 0.1]))
+            np.testing.assert_array_equal(active_tick.pop_per_vertex, tick.pop_per_vertex)
+            np.testing.assert_array_equal(parallel_tick.pop_per_vertex, tick.pop_per_vertex)
+        # the graph is now mostly active, so that both paths have been used with the same buffer
+        self.assertIsNone(active_tick._get_active_vertices())
+        self.assertEqual(tick.pop_per_vertex.sum(), nb_ticks)
+        self.assertTrue(active_tick.vertex_is_active[tick.count_tick_per_vertex() > 0].all())
+
+        # going back to the active vertices after a call on the full graph
+        for t in [tick, active_tick]:
+            t.pop_per_vertex[:, :, 20:] = 0
+            t.update_active_vertices()
+        self.assertIsNotNone(active_tick._get_active_vertices())
+        for _ in range(3):
+            for t in [tick, active_tick]:
+                t.proportion_based_dispersal('unfed', 'susceptible', np.array([0., 0.3, 0.2, 0.1]))
+            np.testing.assert_array_equal(active_tick.pop_per_vertex, tick.pop_per_vertex)
+
+
+class TestHostVertexIndex(unittest.TestCase):
+    def assert_index_consistent(self, host_index, array_pos):
+        rebuilt_index = HostVertexIndex(host_index.nb_vertex)
+        rebuilt_index.rebuild(array_pos)
+        np.testing.assert_array_equal(host_index.arr_offsets, rebuilt_index.arr_offsets)
+        for i in range(host_index.nb_vertex):
+            agents = host_index.arr_agent_ids[host_index.arr_offsets[i]:host_index.arr_offsets[i + 1]]
+            self.assertTrue((array_pos[agents] == i).all())
+        np.testing.assert_array_equal(host_index.arr_agent_ids[host_index.arr_slot], np.arange(array_pos.shape[0]))
+
+    def test_update_matches_rebuild(self):
+        rng = np.random.default_rng(0)
+        graph = StandInGraph(400)
+        array_pos = rng.integers(0, 400, 1000)
+        host_index = HostVertexIndex(400)
+        host_index.update(array_pos)
+        for fraction_moved in [0.001, 0.01, 0.02, 0.5]:
+            arr_moving = rng.random(1000) < fraction_moved
+            arr_neighbours = graph.connections[array_pos[arr_moving], rng.integers(0, 4, arr_moving.sum())]
+            array_pos = array_pos.copy()
+            array_pos[arr_moving] = np.where(arr_neighbours >= 0, arr_neighbours, array_pos[arr_moving])
+            host_index.update(array_pos)
+            self.assert_index_consistent(host_index, array_pos)
+            np.testing.assert_array_equal(host_index.arr_positions, array_pos)
+
+        array_pos = rng.integers(0, 400, 1200)
+        host_index.update(array_pos)
+        self.assert_index_consistent(host_index, array_pos)
+
+    def test_incremental_update(self):
+        array_pos = np.arange(100) % 10
+        host_index = HostVertexIndex(10)
+        host_index.update(array_pos)
+        arr_agent_ids = host_index.arr_agent_ids
+        array_pos = array_pos.copy()
+        array_pos[[3, 42]] = [4, 1]
+        host_index.update(array_pos)
+        # the arrays of the index are updated in place instead of being rebuilt
+        self.assertIs(host_index.arr_agent_ids, arr_agent_ids)
+        self.assert_index_consistent(host_index, array_pos)
+
+
+class TestTransmission(unittest.TestCase):
+    def setUp(self):
+        self.host = StandInHost(25, 40, np.random.default_rng(0))
+        self.host.df_attributes['infected'] = np.arange(40) < 10
+        self.tick = assemble_tick_class(BaseTickFourPhases, FeedingSingleGraph, HostTickTransmission)(
+            graph=StandInGraph(25), stages_as_tupple=(1, 1, 1, 1), nb_timesteps_feeding=2,
+            dict_hosts={'host': [self.host, [1, 2]]})
+        for stage in [1, 2]:
+            for timestep in range(2):
+                self.host.df_attributes[self.tick.get_feeding_column_name(stage, timestep)] = 5
+
+    def get_feeding_ticks(self, infected):
+        return sum(self.host.df_attributes[self.tick.get_feeding_column_name(stage, timestep, infected=infected)]
+                   for stage in [1, 2] for timestep in range(2))
+
+    def test_host_to_tick(self):
+        dict_nb_infected = self.tick.transmission_between_hosts_and_ticks(0, [('host', 1., 0., 0.)])
+        np.testing.assert_array_equal(self.get_feeding_ticks(True), np.where(np.arange(40) < 10, 20, 0))
+        np.testing.assert_array_equal(self.get_feeding_ticks(False) + self.get_feeding_ticks(True), 20)
+        self.assertEqual(dict_nb_infected['host'], (0, 200))
+
+    def test_tick_to_host(self):
+        self.host.df_attributes['infected'] = np.full(40, False)
+        self.host.df_attributes[self.tick.get_feeding_column_name(2, 1, infected=True)] = np.arange(40) % 2
+        dict_nb_infected = self.tick.transmission_between_hosts_and_ticks(0, [('host', 0., 1., 0.)])
+        np.testing.assert_array_equal(self.host.df_attributes['infected'], np.arange(40) % 2 == 1)
+        self.assertEqual(dict_nb_infected['host'], (20, 0))
+
+    def test_checks(self):
+        with self.assertRaises(ValueError):
+            self.tick._sampy_debug_transmission_between_hosts_and_ticks(0, [('host', 1., 0., 0.)],
+                                                                        infected_attribute='not_a_column')
+        self.host.df_attributes['infected'] = np.arange(40) % 2
+        with self.assertRaises(ValueError):
+            self.tick._sampy_debug_transmission_between_hosts_and_ticks(0, [('host', 1., 0., 0.)])
+
+        tick_cohorts = assemble_tick_class(BaseTickFourPhases, FeedingVertexCohorts, HostTickTransmission)(
+            graph=StandInGraph(25), stages_as_tupple=(1, 1, 1, 1), nb_timesteps_feeding=2,
+            dict_hosts={'host': [self.host, [1, 2]]})
+        with self.assertRaises(ValueError):
+            tick_cohorts.transmission_between_hosts_and_ticks(0, [('host', 1., 0., 0.)])
+
+
+class TestSeasonalDynamicsEngine(unittest.TestCase):
+    def setUp(self):
+        self.tick_class = assemble_tick_class(BaseTickFourPhases, ProportionBasedCombinedDynamics,
+                                              SeasonalDynamicsEngine)
+        self.dict_mortality = {'winter': {('unfed', 'susceptible'): np.full(4, 0.2),
+                                          ('fed', 'infected'): np.array([0., 0.1, 0.2, 0.3])},
+                               'summer': {('unfed', 'susceptible'): np.full(4, 0.05)}}
+        self.dict_transitions = {'summer': {('unfed', 'susceptible'): np.diag([0.3, 0.2, 0.1], k=1),
+                                            ('fed', 'infected'): np.diag([0.5, 0.5, 0.5], k=1)}}
+        self.list_season_of_day = ['winter'] * 3 + ['summer'] * 4
+        self.schedule = SeasonalSchedule(4, self.list_season_of_day, dict_mortality=self.dict_mortality,
+                                         dict_transitions=self.dict_transitions)
+
+    def create_tick(self, **kwargs):
+        tick = self.tick_class(graph=StandInGraph(30), stages_as_tupple=(1, 1, 1, 1), **kwargs)
+        tick.pop_per_vertex[:, :, :tick.pop_per_vertex.shape[2] // 2] = \
+            np.random.default_rng(0).integers(0, 1000, (2, 2, tick.pop_per_vertex.shape[2] // 2, 4))
+        tick.update_active_vertices()
+        return tick
+
+    def assert_engine_matches_single_steps(self, **kwargs):
+        tick = self.create_tick(**kwargs)
+        engine_tick = self.create_tick(**kwargs)
+        geographic_condition = np.arange(30) % 2 == 0
+        for day in range(17):
+            season = self.list_season_of_day[day % 7]
+            tick.proportion_based_mortality_and_transitions(dict_mortality=self.dict_mortality.get(season),
+                                                            dict_transitions=self.dict_transitions.get(season),
+                                                            geographic_condition=geographic_condition)
+        engine_tick.run_seasonal_dynamics(5, self.schedule, geographic_condition=geographic_condition)
+        engine_tick.run_seasonal_dynamics(12, self.schedule, geographic_condition=geographic_condition)
+        self.assertEqual(engine_tick.engine_day, 17)
+        np.testing.assert_array_equal(engine_tick.pop_per_vertex, tick.pop_per_vertex)
+
+    def test_engine_matches_single_steps(self):
+        self.assert_engine_matches_single_steps()
+        self.assert_engine_matches_single_steps(nb_replicates=2)
+        self.assert_engine_matches_single_steps(active_vertex_threshold=0.8)
+        self.assert_engine_matches_single_steps(parallel_threshold=0)
+        self.assert_engine_matches_single_steps(parallel_threshold=0, active_vertex_threshold=0.8)
+
+    def test_run_with_sync_points(self):
+        engine_tick = self.create_tick()
+        reference_tick = self.create_tick()
+        list_calls = []
+
+        def callback(tick, engine_day):
+            list_calls.append(engine_day)
+            reference_tick.run_seasonal_dynamics(engine_day - reference_tick.engine_day, self.schedule)
+            np.testing.assert_array_equal(tick.pop_per_vertex, reference_tick.pop_per_vertex)
+
+        engine_tick.run(14, self.schedule, sync_points=4, callback=callback)
+        self.assertEqual(list_calls, [4, 8, 12])
+        self.assertEqual(engine_tick.engine_day, 14)
+
+    def create_feeding_tick(self, **kwargs):
+        tick = assemble_tick_class(BaseTickFourPhases, ProportionBasedCombinedDynamics, FeedingSingleGraph,
+                                   SeasonalDynamicsEngine)(
+            graph=StandInGraph(30), stages_as_tupple=(1, 1, 1, 1), nb_timesteps_feeding=3,
+            dict_hosts={'host': [StandInHost(30, 60, np.random.default_rng(1)), [1, 2]],
+                        'other_host': [StandInHost(30, 20, np.random.default_rng(2)), [3]]}, **kwargs)
+        rng = np.random.default_rng(0)
+        tick.pop_per_vertex[:, :, :15] = rng.integers(0, 1000, (2, 2, 15, 4))
+        tick.update_active_vertices()
+        for host, list_stages in tick.dict_hosts.values():
+            for stage in list_stages:
+                for timestep in range(3):
+                    for infected in [False, True]:
+                        host.df_attributes[tick.get_feeding_column_name(stage, timestep, infected=infected)] = \
+                            rng.integers(0, 5, host.df_attributes.nb_rows)
+        return tick
+
+    def test_run_increments_feeding(self):
+        def callback(tick, engine_day):
+            # the hosts only move, and new ticks only attach, at the synchronisation points
+            for host, _ in tick.dict_hosts.values():
+                host.df_attributes['position'] = (host.df_attributes['position'] + 7) % 30
+            tick.attach_to_host_to_feed(engine_day, [[1, ('host', 0.01)], [3, ('other_host', 0.02)]])
+
+        for kwargs in [{}, {'active_vertex_threshold': 0.8}, {'parallel_threshold': 0}]:
+            tick = self.create_feeding_tick(**kwargs)
+            engine_tick = self.create_feeding_tick(**kwargs)
+            # chunks shorter and longer than the feeding duration
+            for nb_steps in [2, 5, 4]:
+                for _ in range(nb_steps):
+                    tick.run_seasonal_dynamics(1, self.schedule)
+                    tick.increment_feeding_stage()
+                callback(tick, tick.engine_day)
+            engine_tick.run(11, self.schedule, sync_points=[2, 7, 11], callback=callback, increment_feeding=True)
+
+            np.testing.assert_array_equal(engine_tick.pop_per_vertex, tick.pop_per_vertex)
+            self.assertEqual(engine_tick.feeding_ring_head, tick.feeding_ring_head)
+            for host_key, (host, _) in tick.dict_hosts.items():
+                engine_host = engine_tick.dict_hosts[host_key][0]
+                for column_name in host.df_attributes:
+                    np.testing.assert_array_equal(engine_host.df_attributes[column_name],
+                                                  host.df_attributes[column_name])
+
+    def test_sync_chunks(self):
+        self.assertEqual(get_sync_chunks(10), [(10, True)])
+        self.assertEqual(get_sync_chunks(10, 4), [(4, True), (4, True), (2, False)])
+        self.assertEqual(get_sync_chunks(10, [3, 10, 12]), [(3, True), (7, True)])
+        self.assertEqual(get_sync_chunks(0), [])
+
+
+class TestTickCountRecorder(unittest.TestCase):
+    def test_recorded_counts(self):
+        tick = BaseTickFourPhases(graph=StandInGraph(20), stages_as_tupple=(1, 2, 2, 1))
+        list_aggregates = [(None, 'all', 'all'), ('nymph', 'fed', 'infected')]
+        vertex_groups = np.arange(20) // 5
+        list_expected = []
+        with tempfile.TemporaryDirectory() as path:
+            with TickCountRecorder(tick, path, list_aggregates, chunk_size=3, nb_buffers=2,
+                                   timestep_interval=2) as recorder, \
+                    TickCountRecorder(tick, os.path.join(path, 'grouped'), list_aggregates,
+                                      vertex_groups=vertex_groups) as grouped_recorder:
+                for timestep in range(11):
+                    create_random_population(tick, seed=timestep)
+                    if timestep % 2 == 0:
+                        list_expected.append([tick.count_tick_per_vertex(stage, feeding_status, disease_status)
+                                              for stage, feeding_status, disease_status in list_aggregates])
+                    recorder.record()
+                    grouped_recorder.record(timestep=10 * timestep)
+                    if timestep == 4:
+                        recorder.flush()
+
+            arr_timesteps, dict_counts = load_tick_counts(path)
+            np.testing.assert_array_equal(arr_timesteps, [0, 2, 4, 6, 8, 10])
+            for index_aggregate, aggregate in enumerate(list_aggregates):
+                np.testing.assert_array_equal(dict_counts[aggregate],
+                                              [expected[index_aggregate] for expected in list_expected])
+
+            arr_timesteps, dict_counts = load_tick_counts(os.path.join(path, 'grouped'))
+            np.testing.assert_array_equal(arr_timesteps, 10 * np.arange(11))
+            np.testing.assert_array_equal(dict_counts[list_aggregates[0]][-1],
+                                          np.bincount(vertex_groups, weights=tick.count_tick_per_vertex()))
+            del dict_counts
+
+
+class TestDomainDecomposition(unittest.TestCase):
+    def setUp(self):
+        self.list_compartments = [(feeding_status, disease_status) for feeding_status in ['fed', 'unfed']
+                                  for disease_status in ['infected', 'susceptible']]
+        self.schedule = SeasonalSchedule(6, ['winter'] * 3 + ['summer'] * 4,
+                                         dict_mortality={'winter': {key: np.full(6, 0.05)
+                                                                    for key in self.list_compartments}},
+                                         dict_transitions={'summer': {key: np.diag([0.2] * 5, k=1)
+                                                                      for key in self.list_compartments}})
+
+    def create_tick(self, **kwargs):
+        host = StandInHost(400, 1000, np.random.default_rng(7))
+        tick = assemble_tick_class(BaseTickFourPhases, ProportionBasedCombinedDynamics, FeedingSingleGraph,
+                                   ProportionBasedDispersal, SeasonalDynamicsEngine)(
+            graph=StandInGraph(400), stages_as_tupple=(1, 2, 2, 1), nb_timesteps_feeding=2,
+            dict_hosts={'host': [host, [1, 3]]}, **kwargs)
+        create_random_population(tick, high=1000)
+        return tick
+
+    def run_timesteps(self, tick, runner, with_attachment=True):
+        host = tick.dict_hosts['host'][0]
+        for timestep in range(3):
+            runner.proportion_based_mortality_and_transitions(
+                dict_mortality={key: np.full(6, 0.01) for key in self.list_compartments},
+                dict_transitions={('unfed', 'susceptible'): np.diag([0.1] * 5, k=1)},
+                geographic_condition=np.arange(400) % 3 > 0)
+            runner.run(5, self.schedule, sync_points=2, callback=lambda t, engine_day: None)
+            runner.proportion_based_dispersal('unfed', 'susceptible', np.full(6, 0.1))
+            if with_attachment:
+                runner.attach_to_host_to_feed(timestep, [[1, ('host', 0.001)], [3, ('host', 0.002)]])
+            else:
+                for column_name in host.df_attributes:
+                    if column_name.startswith('tick_stage'):
+                        host.df_attributes[column_name] = timestep + 1
+            array_pos = host.df_attributes['position'].copy()
+            array_pos[::7] = (array_pos[::7] + 1) % 400
+            host.df_attributes['position'] = array_pos
+            runner.increment_feeding_stage()
+
+    def get_feeding_columns(self, tick):
+        host = tick.dict_hosts['host'][0]
+        return np.column_stack([host.df_attributes[tick.get_feeding_column_name(stage, timestep, infected)]
+                                for stage in [1, 3] for timestep in range(2) for infected in [False, True]])
+
+    def test_independent_of_nb_workers(self):
+        list_results = []
+        for nb_workers in [1, 2]:
+            tick = self.create_tick()
+            with DomainDecomposition(tick, 4, nb_workers=nb_workers) as domain_decomposition:
+                self.run_timesteps(tick, domain_decomposition)
+            self.assertIsNone(tick.pop_per_vertex.base)
+            list_results.append((tick.pop_per_vertex, self.get_feeding_columns(tick)))
+        np.testing.assert_array_equal(list_results[0][0], list_results[1][0])
+        np.testing.assert_array_equal(list_results[0][1], list_results[1][1])
+
+    def test_matches_single_process(self):
+        tick = self.create_tick()
+        decomposed_tick = self.create_tick(active_vertex_threshold=0.5)
+        self.run_timesteps(tick, tick, with_attachment=False)
+        with DomainDecomposition(decomposed_tick, 3, nb_workers=2) as domain_decomposition:
+            self.run_timesteps(decomposed_tick, domain_decomposition, with_attachment=False)
+            np.testing.assert_array_equal(decomposed_tick.count_tick_per_vertex(), tick.count_tick_per_vertex())
+        self.assertTrue(domain_decomposition.is_closed)
+        np.testing.assert_array_equal(decomposed_tick.pop_per_vertex, tick.pop_per_vertex)
+        self.assertEqual(decomposed_tick.engine_day, tick.engine_day)
+        with self.assertRaises(ValueError):
+            domain_decomposition.proportion_based_dispersal('unfed', 'susceptible', np.full(6, 0.1))
+        # no shared memory block is allocated once closed
+        self.assertEqual(domain_decomposition.dict_blocks, {})
+
+    def test_workers_release_stale_blocks(self):
+        tick = self.create_tick()
+        host = tick.dict_hosts['host'][0]
+        with DomainDecomposition(tick, 2, nb_workers=1) as domain_decomposition:
+            for nb_agents in [1000, 1500, 2500]:
+                # new agents are born, so that the feeding buffers of the main process have to grow
+                df_attributes = StandInDataFrame(nb_agents)
+                for column_name, column in host.df_attributes.items():
+                    df_attributes[column_name] = np.concatenate([column, np.full(nb_agents - column.shape[0],
+                                                                                 column[-1])])
+                host.df_attributes = df_attributes
+                domain_decomposition.increment_feeding_stage()
+                dict_worker_blocks = domain_decomposition.executor.submit(_get_worker_block_names).result()
+                self.assertEqual(dict_worker_blocks, {name: block[1][0] for name, block
+                                                      in domain_decomposition.dict_blocks.items()})
+
+    def test_run_increments_feeding(self):
+        def callback(tick, engine_day):
+            tick.attach_to_host_to_feed(engine_day, [[1, ('host', 0.001)], [3, ('host', 0.002)]])
+
+        tick = self.create_tick()
+        decomposed_tick = self.create_tick()
+        tick.run(7, self.schedule, sync_points=3, callback=callback, increment_feeding=True)
+        with DomainDecomposition(decomposed_tick, 3, nb_workers=2) as domain_decomposition:
+            domain_decomposition.run(7, self.schedule, sync_points=3, callback=callback, increment_feeding=True)
+        np.testing.assert_array_equal(decomposed_tick.pop_per_vertex, tick.pop_per_vertex)
+        np.testing.assert_array_equal(self.get_feeding_columns(decomposed_tick), self.get_feeding_columns(tick))
+        self.assertEqual(decomposed_tick.feeding_ring_head, tick.feeding_ring_head)
+
+    def test_partition_vertices(self):
+        np.testing.assert_array_equal(partition_vertices(10, 3), [0, 3, 7, 10])
+        np.testing.assert_array_equal(partition_vertices(10, 2, arr_weights=np.repeat([1., 0.], 5)), [0, 3, 10])
+        with self.assertRaises(ValueError):
+            partition_vertices(10, 0)
+
+
+class TestReplicates(unittest.TestCase):
+    def setUp(self):
+        self.graph = StandInGraph(64)
+        self.tick_class = assemble_tick_class(BaseTickFourPhases, ProportionBasedTickMortality,
+                                              ProportionBasedCombinedDynamics, ProportionBasedDispersal)
+        self.replicated_tick = self.tick_class(graph=self.graph, stages_as_tupple=(1, 1, 1, 1), nb_replicates=3)
+        create_random_population(self.replicated_tick)
+        self.list_ticks = []
+        for r in range(3):
+            tick = self.tick_class(graph=self.graph, stages_as_tupple=(1, 1, 1, 1))
+            tick.pop_per_vertex[:] = self.replicated_tick.pop_per_vertex[:, :, r * 64:(r + 1) * 64]
+            self.list_ticks.append(tick)
+
+    def assert_replicates_equal_single_runs(self):
+        self.assertEqual(self.replicated_tick.pop_per_vertex_unfed.shape, (3, 64, 4))
+        for r, tick in enumerate(self.list_ticks):
+            np.testing.assert_array_equal(self.replicated_tick.pop_per_vertex[:, :, r * 64:(r + 1) * 64],
+                                          tick.pop_per_vertex)
+            np.testing.assert_array_equal(self.replicated_tick.count_tick_per_vertex()[r],
+                                          tick.count_tick_per_vertex())
+
+    def test_combined_dynamics_and_dispersal(self):
+        dict_mortality = {('unfed', 'susceptible'): np.array([0.1, 0.2, 0.3, 0.4])}
+        dict_transitions = {('fed', 'infected'): np.diag([0.5, 0.5, 0.5], k=1)}
+        geographic_condition = np.arange(64) % 3 == 0
+        for tick in [self.replicated_tick] + self.list_ticks:
+            tick.proportion_based_mortality_and_transitions(dict_mortality=dict_mortality,
+                                                            dict_transitions=dict_transitions,
+                                                            geographic_condition=geographic_condition)
+            tick.proportion_based_dispersal('unfed', 'infected', np.full(4, 0.3))
+        self.assert_replicates_equal_single_runs()
+
+    def test_mortality_per_replicate(self):
+        geographic_condition = np.random.default_rng(2).random(3 * 64) < 0.5
+        array_proportion = np.random.default_rng(3).random((3 * 64, 4))
+        self.replicated_tick.proportion_based_mortality_all_graph('fed', 'susceptible', np.full(4, 0.5),
+                                                                  geographic_condition=geographic_condition)
+        self.replicated_tick.vertex_specific_proportion_based_mortality('unfed', 'infected', array_proportion)
+        for r, tick in enumerate(self.list_ticks):
+            tick.proportion_based_mortality_all_graph('fed', 'susceptible', np.full(4, 0.5),
+                                                      geographic_condition=geographic_condition[r * 64:(r + 1) * 64])
+            tick.vertex_specific_proportion_based_mortality('unfed', 'infected',
+                                                            array_proportion[r * 64:(r + 1) * 64])
+        self.assert_replicates_equal_single_runs()
+
+    def create_feeding_tick(self, **kwargs):
+        tick = assemble_tick_class(BaseTickFourPhases, ProportionBasedCombinedDynamics, FeedingSingleGraph,
+                                   SeasonalDynamicsEngine)(
+            graph=self.graph, stages_as_tupple=(1, 1, 1, 1), nb_replicates=3, nb_timesteps_feeding=2,
+            dict_hosts={'host': [StandInHost(64, 200, np.random.default_rng(1)), [1, 3]]}, **kwargs)
+        # the same initial population in every replicate
+        tick.pop_per_vertex[:] = np.tile(self.replicated_tick.pop_per_vertex[:, :, :64], (1, 1, 3, 1))
+        tick.update_active_vertices()
+        return tick
+
+    def run_feeding(self, tick, nb_steps, seed):
+        for step in range(nb_steps):
+            tick.attach_to_host_to_feed(seed + step, [[1, ('host', 0.05)], [3, ('host', 0.1)]])
+            tick.increment_feeding_stage()
+
+    def get_feeding_columns(self, tick):
+        host = tick.dict_hosts['host'][0]
+        return np.array([[host.df_attributes[tick.get_feeding_column_name(stage, timestep, infected=infected,
+                                                                           replicate=r)]
+                          for stage in [1, 3] for timestep in range(2) for infected in [False, True]]
+                         for r in range(3)])
+
+    def test_feeding_replicates_diverge_and_are_reproducible(self):
+        tick = self.create_feeding_tick()
+        same_seed_tick = self.create_feeding_tick()
+        parallel_tick = self.create_feeding_tick(parallel_threshold=0)
+        nb_initial_ticks = tick.count_tick_per_vertex().sum(axis=1)
+        for t in [tick, same_seed_tick, parallel_tick]:
+            self.run_feeding(t, 5, 10)
+
+        for t in [same_seed_tick, parallel_tick]:
+            np.testing.assert_array_equal(t.pop_per_vertex, tick.pop_per_vertex)
+            np.testing.assert_array_equal(self.get_feeding_columns(t), self.get_feeding_columns(tick))
+        # each replicate draws from its own stream
+        arr_columns = self.get_feeding_columns(tick)
+        arr_pop = tick.pop_per_vertex.reshape(2, 2, 3, 64, 4)
+        for r in range(1, 3):
+            self.assertFalse(np.array_equal(arr_columns[r], arr_columns[0]))
+            self.assertFalse(np.array_equal(arr_pop[:, :, r], arr_pop[:, :, 0]))
+        # no tick is created or lost while feeding
+        np.testing.assert_array_equal(tick.count_tick_per_vertex().sum(axis=1) + arr_columns.sum(axis=(1, 2)),
+                                      nb_initial_ticks)
+
+        other_seed_tick = self.create_feeding_tick()
+        self.run_feeding(other_seed_tick, 5, 11)
+        self.assertFalse(np.array_equal(self.get_feeding_columns(other_seed_tick), arr_columns))
+
+    def test_engine_increments_feeding_of_replicates(self):
+        schedule = SeasonalSchedule(4, ['summer'] * 3,
+                                    dict_mortality={'summer': {('unfed', 'susceptible'): np.full(4, 0.1)}},
+                                    dict_transitions={'summer': {('fed', 'susceptible'): np.diag([0.5] * 3, k=1)}})
+
+        def callback(tick, engine_day):
+            tick.attach_to_host_to_feed(engine_day, [[1, ('host', 0.05)], [3, ('host', 0.1)]])
+
+        tick = self.create_feeding_tick()
+        engine_tick = self.create_feeding_tick()
+        for _ in range(3):
+            for _ in range(2):
+                tick.run_seasonal_dynamics(1, schedule)
+                tick.increment_feeding_stage()
+            callback(tick, tick.engine_day)
+        engine_tick.run(6, schedule, sync_points=2, callback=callback, increment_feeding=True)
+        np.testing.assert_array_equal(engine_tick.pop_per_vertex, tick.pop_per_vertex)
+        np.testing.assert_array_equal(self.get_feeding_columns(engine_tick), self.get_feeding_columns(tick))
+
+    def test_save_and_load_feeding_state_of_replicates(self):
+        tick = self.create_feeding_tick()
+        self.run_feeding(tick, 3, 0)
+        loaded_tick = self.create_feeding_tick()
+        with tempfile.TemporaryDirectory() as path:
+            tick.save_feeding_state(path)
+            loaded_tick.load_feeding_state(path)
+        np.testing.assert_array_equal(self.get_feeding_columns(loaded_tick), self.get_feeding_columns(tick))
+
+    def test_feeding_refusing_replicates(self):
+        host = StandInHost(64, 10, np.random.default_rng(0))
+        kwargs = {'graph': self.graph, 'stages_as_tupple': (1, 1, 1, 1), 'nb_replicates': 2,
+                  'nb_timesteps_feeding': 2, 'dict_hosts': {'host': [host, [1]]}}
+        with self.assertRaises(ValueError):
+            assemble_tick_class(BaseTickFourPhases, FeedingVertexCohorts)(**kwargs)
+        with self.assertRaises(ValueError):
+            assemble_tick_class(BaseTickFourPhases, FeedingMultiGraph)(dict_vertex_mappings={}, **kwargs)
+        tick = assemble_tick_class(BaseTickFourPhases, FeedingSingleGraph, HostTickTransmission)(**kwargs)
+        with self.assertRaises(ValueError):
+            tick.transmission_between_hosts_and_ticks(0, [('host', 1., 0., 0.)])
+
+if __name__ == '__main__':
+    unittest.main()
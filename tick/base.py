@@ -1,5 +1,73 @@
+import json
+import os
+import tempfile
+import numba as nb
 import numpy as np
-from jit_compiled_functions import base_count_tick_per_vertex_with_stages
+from .jit_compiled_functions import (base_count_tick_per_vertex_with_stages,
+                                     base_count_tick_per_vertex_with_stages_parallel,
+                                     base_count_tick_per_vertex_with_stages_on_vertices,
+                                     base_count_tick_per_vertex_with_stages_on_vertices_parallel,
+                                     base_find_active_vertices,
+                                     base_find_active_vertices_parallel,
+                                     base_aggregate_tick_counts,
+                                     base_aggregate_tick_counts_parallel,
+                                     base_aggregate_tick_counts_on_vertices,
+                                     base_aggregate_tick_counts_on_vertices_parallel)
+
+
+# position of each feeding / disease status on the two first axis of the compartment tensor 'pop_per_vertex'
+FEEDING_STATUS_INDEX = {'unfed': 0, 'fed': 1}
+DISEASE_STATUS_INDEX = {'susceptible': 0, 'infected': 1}
+
+# slices used to select several compartments at once when counting ticks
+FEEDING_STATUS_SLICE = {'all': slice(0, 2), 'unfed': slice(0, 1), 'fed': slice(1, 2)}
+DISEASE_STATUS_SLICE = {'all': slice(0, 2), 'susceptible': slice(0, 1), 'infected': slice(1, 2)}
+
+# position of each phase on the axis 1 of the tensor returned by the method get_tick_count_tensor
+PHASE_INDEX = {'egg': 0, 'larva': 1, 'nymph': 2, 'adult': 3}
+
+AUTHORIZED_TICK_COUNT_DTYPES = (np.int64, np.int32, np.uint32)
+
+# number of vertices from which multi-threaded kernels are used by default. Below that, the cost of starting the
+# threads is usually higher than what is gained.
+DEFAULT_PARALLEL_THRESHOLD = 100000
+
+
+def write_file_atomically(file_path, write_function, mode='wb'):
+    """
+    Write a file through a temporary file created in the same directory, which then replaces file_path. Thus, an
+    interrupted write never leaves a truncated file behind, and arrays memory-mapped from the previous version of the
+    file stay valid.
+
+    :param file_path: string, path of the file to write.
+    :param write_function: callable taking an open file object as only argument, and writing the content in it.
+    :param mode: optional, string, default 'wb'. Mode in which the temporary file is opened.
+    """
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)),
+                                                  prefix='.' + os.path.basename(file_path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, mode) as file:
+            write_function(file)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def is_memory_mapped(array):
+    """
+    Check whether an array is a view on a memory-mapped file.
+
+    :param array: numpy array.
+
+    :return: bool, True if array or one of the arrays it is a view of is a numpy memmap.
+    """
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = getattr(array, 'base', None)
+    return False
 
 
 class BaseTickFourPhases:
@@ -24,17 +92,52 @@ class BaseTickFourPhases:
                               pop_per_vertex_fed[i, j] is the number of fed ticks at stage j occupying the vertex of
                               index i.
         - pop_per_vertex_fed_inf: same but for infected ticks.
+        - pop_per_vertex: 4D integer array of shape (2, 2, nb_vertex, sum(stages_as_tuples)) in which all the tick
+                          population is stored. The first axis is the feeding status (0 for unfed, 1 for fed) and the
+                          second axis is the disease status (0 for susceptible, 1 for infected). The four
+                          pop_per_vertex_* arrays described above are views on this array, and therefore should
+                          always be modified in place (i.e. 'self.pop_per_vertex_fed[:] = x' and not
+                          'self.pop_per_vertex_fed = x').
+        - tick_count_dtype: numpy integer dtype used to store the number of ticks.
+        - nb_replicates: integer, number of independent replicates of the tick population simulated at once. When it is
+                         bigger than 1, the axis of pop_per_vertex corresponding to vertices has length
+                         nb_replicates * nb_vertex (the population of the replicate r on the vertex i being stored at
+                         index r * nb_vertex + i), and the four pop_per_vertex_* arrays are views of shape
+                         (nb_replicates, nb_vertex, sum(stages_as_tuples)).
+        - cached_tick_count_tensor: None, or 4D array of int of shape (nb_replicates * nb_vertex, 4, 2, 2) computed
+                                    by the method get_tick_count_tensor. It is reset to None by every method that
+                                    modifies the tick population.
 
     mandatory kwargs:
         - graph: a single graph object on which ticks live.
-        - hosts: placeholder, left at None for the moment todo: decide good input for the hosts
         - stages_as_tuple: tuple of integer of length 4, such that
                                 - stages_as_tuple[0] is the number of stages in the egg phase of a tick life
                                 - stages_as_tuple[1] is the number of stages in the larva phase of a tick life
                                 - stages_as_tuple[2] is the number of stages in the nymph phase of a tick life
                                 - stages_as_tuple[3] is the number of stages in the adult phase of a tick life
+
+    optional kwargs:
+        - tick_count_dtype: numpy integer dtype, default np.int64. Dtype used to store the number of ticks. Should be
+                            one of np.int64, np.int32 or np.uint32. Using a 32 bits dtype halves the memory footprint
+                            of the population, but the user is then responsible for making sure that the number of
+                            ticks in a single cell stays below the max value of the dtype. When sampy debug mode is
+                            on, the methods that can increase those numbers check for overflows.
+        - nb_threads: integer, default None. Number of threads used by the multi-threaded kernels. If None, numba
+                      default is used (usually the number of cores).
+        - parallel_threshold: integer, default 100000. Multi-threaded kernels are only used on arrays with at least
+                              this number of vertices (or agents). Use 0 to always use them, and None to never use
+                              them.
+        - active_vertex_threshold: float between 0 and 1, default None. If not None, active vertex tracking is
+                                   enabled (see method enable_active_vertex_tracking) with this threshold.
+        - nb_replicates: integer, default 1. Number of replicates of the tick population. All the replicates share the
+                         same graph and are processed by the same kernel calls, which amortizes the cost of calling
+                         the kernels when running ensembles of simulations. Building blocks involving hosts (feeding
+                         and transmission) are not available with several replicates, since the host populations are
+                         not replicated (see EnsembleTick).
     """
-    def __init__(self, graph=None, stages_as_tupple=None):
+    def __init__(self, graph=None, stages_as_tupple=None, tick_count_dtype=np.int64, nb_threads=None,
+                 parallel_threshold=DEFAULT_PARALLEL_THRESHOLD, active_vertex_threshold=None, nb_replicates=1,
+                 **kwargs):
         if graph is None:
             raise ValueError("A graph object should be passed to the tick constructor, using the kwarg 'graph'.")
         self.graph = graph
@@ -54,12 +157,35 @@ class BaseTickFourPhases:
 
         self.stages_as_tupple = tuple(stages_as_tupple)
 
+        tick_count_dtype = np.dtype(tick_count_dtype)
+        if tick_count_dtype not in [np.dtype(dtype) for dtype in AUTHORIZED_TICK_COUNT_DTYPES]:
+            raise ValueError("The kwarg 'tick_count_dtype' should be one of np.int64, np.int32 or np.uint32.")
+        self.tick_count_dtype = tick_count_dtype
+
+        if nb_replicates < 1:
+            raise ValueError("The number of replicates should be a positive integer.")
+        self.nb_replicates = nb_replicates
+
         # ticks have massive population compared to the animals they feed on. Therefore, the population is agregated at
-        # the vertex level of the graph. This info is stored in 2D arrays of integers.
-        self.pop_per_vertex_unfed = np.full((self.graph.number_vertices, sum(stages_as_tupple)), 0, dtype=int)
-        self.pop_per_vertex_fed = np.full((self.graph.number_vertices, sum(stages_as_tupple)), 0, dtype=int)
-        self.pop_per_vertex_unfed_inf = np.full((self.graph.number_vertices, sum(stages_as_tupple)), 0, dtype=int)
-        self.pop_per_vertex_fed_inf = np.full((self.graph.number_vertices, sum(stages_as_tupple)), 0, dtype=int)
+        # the vertex level of the graph. This info is stored in a single contiguous 4D array of integers, and each
+        # (feeding status, disease status) compartment is a view on it. The replicates are stacked along the vertex
+        # axis, so that the kernels process all of them as if they were a single, bigger, graph.
+        self.pop_per_vertex = None
+        self.cached_tick_count_tensor = None
+        self._set_pop_per_vertex(np.full((2, 2, self.nb_replicates * self.graph.number_vertices,
+                                          sum(stages_as_tupple)), 0, dtype=self.tick_count_dtype))
+
+        self.nb_threads = None
+        self.parallel_threshold = None
+        self.set_parallel_execution(nb_threads=nb_threads, parallel_threshold=parallel_threshold)
+
+        # active vertex tracking, disabled by default. When enabled, vertex_is_active[i] is False only if the vertex
+        # of index i is known to contain no tick.
+        self.active_vertex_threshold = None
+        self.vertex_is_active = None
+        self.arr_active_vertices = None
+        if active_vertex_threshold is not None:
+            self.enable_active_vertex_tracking(threshold=active_vertex_threshold)
 
         # we save the indexes
         self.indexes_egg_stage = (0, self.stages_as_tupple[0] - 1)
@@ -69,6 +195,251 @@ class BaseTickFourPhases:
                                     self.indexes_larva_stage[1] + self.stages_as_tupple[2])
         self.indexes_adult_stage = (self.indexes_nymph_stage[1] + 1,
                                     self.indexes_nymph_stage[1] + self.stages_as_tupple[3])
+        self.arr_phase_of_stage = np.repeat(np.arange(4), self.stages_as_tupple)
+
+    def _set_pop_per_vertex(self, array_pop):
+        """
+        Use array_pop as the compartment tensor of the tick population, and create the four pop_per_vertex_* views
+        on it.
+
+        :param array_pop: 4D array of integers of shape (2, 2, nb_replicates * nb_vertex, sum(stages_as_tuples)).
+        """
+        self.pop_per_vertex = array_pop
+        self.invalidate_tick_count_cache()
+        if self.nb_replicates == 1:
+            self.pop_per_vertex_unfed = self.pop_per_vertex[0, 0]
+            self.pop_per_vertex_unfed_inf = self.pop_per_vertex[0, 1]
+            self.pop_per_vertex_fed = self.pop_per_vertex[1, 0]
+            self.pop_per_vertex_fed_inf = self.pop_per_vertex[1, 1]
+        else:
+            shape_replicates = (self.nb_replicates, self.graph.number_vertices, sum(self.stages_as_tupple))
+            self.pop_per_vertex_unfed = self.pop_per_vertex[0, 0].reshape(shape_replicates)
+            self.pop_per_vertex_unfed_inf = self.pop_per_vertex[0, 1].reshape(shape_replicates)
+            self.pop_per_vertex_fed = self.pop_per_vertex[1, 0].reshape(shape_replicates)
+            self.pop_per_vertex_fed_inf = self.pop_per_vertex[1, 1].reshape(shape_replicates)
+
+    def save_state(self, path, compress=False):
+        """
+        Save the tick population in the directory 'path' (created if needed), so that a simulation can be resumed
+        later using load_state. If the object also has a feeding building block, the ticks attached to the hosts are
+        saved as well.
+
+        Without compression, the population is written as a raw .npy file that load_state can memory-map. With
+        compression, the file is smaller (which is useful for archives) but it has to be fully read and decompressed
+        when loaded.
+
+        :param path: string, path of the directory.
+        :param compress: optional, boolean, default False. If True, the arrays are compressed.
+        """
+        os.makedirs(path, exist_ok=True)
+        # a population loaded with load_state may still be read from the files we are about to replace, so it is
+        # brought in memory first.
+        if is_memory_mapped(self.pop_per_vertex):
+            self._set_pop_per_vertex(np.array(self.pop_per_vertex))
+
+        if compress:
+            write_file_atomically(os.path.join(path, 'pop_per_vertex.npz'),
+                                  lambda file: np.savez_compressed(file, pop_per_vertex=self.pop_per_vertex))
+        else:
+            write_file_atomically(os.path.join(path, 'pop_per_vertex.npy'),
+                                  lambda file: np.save(file, self.pop_per_vertex))
+
+        has_feeding_state = hasattr(self, 'save_feeding_state')
+        if has_feeding_state:
+            self.save_feeding_state(path, compress=compress)
+
+        metadata = {'stages_as_tupple': list(self.stages_as_tupple),
+                    'nb_vertex': self.graph.number_vertices,
+                    'nb_replicates': self.nb_replicates,
+                    'tick_count_dtype': self.tick_count_dtype.str,
+                    'compress': compress,
+                    'has_feeding_state': has_feeding_state}
+        write_file_atomically(os.path.join(path, 'tick_state.json'), lambda file: json.dump(metadata, file),
+                              mode='w')
+
+    def load_state(self, path, mmap=True):
+        """
+        Restore a tick population saved with save_state. The saved population should have the same stages, number
+        of vertices, number of replicates and tick count dtype as this object.
+
+        When the state has been saved without compression and mmap is True, the population is memory-mapped in
+        copy-on-write mode: nothing is read before it is needed, and the simulation never modifies the saved files.
+        The population is brought in memory by the next call to save_state, so that it can safely be saved in the
+        same directory.
+
+        :param path: string, path of the directory.
+        :param mmap: optional, boolean, default True. If False, the population is fully loaded in memory.
+        """
+        with open(os.path.join(path, 'tick_state.json'), 'r') as file:
+            metadata = json.load(file)
+        if tuple(metadata['stages_as_tupple']) != self.stages_as_tupple or \
+                metadata['nb_vertex'] != self.graph.number_vertices or \
+                metadata['nb_replicates'] != self.nb_replicates or \
+                np.dtype(metadata['tick_count_dtype']) != self.tick_count_dtype:
+            raise ValueError("The saved tick population is not compatible with this object.")
+
+        if metadata['compress']:
+            with np.load(os.path.join(path, 'pop_per_vertex.npz')) as archive:
+                array_pop = archive['pop_per_vertex']
+        else:
+            array_pop = np.load(os.path.join(path, 'pop_per_vertex.npy'), mmap_mode='c' if mmap else None)
+        self._set_pop_per_vertex(np.asarray(array_pop))
+        self.update_active_vertices()
+
+        if metadata['has_feeding_state']:
+            self.load_feeding_state(path)
+
+    def set_parallel_execution(self, nb_threads=None, parallel_threshold=DEFAULT_PARALLEL_THRESHOLD):
+        """
+        Set how the multi-threaded kernels are used.
+
+        :param nb_threads: optional, integer, default None. Number of threads used by the multi-threaded kernels. If
+                           None, numba default is used.
+        :param parallel_threshold: optional, integer, default 100000. Multi-threaded kernels are only used on arrays
+                                   with at least this number of vertices (or agents). If None, they are never used.
+        """
+        if nb_threads is not None and not (1 <= nb_threads <= nb.config.NUMBA_NUM_THREADS):
+            raise ValueError("The number of threads should be between 1 and " + str(nb.config.NUMBA_NUM_THREADS) +
+                             " (value of numba.config.NUMBA_NUM_THREADS).")
+        if parallel_threshold is not None and parallel_threshold < 0:
+            raise ValueError("The parallel threshold should be a non-negative integer or None.")
+        self.nb_threads = nb_threads
+        self.parallel_threshold = parallel_threshold
+
+    def _use_parallel_kernels(self, nb_items):
+        """
+        Decide whether multi-threaded kernels should be used on arrays of size nb_items.
+
+        :param nb_items: integer, size of the loop that would be parallelized.
+
+        :return: bool, True if the multi-threaded kernels should be used.
+        """
+        return self.parallel_threshold is not None and nb_items >= self.parallel_threshold
+
+    def _run_parallel_kernel(self, kernel, *args):
+        """
+        Call a multi-threaded kernel using nb_threads threads. The number of threads numba uses for the calling thread
+        is restored afterward, so that other tick objects and other numba code are not affected.
+
+        :param kernel: multi-threaded numba kernel.
+        :param args: arguments of the kernel.
+
+        :return: the value returned by the kernel.
+        """
+        if self.nb_threads is None:
+            return kernel(*args)
+        previous_nb_threads = nb.get_num_threads()
+        nb.set_num_threads(self.nb_threads)
+        try:
+            return kernel(*args)
+        finally:
+            nb.set_num_threads(previous_nb_threads)
+
+    def enable_active_vertex_tracking(self, threshold=0.1):
+        """
+        Enable active vertex tracking. When enabled, the kernels of the tick population only iterate over the
+        vertices that may contain ticks, which is much faster when most of the graph is empty (for instance at the
+        beginning of an invasion). As soon as the proportion of active vertices is above the threshold, the kernels
+        go back to iterating over the whole graph.
+
+        The methods of the tick building blocks keep the set of active vertices up to date. However, if the user
+        directly writes ticks in the pop_per_vertex arrays, the method update_active_vertices should be called
+        afterward. Vertices emptied by mortality or feeding stay active until update_active_vertices is called.
+
+        :param threshold: optional, float between 0 and 1, default 0.1. Proportion of active vertices above which the
+                          kernels iterate over the whole graph.
+        """
+        if not (0. <= threshold <= 1.):
+            raise ValueError("The active vertex threshold should be between 0 and 1.")
+        self.active_vertex_threshold = threshold
+        self.update_active_vertices()
+
+    def disable_active_vertex_tracking(self):
+        """
+        Disable active vertex tracking, so that the kernels iterate over the whole graph.
+        """
+        self.active_vertex_threshold = None
+        self.vertex_is_active = None
+        self.arr_active_vertices = None
+
+    def update_active_vertices(self):
+        """
+        Recompute the set of active vertices from the tick population, removing the vertices that became empty.
+        Does nothing if active vertex tracking is disabled.
+        """
+        if self.active_vertex_threshold is None:
+            return
+        if self._use_parallel_kernels(self.pop_per_vertex.shape[2]):
+            self.vertex_is_active = self._run_parallel_kernel(base_find_active_vertices_parallel, self.pop_per_vertex)
+        else:
+            self.vertex_is_active = base_find_active_vertices(self.pop_per_vertex)
+        self.arr_active_vertices = None
+
+    def _mark_vertices_active(self, array_vertices):
+        """
+        Register vertices that may have received ticks. Does nothing if active vertex tracking is disabled.
+
+        :param array_vertices: 1D array of int (indexes of vertices) or of bool (one value per vertex).
+        """
+        if self.active_vertex_threshold is None:
+            return
+        self.vertex_is_active[array_vertices] = True
+        self.arr_active_vertices = None
+
+    def _get_active_vertices(self):
+        """
+        Return the indexes of the vertices the kernels should iterate on.
+
+        :return: None if the kernels should iterate over the whole graph, either because active vertex tracking is
+                 disabled or because the proportion of active vertices is above the threshold. Otherwise, a 1D array
+                 of int containing the sorted indexes of the active vertices.
+        """
+        if self.active_vertex_threshold is None:
+            return None
+        if self.arr_active_vertices is None:
+            self.arr_active_vertices = np.where(self.vertex_is_active)[0]
+        if self.arr_active_vertices.shape[0] > self.active_vertex_threshold * self.vertex_is_active.shape[0]:
+            return None
+        return self.arr_active_vertices
+
+    def _replicate_vertex_array(self, array_vertices):
+        """
+        Repeat an array with one value per vertex so that it has one value per row of pop_per_vertex, that is one
+        value per vertex and per replicate. An array that already has one value per row is returned as it is.
+
+        :param array_vertices: 1D array of length nb_vertex or nb_replicates * nb_vertex.
+
+        :return: 1D array of length nb_replicates * nb_vertex.
+        """
+        if self.nb_replicates == 1 or array_vertices.shape[0] == self.pop_per_vertex.shape[2]:
+            return array_vertices
+        return np.tile(array_vertices, self.nb_replicates)
+
+    def _get_compartment(self, feeding_status, disease_status):
+        """
+        Return the 2D view on 'pop_per_vertex' corresponding to the given feeding and disease status.
+
+        :param feeding_status: string, either 'fed' or 'unfed'.
+        :param disease_status: string, either 'infected' of 'susceptible'.
+
+        :return: 2D array of integers of shape (nb_replicates * nb_vertex, sum(stages_as_tuples))
+        """
+        if feeding_status not in FEEDING_STATUS_INDEX or disease_status not in DISEASE_STATUS_INDEX:
+            raise ValueError("Not valid choice of feeding status and disease status.")
+        return self.pop_per_vertex[FEEDING_STATUS_INDEX[feeding_status], DISEASE_STATUS_INDEX[disease_status]]
+
+    def _check_tick_count_overflow(self, array_count):
+        """
+        Raise an OverflowError if some of the values in array_count cannot be stored using the tick count dtype.
+
+        :param array_count: array of integers, whatever the shape.
+        """
+        if array_count.size == 0:
+            return
+        info = np.iinfo(self.tick_count_dtype)
+        if array_count.max() > info.max or array_count.min() < info.min:
+            raise OverflowError("Some tick counts cannot be represented using the dtype " + str(self.tick_count_dtype) +
+                                ". Consider using a wider 'tick_count_dtype'.")
 
     def count_tick_per_vertex(self, stage=None, feeding_status='all', disease_status='all'):
         """
@@ -82,54 +453,91 @@ class BaseTickFourPhases:
                                infected ticks are counted. If 'susceptible' only non-infected ones. Any other value 
                                raises an error.
 
-        :return: 1D array of integers. r_arr[i] is the number of tick in the vertex of index i.
+        :return: 1D array of integers. r_arr[i] is the number of tick in the vertex of index i. If there are several
+                 replicates, 2D array of integers such that r_arr[r, i] is the number of tick of the replicate r in
+                 the vertex of index i.
         """
-        if feeding_status == 'all':
-            if disease_status == 'all':
-                pop_per_vertex = self.pop_per_vertex_fed + self.pop_per_vertex_unfed + \
-                                 self.pop_per_vertex_fed_inf + self.pop_per_vertex_unfed_inf
-            if disease_status == 'infected':
-                pop_per_vertex = self.pop_per_vertex_fed_inf + self.pop_per_vertex_unfed_inf
-            if disease_status == 'susceptible':
-                pop_per_vertex = self.pop_per_vertex_fed + self.pop_per_vertex_unfed
-            else:
-                raise ValueError("Disease status can only be chosen among ['all', 'infected', 'susceptible'].")
-
-        elif feeding_status == 'fed':
-            if disease_status == 'all':
-                pop_per_vertex = self.pop_per_vertex_fed + self.pop_per_vertex_fed_inf
-            if disease_status == 'infected':
-                pop_per_vertex = self.pop_per_vertex_fed_inf
-            if disease_status == 'susceptible':
-                pop_per_vertex = self.pop_per_vertex_fed
-            else:
-                raise ValueError("Disease status can only be chosen among ['all', 'infected', 'susceptible'].")
-
-        elif feeding_status == 'unfed':
-            if disease_status == 'all':
-                pop_per_vertex = self.pop_per_vertex_unfed + self.pop_per_vertex_unfed_inf
-            if disease_status == 'infected':
-                pop_per_vertex = self.pop_per_vertex_unfed_inf
-            if disease_status == 'susceptible':
-                pop_per_vertex = self.pop_per_vertex_unfed
-            else:
-                raise ValueError("Disease status can only be chosen among ['all', 'infected', 'susceptible'].")
-            
-        else:
+        if feeding_status not in FEEDING_STATUS_SLICE:
             raise ValueError("Feeding status can only be chosen among ['all', 'fed', 'unfed'].")
+        if disease_status not in DISEASE_STATUS_SLICE:
+            raise ValueError("Disease status can only be chosen among ['all', 'infected', 'susceptible'].")
+
+        # this is a view, so that no temporary array is created.
+        pop_per_vertex = self.pop_per_vertex[FEEDING_STATUS_SLICE[feeding_status],
+                                             DISEASE_STATUS_SLICE[disease_status]]
 
         if stage is None:
-            return pop_per_vertex.sum(axis=1)
-        if stage == 'egg':
-            return base_count_tick_per_vertex_with_stages(pop_per_vertex,
-                                                          self.indexes_egg_stage[0], self.indexes_egg_stage[1])
-        if stage == 'larva':
-            return base_count_tick_per_vertex_with_stages(pop_per_vertex,
-                                                          self.indexes_larva_stage[0], self.indexes_larva_stage[1])
-        if stage == 'nymph':
-            return base_count_tick_per_vertex_with_stages(pop_per_vertex,
-                                                          self.indexes_nymph_stage[0], self.indexes_nymph_stage[1])
-        if stage == 'adult':
-            return base_count_tick_per_vertex_with_stages(pop_per_vertex,
-                                                          self.indexes_adult_stage[0], self.indexes_adult_stage[1])
-        raise ValueError("If used, the kwarg stage should be either 'egg', 'larva', 'nymph' or 'adult'.")
+            index_start, index_end = 0, pop_per_vertex.shape[3] - 1
+        elif stage in ['egg', 'larva', 'nymph', 'adult']:
+            index_start, index_end = getattr(self, 'indexes_' + stage + '_stage')
+        else:
+            raise ValueError("If used, the kwarg stage should be either 'egg', 'larva', 'nymph' or 'adult'.")
+
+        # when the aggregate tensor is already known, reading it is much cheaper than a new pass on the population
+        if self.cached_tick_count_tensor is not None:
+            phase_slice = slice(0, 4) if stage is None else slice(PHASE_INDEX[stage], PHASE_INDEX[stage] + 1)
+            rv = self.cached_tick_count_tensor[:, phase_slice, FEEDING_STATUS_SLICE[feeding_status],
+                                               DISEASE_STATUS_SLICE[disease_status]].sum(axis=(1, 2, 3))
+            if self.nb_replicates > 1:
+                return rv.reshape((self.nb_replicates, self.graph.number_vertices))
+            return rv
+
+        arr_active_vertices = self._get_active_vertices()
+        if arr_active_vertices is not None:
+            if self._use_parallel_kernels(arr_active_vertices.shape[0]):
+                rv = self._run_parallel_kernel(base_count_tick_per_vertex_with_stages_on_vertices_parallel,
+                                               pop_per_vertex, index_start, index_end, arr_active_vertices)
+            else:
+                rv = base_count_tick_per_vertex_with_stages_on_vertices(pop_per_vertex, index_start, index_end,
+                                                                        arr_active_vertices)
+        elif self._use_parallel_kernels(pop_per_vertex.shape[2]):
+            rv = self._run_parallel_kernel(base_count_tick_per_vertex_with_stages_parallel, pop_per_vertex, index_start,
+                                           index_end)
+        else:
+            rv = base_count_tick_per_vertex_with_stages(pop_per_vertex, index_start, index_end)
+
+        if self.nb_replicates > 1:
+            return rv.reshape((self.nb_replicates, self.graph.number_vertices))
+        return rv
+
+    def invalidate_tick_count_cache(self):
+        """
+        Forget the tensor computed by get_tick_count_tensor. The methods of the tick building blocks call it each time
+        they modify the tick population. However, if the user directly writes ticks in the pop_per_vertex arrays, this
+        method should be called afterward.
+        """
+        self.cached_tick_count_tensor = None
+
+    def get_tick_count_tensor(self):
+        """
+        Count, in a single pass over the tick population, the number of ticks on each vertex for each phase, feeding
+        status and disease status. The result is cached until a method modifying the tick population is called, so
+        that all the counts needed at a given timestep cost a single pass. Note that count_tick_per_vertex also uses
+        this cache when it is available.
+
+        :return: 4D array of integers of shape (nb_vertex, 4, 2, 2), such that r_arr[i, p, f, d] is the number of ticks
+                 in the vertex of index i, in the phase p (0 for egg, 1 for larva, 2 for nymph, 3 for adult, see
+                 PHASE_INDEX), with feeding status f (0 for unfed, 1 for fed) and disease status d (0 for susceptible,
+                 1 for infected). If there are several replicates, the returned array has shape
+                 (nb_replicates, nb_vertex, 4, 2, 2). The returned array is read-only.
+        """
+        if self.cached_tick_count_tensor is None:
+            arr_active_vertices = self._get_active_vertices()
+            if arr_active_vertices is not None:
+                if self._use_parallel_kernels(arr_active_vertices.shape[0]):
+                    rv = self._run_parallel_kernel(base_aggregate_tick_counts_on_vertices_parallel, self.pop_per_vertex,
+                                                   self.arr_phase_of_stage, arr_active_vertices)
+                else:
+                    rv = base_aggregate_tick_counts_on_vertices(self.pop_per_vertex, self.arr_phase_of_stage,
+                                                                arr_active_vertices)
+            elif self._use_parallel_kernels(self.pop_per_vertex.shape[2]):
+                rv = self._run_parallel_kernel(base_aggregate_tick_counts_parallel, self.pop_per_vertex,
+                                               self.arr_phase_of_stage)
+            else:
+                rv = base_aggregate_tick_counts(self.pop_per_vertex, self.arr_phase_of_stage)
+            rv.setflags(write=False)
+            self.cached_tick_count_tensor = rv
+
+        if self.nb_replicates > 1:
+            return self.cached_tick_count_tensor.reshape((self.nb_replicates, self.graph.number_vertices, 4, 2, 2))
+        return self.cached_tick_count_tensor
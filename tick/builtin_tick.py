@@ -2,6 +2,11 @@ from .base import BaseTickFourPhases
 from .stage_transition import ProportionBasedStageTransition
 from .mortality import ProportionBasedTickMortality
 from .feeding import FeedingSingleGraph
+from .combined_dynamics import ProportionBasedCombinedDynamics
+from .dispersal import ProportionBasedDispersal
+from .transmission import HostTickTransmission
+from .engine import SeasonalDynamicsEngine
+from .profiling import TickInstrumentation
 from sampy.utils.decorators import sampy_class
 
 
@@ -9,7 +14,12 @@ from sampy.utils.decorators import sampy_class
 class BasicTick(BaseTickFourPhases,
                 ProportionBasedStageTransition,
                 ProportionBasedTickMortality,
-                FeedingSingleGraph):
+                ProportionBasedCombinedDynamics,
+                FeedingSingleGraph,
+                ProportionBasedDispersal,
+                HostTickTransmission,
+                SeasonalDynamicsEngine,
+                TickInstrumentation):
     """
     First iteration of a tick for SamPy. Provides basic methods for tick population dynamics.
     This class assumes that the tick population and all the hosts share the same graph.
@@ -19,6 +29,30 @@ class BasicTick(BaseTickFourPhases,
 
     Note on the 31-08-2023: at the present date, there are still functionalities missing.
                             Use this class at your own risks.
+
+    Several replicates of the tick population (kwarg 'nb_replicates') can be simulated at once, for instance for Monte
+    Carlo ensembles. The replicates feed on the same host agents, but each of them has its own ticks attached to the
+    hosts and its own random streams, so that they diverge from each other. Transmission between hosts and ticks is
+    not available with several replicates, since the infection status of the hosts would be shared.
+    """
+    def __init__(self, **kwargs):
+        pass
+
+
+@sampy_class
+class EnsembleTick(BaseTickFourPhases,
+                   ProportionBasedStageTransition,
+                   ProportionBasedTickMortality,
+                   ProportionBasedCombinedDynamics,
+                   ProportionBasedDispersal,
+                   SeasonalDynamicsEngine,
+                   TickInstrumentation):
+    """
+    Variant of BasicTick without the building blocks involving hosts. All the methods of this class accept several
+    replicates of the tick population (kwarg 'nb_replicates'), which are processed by the same kernel calls. None of
+    those methods draws random numbers, so the replicates only differ by their initial population and by the
+    vertex-specific parameters given for each replicate, which suits sensitivity analyses. Stochastic ensembles should
+    use BasicTick, whose feeding draws random numbers independently for each replicate.
     """
     def __init__(self, **kwargs):
         pass
\ No newline at end of file
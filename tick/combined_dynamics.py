@@ -0,0 +1,126 @@
+import numpy as np
+from .base import FEEDING_STATUS_INDEX, DISEASE_STATUS_INDEX
+from .stage_transition import TransitionPlan
+from .jit_compiled_functions import (combined_dynamics_mortality_and_transitions,
+                                     combined_dynamics_mortality_and_transitions_parallel,
+                                     combined_dynamics_mortality_and_transitions_on_vertices,
+                                     combined_dynamics_mortality_and_transitions_on_vertices_parallel)
+
+
+def get_combined_dynamics_arrays(nb_stages, dict_mortality=None, dict_transitions=None):
+    """
+    Convert the dictionaries of mortality and transitions used by the method proportion_based_mortality_and_transitions
+    into the flat arrays expected by the kernels of combined dynamics.
+
+    :param nb_stages: integer, number of stages of the tick population.
+    :param dict_mortality: optional, dict, default None. See proportion_based_mortality_and_transitions.
+    :param dict_transitions: optional, dict, default None. See proportion_based_mortality_and_transitions.
+
+    :return: tuple (arr_mortality, arr_edge_offsets, arr_start, arr_end, arr_proportion). arr_mortality is a 3D array
+             of float of shape (2, 2, nb_stages). The transitions of the compartment (f, d) are the ones whose index is
+             between arr_edge_offsets[2 * f + d] (included) and arr_edge_offsets[2 * f + d + 1] (excluded).
+    """
+    arr_mortality = np.full((2, 2, nb_stages), 0.)
+    if dict_mortality is not None:
+        for (feeding_status, disease_status), array_proportion in dict_mortality.items():
+            arr_mortality[FEEDING_STATUS_INDEX[feeding_status],
+                          DISEASE_STATUS_INDEX[disease_status]] = array_proportion
+
+    list_plans = [None, None, None, None]
+    if dict_transitions is not None:
+        for (feeding_status, disease_status), transitions in dict_transitions.items():
+            if not isinstance(transitions, TransitionPlan):
+                transitions = TransitionPlan(transitions)
+            list_plans[2 * FEEDING_STATUS_INDEX[feeding_status] + DISEASE_STATUS_INDEX[disease_status]] = \
+                transitions
+    arr_edge_offsets = np.cumsum([0] + [0 if plan is None else plan.nb_edges for plan in list_plans])
+    list_plans = [plan for plan in list_plans if plan is not None]
+    arr_start = np.concatenate([plan.arr_start for plan in list_plans] + [np.full(0, 0, dtype=np.int64)])
+    arr_end = np.concatenate([plan.arr_end for plan in list_plans] + [np.full(0, 0, dtype=np.int64)])
+    arr_proportion = np.concatenate([plan.arr_proportion for plan in list_plans] + [np.full(0, 0.)])
+    return arr_mortality, arr_edge_offsets, arr_start, arr_end, arr_proportion
+
+
+class ProportionBasedCombinedDynamics:
+    """
+    Building block that applies proportion based mortality and proportion based stage transitions to all the
+    (feeding status, disease status) compartments of the tick population at once. The result is the same as calling
+    'proportion_based_mortality_all_graph' and then 'proportion_based_transition_from_matrix' on each compartment,
+    but the whole population is processed in a single pass over the vertices of the graph.
+    """
+    def __init__(self, **kwargs):
+        pass
+
+    def _sampy_debug_proportion_based_mortality_and_transitions(self, dict_mortality=None, dict_transitions=None,
+                                                                 geographic_condition=None):
+        for dict_param in [dict_mortality, dict_transitions]:
+            if dict_param is None:
+                continue
+            for key in dict_param:
+                if len(key) != 2 or key[0] not in FEEDING_STATUS_INDEX or key[1] not in DISEASE_STATUS_INDEX:
+                    raise ValueError("Keyes of the dictionaries should be tuples of the form (feeding_status, " +
+                                     "disease_status), with feeding_status in ['fed', 'unfed'] and disease_status " +
+                                     "in ['infected', 'susceptible'].")
+        if dict_mortality is not None:
+            for array_proportion in dict_mortality.values():
+                if array_proportion.shape != (self.pop_per_vertex.shape[3],):
+                    raise ValueError("Mortality arrays should be 1D arrays with one value per stage.")
+                if (array_proportion < 0.).any() or (array_proportion > 1.).any():
+                    raise ValueError("Mortality arrays have values that are not between 0 and 1.")
+        if dict_transitions is not None:
+            for key, transitions in dict_transitions.items():
+                if isinstance(transitions, TransitionPlan):
+                    self._sampy_debug_proportion_based_transition_from_plan(key[0], key[1], transitions)
+                else:
+                    self._sampy_debug_proportion_based_transition_from_matrix(key[0], key[1], transitions)
+        if geographic_condition is not None and \
+                geographic_condition.shape not in [(self.graph.number_vertices,), (self.pop_per_vertex.shape[2],)]:
+            raise ValueError("The geographic condition should be a 1D array with one value per vertex.")
+
+    def proportion_based_mortality_and_transitions(self, dict_mortality=None, dict_transitions=None,
+                                                   geographic_condition=None):
+        """
+        Kill a user defined proportion of ticks per stage in each compartment, and then performs the transitions
+        encoded in the transition matrix of each compartment. Compartments that do not appear in a dictionary are left
+        untouched by the corresponding process.
+
+        IMPORTANT: There cannot be any "loop" in the transitions (see 'proportion_based_transition_from_matrix').
+
+        :param dict_mortality: optional, dict, default None. Keyes are tuples (feeding_status, disease_status) and
+                               values are 1D arrays of float, each between 0 and 1, giving the proportion of ticks
+                               killed in each stage.
+        :param dict_transitions: optional, dict, default None. Keyes are tuples (feeding_status, disease_status) and
+                                 values are either TransitionPlan objects, or 2D arrays of floats such that
+                                 matrix_transitions[i, j] is the proportion of ticks that should go from status i to
+                                 status j. Using TransitionPlan objects avoids compiling the matrices at each call.
+        :param geographic_condition: optional, 1D array of bool, default None. If given, mortality is only applied on
+                                     the vertices where the condition is True. Transitions are applied everywhere.
+                                     With several replicates, the condition can be given once for all replicates.
+        """
+        self.invalidate_tick_count_cache()
+        arr_mortality, arr_edge_offsets, arr_start, arr_end, arr_proportion = \
+            get_combined_dynamics_arrays(self.pop_per_vertex.shape[3], dict_mortality, dict_transitions)
+
+        if geographic_condition is None:
+            geographic_condition = np.full(self.pop_per_vertex.shape[2], True)
+        else:
+            geographic_condition = self._replicate_vertex_array(geographic_condition)
+
+        arr_active_vertices = self._get_active_vertices()
+        if arr_active_vertices is not None:
+            if self._use_parallel_kernels(arr_active_vertices.shape[0]):
+                self._run_parallel_kernel(combined_dynamics_mortality_and_transitions_on_vertices_parallel,
+                                          self.pop_per_vertex, arr_mortality, arr_edge_offsets, arr_start, arr_end,
+                                          arr_proportion, geographic_condition, arr_active_vertices)
+            else:
+                combined_dynamics_mortality_and_transitions_on_vertices(self.pop_per_vertex, arr_mortality,
+                                                                        arr_edge_offsets, arr_start, arr_end,
+                                                                        arr_proportion, geographic_condition,
+                                                                        arr_active_vertices)
+        elif self._use_parallel_kernels(self.pop_per_vertex.shape[2]):
+            self._run_parallel_kernel(combined_dynamics_mortality_and_transitions_parallel, self.pop_per_vertex,
+                                      arr_mortality, arr_edge_offsets, arr_start, arr_end, arr_proportion,
+                                      geographic_condition)
+        else:
+            combined_dynamics_mortality_and_transitions(self.pop_per_vertex, arr_mortality, arr_edge_offsets,
+                                                        arr_start, arr_end, arr_proportion, geographic_condition)
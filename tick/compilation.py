@@ -0,0 +1,153 @@
+import argparse
+import time
+import numba as nb
+import numpy as np
+from numba import types
+from . import jit_compiled_functions
+
+
+def _array(dtype, ndim, layout='C'):
+    return types.Array(nb.from_dtype(np.dtype(dtype)), ndim, layout)
+
+
+def get_kernel_signatures(tick_count_dtype=np.int64):
+    """
+    Explicit signatures of the kernels of tick.jit_compiled_functions, as they are called by the methods of the tick
+    building blocks, for a given tick count dtype. The kernels are not restricted to those signatures: calling them
+    with other types still triggers a just in time compilation.
+
+    Kernels only called by other kernels (like feeding_split_ticks_between_hosts) are compiled along with their caller
+    and are therefore not listed.
+
+    :param tick_count_dtype: optional, numpy integer dtype, default np.int64. Dtype of the tick population.
+
+    :return: dict whose keyes are the names of the serial kernels and values lists of tuples of numba types. The
+             multi-threaded twins use the same signatures as their serial version.
+    """
+    pop_4d = _array(tick_count_dtype, 4)
+    # count_tick_per_vertex works on slices of the compartment tensor, which are usually not contiguous.
+    pop_4d_any = _array(tick_count_dtype, 4, 'A')
+    pop_2d = _array(tick_count_dtype, 2)
+    arr_int = _array(np.int64, 1)
+    arr_float = _array(np.float64, 1)
+    arr_bool = _array(np.bool_, 1)
+    list_arr_int = types.ListType(arr_int)
+    return {
+        'base_count_tick_per_vertex_with_stages': [(pop_4d, types.int64, types.int64),
+                                                   (pop_4d_any, types.int64, types.int64)],
+        'base_count_tick_per_vertex_with_stages_on_vertices': [(pop_4d, types.int64, types.int64, arr_int),
+                                                               (pop_4d_any, types.int64, types.int64, arr_int)],
+        'base_find_active_vertices': [(pop_4d,)],
+        'base_aggregate_tick_counts': [(pop_4d, arr_int)],
+        'base_aggregate_tick_counts_on_vertices': [(pop_4d, arr_int, arr_int)],
+        'stage_transition_apply_transition_plan': [(arr_int, arr_int, arr_float, pop_2d)],
+        'stage_transition_apply_transition_plan_on_vertices': [(arr_int, arr_int, arr_float, pop_2d, arr_int)],
+        'mortality_proportion_based_mortality_all_graph': [(arr_float, pop_2d, arr_bool)],
+        'mortality_proportion_based_mortality_on_vertices': [(arr_float, pop_2d, arr_bool, arr_int)],
+        'mortality_vertex_specific_mortality': [(_array(np.float64, 2), pop_2d)],
+        'mortality_vertex_specific_mortality_on_vertices': [(_array(np.float64, 2), pop_2d, arr_int)],
+        # classes of vertices are usually stored using a small integer dtype
+        'mortality_class_based_mortality': [(_array(np.float64, 2), _array(dtype_class, 1), pop_2d)
+                                            for dtype_class in [np.uint8, np.int64]],
+        'mortality_class_based_mortality_on_vertices': [(_array(np.float64, 2), _array(dtype_class, 1), pop_2d,
+                                                         arr_int) for dtype_class in [np.uint8, np.int64]],
+        'feeding_release_fed_ticks': [(pop_2d, arr_int, arr_int, types.int64)],
+        'feeding_build_vertex_agent_index': [(arr_int, types.int64)],
+        'feeding_update_vertex_agent_index': [(arr_int, arr_int, arr_int, arr_int, arr_int, arr_int)],
+        'feeding_release_fed_ticks_from_index': [(pop_2d, arr_int, arr_int, arr_int, types.int64)],
+        'feeding_release_fed_ticks_from_index_replicates': [(pop_2d, arr_int, arr_int, _array(np.int64, 2),
+                                                             types.int64)],
+        'feeding_attach_to_host_to_feed': [(types.uint32, list_arr_int, list_arr_int, pop_2d, pop_2d, types.int64,
+                                            arr_float, list_arr_int, list_arr_int)],
+        'feeding_attach_to_host_to_feed_replicates': [(_array(np.uint32, 1), list_arr_int, list_arr_int,
+                                                       _array(tick_count_dtype, 3), _array(tick_count_dtype, 3),
+                                                       types.int64, arr_float, types.ListType(_array(np.int64, 2)),
+                                                       types.ListType(_array(np.int64, 2)))],
+        'feeding_release_fed_ticks_through_mapping': [(pop_2d, arr_int, arr_int, types.int64, types.int64, arr_int,
+                                                       arr_int, arr_float, arr_float)],
+        'feeding_attach_to_host_to_feed_through_mapping': [(types.uint32, list_arr_int, list_arr_int,
+                                                            types.ListType(arr_float), list_arr_int, list_arr_int,
+                                                            pop_2d, pop_2d, types.int64, arr_float, list_arr_int,
+                                                            list_arr_int)],
+        'feeding_release_fed_ticks_from_cohorts': [(pop_2d, _array(tick_count_dtype, 3), arr_int, types.int64)],
+        'feeding_attach_to_host_to_feed_in_cohorts': [(types.uint32, list_arr_int, pop_2d, pop_2d, types.int64,
+                                                       arr_float, types.ListType(pop_4d), arr_int, types.int64)],
+        'feeding_move_cohorts_with_hosts': [(pop_4d, arr_int, arr_int, arr_int)],
+        'transmission_hosts_and_feeding_ticks': [(types.uint32, arr_bool, list_arr_int, list_arr_int, types.float64,
+                                                  types.float64, types.float64)],
+        'dispersal_compute_outflow': [(pop_2d, arr_float, arr_int, types.int64, _array(np.int64, 2))],
+        'dispersal_compute_outflow_on_vertices': [(pop_2d, arr_float, arr_int, types.int64, _array(np.int64, 2),
+                                                   arr_int)],
+        'dispersal_gather_inflow': [(pop_2d, _array(np.int64, 2), arr_int, arr_int, arr_int, arr_int, types.int64,
+                                     types.int64)],
+        'dispersal_gather_inflow_on_vertices': [(pop_2d, _array(np.int64, 2), arr_int, arr_int, arr_int, arr_int,
+                                                 types.int64, types.int64, arr_int)],
+        'dispersal_find_reachable_vertices': [(arr_int, arr_int, types.int64, arr_int, types.int64)],
+        'combined_dynamics_mortality_and_transitions': [(pop_4d, _array(np.float64, 3), arr_int, arr_int, arr_int,
+                                                         arr_float, arr_bool)],
+        'combined_dynamics_mortality_and_transitions_on_vertices': [(pop_4d, _array(np.float64, 3), arr_int, arr_int,
+                                                                     arr_int, arr_float, arr_bool, arr_int)],
+        'engine_run_seasonal_dynamics': [(pop_4d, arr_int, types.int64, types.int64, _array(np.float64, 4),
+                                          _array(np.int64, 2), arr_int, arr_int, arr_float, arr_bool)],
+        'engine_run_seasonal_dynamics_on_vertices': [(pop_4d, arr_int, types.int64, types.int64, _array(np.float64, 4),
+                                                      _array(np.int64, 2), arr_int, arr_int, arr_float, arr_bool,
+                                                      arr_int)],
+        'engine_run_seasonal_dynamics_with_feeding': [(pop_4d, arr_int, types.int64, types.int64,
+                                                       _array(np.float64, 4), _array(np.int64, 2), arr_int, arr_int,
+                                                       arr_float, arr_bool, _array(np.int64, 2), arr_int, arr_int,
+                                                       arr_int, _array(np.int64, 4))],
+        'engine_run_seasonal_dynamics_with_feeding_on_vertices': [(pop_4d, arr_int, types.int64, types.int64,
+                                                                   _array(np.float64, 4), _array(np.int64, 2), arr_int,
+                                                                   arr_int, arr_float, arr_bool, _array(np.int64, 2),
+                                                                   arr_int, arr_int, arr_int, _array(np.int64, 4),
+                                                                   arr_int)],
+    }
+
+
+def warmup(tick_count_dtypes=(np.int64,), parallel=True):
+    """
+    Compile the kernels of the tick building blocks for the signatures returned by get_kernel_signatures, so that the
+    first timestep of a simulation does not pay for their compilation. Since the kernels are cached on disk, the
+    compilation only really happens the first time, and later calls to warmup (in the same or in other processes)
+    only load the compiled code from the cache.
+
+    This is typically called once at the beginning of each worker of a parameter sweep. The cache can also be
+    populated ahead of time, for instance when building a container image, by running 'python -m tick.compilation'.
+    Set the environment variable NUMBA_CACHE_DIR to choose where the cache is stored.
+
+    :param tick_count_dtypes: optional, iterable of numpy integer dtypes, default (np.int64,). Dtypes of the tick
+                              populations that will be simulated.
+    :param parallel: optional, boolean, default True. If True, the multi-threaded kernels are compiled too.
+
+    :return: dict associating to the name of each kernel the time (in seconds) spent compiling or loading it.
+    """
+    dict_times = {}
+    for tick_count_dtype in tick_count_dtypes:
+        for name, list_signatures in get_kernel_signatures(tick_count_dtype).items():
+            list_names = [name]
+            if parallel and hasattr(jit_compiled_functions, name + '_parallel'):
+                list_names.append(name + '_parallel')
+            for kernel_name in list_names:
+                kernel = getattr(jit_compiled_functions, kernel_name)
+                start = time.perf_counter()
+                for signature in list_signatures:
+                    kernel.compile(signature)
+                dict_times[kernel_name] = dict_times.get(kernel_name, 0.) + time.perf_counter() - start
+    return dict_times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the tick kernels and store them in numba on-disk cache.")
+    parser.add_argument('--dtypes', nargs='+', default=['int64'], choices=['int64', 'int32', 'uint32'],
+                        help="tick count dtypes to compile the kernels for.")
+    parser.add_argument('--serial-only', action='store_true', help="do not compile the multi-threaded kernels.")
+    args = parser.parse_args(argv)
+
+    dict_times = warmup(tick_count_dtypes=[np.dtype(dtype) for dtype in args.dtypes], parallel=not args.serial_only)
+    for name, duration in sorted(dict_times.items()):
+        print(name, '%.3f s' % duration)
+    print('total', '%.3f s' % sum(dict_times.values()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import numpy as np
+from .jit_compiled_functions import (dispersal_compute_outflow,
+                                     dispersal_compute_outflow_parallel,
+                                     dispersal_compute_outflow_on_vertices,
+                                     dispersal_compute_outflow_on_vertices_parallel,
+                                     dispersal_gather_inflow,
+                                     dispersal_gather_inflow_parallel,
+                                     dispersal_gather_inflow_on_vertices,
+                                     dispersal_gather_inflow_on_vertices_parallel,
+                                     dispersal_find_reachable_vertices)
+
+
+class ProportionBasedDispersal:
+    """
+    Building block that lets ticks move by themselves along the edges of the graph. At each call, a user defined
+    proportion of ticks per stage leaves each vertex, and is split evenly between its neighbours. The split conserves
+    the number of ticks: when the number of ticks leaving a vertex is not a multiple of its number of neighbours, the
+    remaining ticks are given one by one to the neighbours, starting from a neighbour that changes at each call.
+
+    The adjacency of the graph is read from the attribute 'connections' of the graph (one row per vertex, padded with
+    -1) and stored in CSR format the first time it is needed. If the graph changes, the method
+    build_dispersal_adjacency should be called again.
+
+    attributes created:
+        - arr_dispersal_offsets: None, or 1D array of int of length nb_vertex + 1. The neighbours of the vertex i are
+                                 arr_dispersal_neighbours[arr_dispersal_offsets[i]:arr_dispersal_offsets[i + 1]].
+        - arr_dispersal_neighbours: None, or 1D array of int.
+        - arr_dispersal_in_offsets, arr_dispersal_in_sources, arr_dispersal_in_edges: None, or 1D arrays of int
+                                 describing the transposed adjacency, used to gather the ticks arriving on each vertex.
+        - dispersal_counter: integer, number of calls to proportion_based_dispersal, used to rotate the neighbours
+                             receiving the remaining ticks.
+        - arr_dispersal_outflow: None, or 2D array of int of shape (nb_replicates * nb_vertex, nb_stages), buffer
+                                 receiving the number of ticks leaving each cell, reused by every call.
+        - dispersal_outflow_is_clean: bool, True if arr_dispersal_outflow only contains 0, which is required when
+                                      only the active vertices are processed.
+    """
+    def __init__(self, **kwargs):
+        self.arr_dispersal_offsets = None
+        self.arr_dispersal_neighbours = None
+        self.arr_dispersal_in_offsets = None
+        self.arr_dispersal_in_sources = None
+        self.arr_dispersal_in_edges = None
+        self.arr_dispersal_outflow = None
+        self.dispersal_outflow_is_clean = False
+        self.dispersal_counter = 0
+
+    def build_dispersal_adjacency(self):
+        """
+        Build the CSR adjacency of the graph, and its transpose, from the attribute 'connections' of the graph, and
+        allocate the buffer used to store the ticks leaving each cell.
+        """
+        connections = np.asarray(self.graph.connections)
+        is_edge = connections >= 0
+        self.arr_dispersal_offsets = np.concatenate([[0], np.cumsum(is_edge.sum(axis=1))]).astype(np.int64)
+        self.arr_dispersal_neighbours = connections[is_edge].astype(np.int64)
+
+        arr_sources = np.repeat(np.arange(connections.shape[0], dtype=np.int64), is_edge.sum(axis=1))
+        self.arr_dispersal_in_edges = np.argsort(self.arr_dispersal_neighbours, kind='stable').astype(np.int64)
+        self.arr_dispersal_in_sources = arr_sources[self.arr_dispersal_in_edges]
+        self.arr_dispersal_in_offsets = np.concatenate([[0], np.cumsum(np.bincount(self.arr_dispersal_neighbours,
+                                                                                   minlength=connections.shape[0]))
+                                                        ]).astype(np.int64)
+        self.arr_dispersal_outflow = np.full(self.pop_per_vertex.shape[2:], 0, dtype=np.int64)
+        self.dispersal_outflow_is_clean = True
+
+    def _sampy_debug_proportion_based_dispersal(self, feeding_status, disease_status, array_proportion):
+        if len(array_proportion.shape) != 1 or array_proportion.shape[0] != self.pop_per_vertex.shape[3]:
+            raise ValueError("The array of proportions should have one value per stage.")
+        if (array_proportion < 0.).any() or (array_proportion > 1.).any():
+            raise ValueError("The array of proportions has values that are not between 0 and 1.")
+        if not hasattr(self.graph, 'connections'):
+            raise ValueError("The graph should have an attribute 'connections' to be used for dispersal.")
+        # a cell can at most receive all the ticks of the same stage of its neighbours
+        array_pop = self._get_compartment(feeding_status, disease_status).astype(np.int64)
+        connections = np.asarray(self.graph.connections)
+        nb_vertex = self.graph.number_vertices
+        array_max = array_pop.copy()
+        for r in range(self.nb_replicates):
+            rows = slice(r * nb_vertex, (r + 1) * nb_vertex)
+            for k in range(connections.shape[1]):
+                is_edge = connections[:, k] >= 0
+                np.add.at(array_max[rows], connections[is_edge, k], array_pop[rows][is_edge])
+        self._check_tick_count_overflow(array_max)
+
+    def proportion_based_dispersal(self, feeding_status, disease_status, array_proportion):
+        """
+        Move a user defined proportion of ticks per stage from each vertex to its neighbours. The ticks leaving a
+        vertex are split evenly between all its neighbours, whatever the weights of the graph. All the stages are
+        processed in the same pass over the graph.
+
+        :param feeding_status: string, either 'fed' or 'unfed'.
+        :param disease_status: string, either 'infected' of 'susceptible'.
+        :param array_proportion: 1D array of float, each between 0 and 1, proportion of ticks leaving their vertex at
+                                 each stage. Use 0 for the stages that do not move by themselves (like eggs).
+        """
+        self.invalidate_tick_count_cache()
+        if self.arr_dispersal_offsets is None:
+            self.build_dispersal_adjacency()
+
+        array_pop = self._get_compartment(feeding_status, disease_status)
+        nb_vertex = self.graph.number_vertices
+        arr_outflow = self.arr_dispersal_outflow
+        rotation = self.dispersal_counter
+        self.dispersal_counter += 1
+
+        arr_active_vertices = self._get_active_vertices()
+        if arr_active_vertices is not None:
+            # the kernels only write the rows of the active vertices in the buffer, and read the rows of their
+            # neighbours, so that all the other rows should be 0. Those rows are reset at the end of the call.
+            if not self.dispersal_outflow_is_clean:
+                arr_outflow.fill(0)
+            # the ticks can only reach the neighbours of the active vertices
+            arr_reachable = dispersal_find_reachable_vertices(self.arr_dispersal_offsets,
+                                                              self.arr_dispersal_neighbours, nb_vertex,
+                                                              arr_active_vertices, array_pop.shape[0])
+            if self._use_parallel_kernels(arr_reachable.shape[0]):
+                self._run_parallel_kernel(dispersal_compute_outflow_on_vertices_parallel, array_pop, array_proportion,
+                                          self.arr_dispersal_offsets, nb_vertex, arr_outflow, arr_active_vertices)
+                self._run_parallel_kernel(dispersal_gather_inflow_on_vertices_parallel, array_pop, arr_outflow,
+                                          self.arr_dispersal_offsets, self.arr_dispersal_in_offsets,
+                                          self.arr_dispersal_in_sources, self.arr_dispersal_in_edges, nb_vertex,
+                                          rotation, arr_reachable)
+            else:
+                dispersal_compute_outflow_on_vertices(array_pop, array_proportion, self.arr_dispersal_offsets,
+                                                      nb_vertex, arr_outflow, arr_active_vertices)
+                dispersal_gather_inflow_on_vertices(array_pop, arr_outflow, self.arr_dispersal_offsets,
+                                                    self.arr_dispersal_in_offsets, self.arr_dispersal_in_sources,
+                                                    self.arr_dispersal_in_edges, nb_vertex, rotation, arr_reachable)
+            arr_outflow[arr_active_vertices] = 0
+            self.dispersal_outflow_is_clean = True
+            self._mark_vertices_active(arr_reachable)
+        else:
+            if self._use_parallel_kernels(array_pop.shape[0]):
+                self._run_parallel_kernel(dispersal_compute_outflow_parallel, array_pop, array_proportion,
+                                          self.arr_dispersal_offsets, nb_vertex, arr_outflow)
+                self._run_parallel_kernel(dispersal_gather_inflow_parallel, array_pop, arr_outflow,
+                                          self.arr_dispersal_offsets, self.arr_dispersal_in_offsets,
+                                          self.arr_dispersal_in_sources, self.arr_dispersal_in_edges, nb_vertex,
+                                          rotation)
+            else:
+                dispersal_compute_outflow(array_pop, array_proportion, self.arr_dispersal_offsets, nb_vertex,
+                                          arr_outflow)
+                dispersal_gather_inflow(array_pop, arr_outflow, self.arr_dispersal_offsets,
+                                        self.arr_dispersal_in_offsets, self.arr_dispersal_in_sources,
+                                        self.arr_dispersal_in_edges, nb_vertex, rotation)
+            self.dispersal_outflow_is_clean = False
+            # with active vertex tracking, the proportion of active vertices may be above the threshold, in which case
+            # the vertices that received ticks still have to be registered.
+            if self.active_vertex_threshold is not None:
+                self._mark_vertices_active(dispersal_find_reachable_vertices(self.arr_dispersal_offsets,
+                                                                             self.arr_dispersal_neighbours, nb_vertex,
+                                                                             np.where(arr_outflow.any(axis=1))[0],
+                                                                             array_pop.shape[0]))
@@ -0,0 +1,455 @@
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from numba.typed import List as NumbaList
+from .base import FEEDING_STATUS_INDEX, DISEASE_STATUS_INDEX
+from .combined_dynamics import get_combined_dynamics_arrays
+from .engine import get_sync_chunks
+from .feeding import FeedingSingleGraph
+from .jit_compiled_functions import (combined_dynamics_mortality_and_transitions_on_vertices,
+                                     engine_run_seasonal_dynamics_on_vertices,
+                                     engine_run_seasonal_dynamics_with_feeding_on_vertices,
+                                     dispersal_compute_outflow_on_vertices,
+                                     dispersal_gather_inflow_on_vertices,
+                                     feeding_attach_to_host_to_feed,
+                                     feeding_release_fed_ticks_from_index)
+
+
+def partition_vertices(nb_vertex, nb_subdomains, arr_weights=None):
+    """
+    Split the vertices of a graph into contiguous ranges of indexes. Since the vertices of a graph are usually
+    numbered following the space (for instance row by row on a grid), contiguous ranges give compact subdomains with
+    few boundary vertices.
+
+    :param nb_vertex: integer, number of vertices.
+    :param nb_subdomains: positive integer, number of subdomains.
+    :param arr_weights: optional, 1D array of non-negative float, default None. Workload of each vertex (for instance
+                        its number of ticks, or 1 for land and 0 for sea). If given, the ranges are chosen so that the
+                        subdomains have the same total weight rather than the same number of vertices.
+
+    :return: 1D array of int of length nb_subdomains + 1. The subdomain of index k is made of the vertices whose
+             index is between arr_offsets[k] (included) and arr_offsets[k + 1] (excluded).
+    """
+    if nb_subdomains < 1:
+        raise ValueError("The number of subdomains should be a positive integer.")
+    if arr_weights is None:
+        return np.linspace(0, nb_vertex, nb_subdomains + 1).round().astype(np.int64)
+    arr_cum_weights = np.cumsum(arr_weights, dtype=float)
+    if arr_cum_weights.shape[0] != nb_vertex or (nb_vertex > 0 and arr_cum_weights[-1] <= 0.):
+        raise ValueError("The weights should be a 1D array with one value per vertex, with a positive sum.")
+    arr_targets = np.arange(1, nb_subdomains) * arr_cum_weights[-1] / nb_subdomains
+    arr_cuts = np.searchsorted(arr_cum_weights, arr_targets, side='left') + 1
+    return np.concatenate([[0], np.minimum(arr_cuts, nb_vertex), [nb_vertex]]).astype(np.int64)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# worker side. The shared memory blocks are attached the first time a worker sees them, and kept open for the next
+# tasks. They are keyed by the name of the buffer in the main process ('pop', 'offsets', ...): when a buffer is
+# reallocated by the main process, its new block replaces the stale one, which is closed, so that a worker holds at
+# most one mapping per buffer.
+
+_worker_blocks = {}
+
+
+def _attach_shared_memory(shm_name):
+    # the block belongs to the main process, which unlinks it. Before python 3.13, attaching a block registers it in the
+    # resource tracker, which is shared with the main process: unregistering it afterward would also drop the
+    # registration of the main process, so the registration is skipped instead.
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=shm_name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return SharedMemory(name=shm_name)
+    finally:
+        resource_tracker.register = register
+
+
+def _get_shared_array(name, descriptor):
+    shm_name, shape, dtype = descriptor
+    shm = _worker_blocks.get(name)
+    if shm is None or shm.name != shm_name:
+        if shm is not None:
+            shm.close()
+        shm = _attach_shared_memory(shm_name)
+        _worker_blocks[name] = shm
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _get_worker_block_names():
+    """
+    Return the names of the shared memory blocks currently attached by the worker. Used to check that the workers do
+    not keep stale mappings.
+    """
+    return {name: shm.name for name, shm in _worker_blocks.items()}
+
+
+def _get_subdomain_rows(start, end, nb_vertex, nb_replicates):
+    return (np.arange(start, end, dtype=np.int64)[None, :] +
+            nb_vertex * np.arange(nb_replicates, dtype=np.int64)[:, None]).ravel()
+
+
+def _task_mortality_and_transitions(dict_arrays, start, end, params):
+    arr_rows = _get_subdomain_rows(start, end, params['nb_vertex'], params['nb_replicates'])
+    combined_dynamics_mortality_and_transitions_on_vertices(dict_arrays['pop'], *params['arrays'],
+                                                            dict_arrays['geographic_condition'], arr_rows)
+
+
+def _task_seasonal_dynamics(dict_arrays, start, end, params):
+    arr_rows = _get_subdomain_rows(start, end, params['nb_vertex'], params['nb_replicates'])
+    arr_season_of_day, arr_mortality, arr_edge_offsets, arr_start, arr_end, arr_proportion = params['arrays']
+    args = (dict_arrays['pop'], arr_season_of_day, params['first_day'], params['nb_steps'], arr_mortality,
+            arr_edge_offsets, arr_start, arr_end, arr_proportion, dict_arrays['geographic_condition'])
+    if 'released' in dict_arrays:
+        arr_entry_host, arr_entry_stage, arr_entry_offset = params['feeding_arrays']
+        engine_run_seasonal_dynamics_with_feeding_on_vertices(*args, dict_arrays['host_offsets'], arr_entry_host,
+                                                              arr_entry_stage, arr_entry_offset,
+                                                              dict_arrays['released'], arr_rows)
+    else:
+        engine_run_seasonal_dynamics_on_vertices(*args, arr_rows)
+
+
+def _task_dispersal_outflow(dict_arrays, start, end, params):
+    arr_rows = _get_subdomain_rows(start, end, params['nb_vertex'], params['nb_replicates'])
+    array_pop = dict_arrays['pop'][params['feeding_index'], params['disease_index']]
+    dispersal_compute_outflow_on_vertices(array_pop, params['array_proportion'], dict_arrays['offsets'],
+                                          params['nb_vertex'], dict_arrays['outflow'], arr_rows)
+
+
+def _task_dispersal_inflow(dict_arrays, start, end, params):
+    arr_rows = _get_subdomain_rows(start, end, params['nb_vertex'], params['nb_replicates'])
+    array_pop = dict_arrays['pop'][params['feeding_index'], params['disease_index']]
+    dispersal_gather_inflow_on_vertices(array_pop, dict_arrays['outflow'], dict_arrays['offsets'],
+                                        dict_arrays['in_offsets'], dict_arrays['in_sources'], dict_arrays['in_edges'],
+                                        params['nb_vertex'], params['rotation'], arr_rows)
+
+
+def _task_attach(dict_arrays, start, end, params):
+    # the kernel works on the rows of the subdomain only, the offsets of the host indexes being absolute positions in
+    # the arrays of agent ids.
+    list_offsets = NumbaList()
+    list_agent_ids = NumbaList()
+    list_col_tick = NumbaList()
+    list_col_tick_inf = NumbaList()
+    for i in range(params['nb_hosts']):
+        list_offsets.append(dict_arrays['offsets_' + str(i)][start:end + 1])
+        list_agent_ids.append(dict_arrays['agent_ids_' + str(i)])
+        list_col_tick.append(dict_arrays['col_tick_' + str(i)])
+        list_col_tick_inf.append(dict_arrays['col_tick_inf_' + str(i)])
+    feeding_attach_to_host_to_feed(params['seeds'][params['index_subdomain']], list_offsets, list_agent_ids,
+                                   dict_arrays['pop'][0, 0, start:end], dict_arrays['pop'][0, 1, start:end],
+                                   params['stage'], params['arr_proba'], list_col_tick, list_col_tick_inf)
+
+
+def _task_release(dict_arrays, start, end, params):
+    arr_offsets = dict_arrays['offsets'][start:end + 1]
+    for disease_index, name_col in [(0, 'col_fed'), (1, 'col_fed_inf')]:
+        feeding_release_fed_ticks_from_index(dict_arrays['pop'][1, disease_index, start:end], arr_offsets,
+                                             dict_arrays['agent_ids'], dict_arrays[name_col], params['stage'])
+
+
+_TASKS = {
+    'mortality_and_transitions': _task_mortality_and_transitions,
+    'seasonal_dynamics': _task_seasonal_dynamics,
+    'dispersal_outflow': _task_dispersal_outflow,
+    'dispersal_inflow': _task_dispersal_inflow,
+    'attach': _task_attach,
+    'release': _task_release,
+}
+
+
+def _run_task(task_name, dict_descriptors, start, end, params):
+    dict_arrays = {name: _get_shared_array(name, descriptor) for name, descriptor in dict_descriptors.items()}
+    _TASKS[task_name](dict_arrays, start, end, params)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+
+class DomainDecomposition:
+    """
+    Execute the processes of a tick population on several worker processes, each of them handling contiguous
+    subdomains of the graph (see partition_vertices). The compartment tensor of the tick population is moved into
+    shared memory, so that the workers modify it in place and the tick object keeps working as usual in the main
+    process (for counting, recording, saving, etc.). This allows a single simulation to use several cores, or the
+    memory bandwidth of several sockets, without any change in the tick object.
+
+    The processes that only involve the ticks of a vertex (mortality, transitions, seasonal dynamics) are run on each
+    subdomain independently. Dispersal is performed in two phases separated by a synchronisation: the ticks leaving
+    the vertices of every subdomain are computed first, and then each subdomain gathers the ticks arriving on its
+    vertices, including the ones coming from the boundary of the neighbouring subdomains. Feeding (only with
+    FeedingSingleGraph) works on the agents per vertex, so that the host movements are taken into account by the
+    index of the agents per vertex, which is updated in the main process. The per-agent feeding columns belong to the
+    hosts' df_attributes, they are therefore copied in shared buffers for the duration of each call.
+
+    The results do not depend on the number of workers: the deterministic processes give exactly the same results as
+    the methods of the tick object, and the random draws of attach_to_host_to_feed use one random stream per
+    subdomain derived from the seed. They do depend on the number of subdomains, which should therefore be kept fixed
+    to reproduce a simulation.
+
+    Active vertex tracking and multi-threaded kernels are not used by the workers: each subdomain is processed in
+    full by a serial kernel. If active vertex tracking is enabled on the tick object, the active vertices are updated
+    after the processes that bring ticks on new vertices.
+
+    Since the workers are started with the 'spawn' method by default, the script creating this object should protect
+    its entry point with "if __name__ == '__main__':", as usual with multiprocessing.
+
+    The parameters are not checked by this object: run a few timesteps with the methods of a tick object in debug mode
+    to check them.
+
+    :param tick: tick object, providing the building blocks whose processes are decomposed.
+    :param nb_subdomains: positive integer, number of subdomains. Should usually be a multiple of nb_workers.
+    :param nb_workers: optional, positive integer, default None. Number of worker processes. By default, the number of
+                       CPUs.
+    :param arr_vertex_weights: optional, 1D array of float, default None. Workload of each vertex, used to balance the
+                               subdomains (see partition_vertices).
+    :param mp_context: optional, string, default 'spawn'. Start method of the worker processes.
+    """
+    def __init__(self, tick, nb_subdomains, nb_workers=None, arr_vertex_weights=None, mp_context='spawn'):
+        self.tick = tick
+        self.nb_vertex = tick.graph.number_vertices
+        self.arr_subdomain_offsets = partition_vertices(self.nb_vertex, nb_subdomains, arr_weights=arr_vertex_weights)
+        self.nb_subdomains = nb_subdomains
+        self.dict_blocks = {}
+        self.is_closed = False
+
+        # the population is moved into shared memory once and for all
+        array_pop = self._get_buffer('pop', tick.pop_per_vertex.shape, tick.pop_per_vertex.dtype)
+        array_pop[:] = tick.pop_per_vertex
+        tick._set_pop_per_vertex(array_pop)
+
+        self.executor = ProcessPoolExecutor(max_workers=nb_workers, mp_context=multiprocessing.get_context(mp_context))
+
+    def _get_buffer(self, name, shape, dtype):
+        """
+        Return a numpy array of the given shape and dtype backed by the shared memory block 'name', reallocating the
+        block if it is too small.
+        """
+        if self.is_closed:
+            raise ValueError("The domain decomposition is closed.")
+        dtype = np.dtype(dtype)
+        nb_bytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        block = self.dict_blocks.get(name)
+        if block is None or block[0].size < nb_bytes:
+            if block is not None:
+                block[0].close()
+                block[0].unlink()
+            # a new block, with a new random name, is created at each allocation so that the workers never use a
+            # stale block
+            block = (SharedMemory(create=True, size=nb_bytes), None)
+        array = np.ndarray(shape, dtype=dtype, buffer=block[0].buf)
+        self.dict_blocks[name] = (block[0], (block[0].name, tuple(shape), dtype.str))
+        return array
+
+    def _share(self, name, array):
+        """
+        Copy an array in the shared memory block 'name'.
+        """
+        array = np.ascontiguousarray(array)
+        self._get_buffer(name, array.shape, array.dtype)[...] = array
+        return self.dict_blocks[name][1]
+
+    def _run_on_subdomains(self, task_name, list_names, params, list_params_subdomain=None):
+        """
+        Run a task on every subdomain, and wait for all of them to be done.
+        """
+        if self.is_closed:
+            raise ValueError("The domain decomposition is closed.")
+        dict_descriptors = {name: self.dict_blocks[name][1] for name in ['pop'] + list_names}
+        list_futures = []
+        for k in range(self.nb_subdomains):
+            start, end = self.arr_subdomain_offsets[k], self.arr_subdomain_offsets[k + 1]
+            if end == start:
+                continue
+            params_subdomain = dict(params, index_subdomain=k)
+            list_futures.append(self.executor.submit(_run_task, task_name, dict_descriptors, int(start), int(end),
+                                                     params_subdomain))
+        for future in list_futures:
+            future.result()
+
+    def _share_geographic_condition(self, geographic_condition):
+        if geographic_condition is None:
+            geographic_condition = np.full(self.tick.pop_per_vertex.shape[2], True)
+        else:
+            geographic_condition = self.tick._replicate_vertex_array(geographic_condition)
+        self._share('geographic_condition', geographic_condition)
+
+    def _get_base_params(self):
+        return {'nb_vertex': self.nb_vertex, 'nb_replicates': self.tick.nb_replicates}
+
+    def proportion_based_mortality_and_transitions(self, dict_mortality=None, dict_transitions=None,
+                                                   geographic_condition=None):
+        """
+        Same as the method of ProportionBasedCombinedDynamics, executed by the workers.
+        """
+        self.tick.invalidate_tick_count_cache()
+        arr_mortality, arr_edge_offsets, arr_start, arr_end, arr_proportion = \
+            get_combined_dynamics_arrays(self.tick.pop_per_vertex.shape[3], dict_mortality, dict_transitions)
+        self._share_geographic_condition(geographic_condition)
+        params = self._get_base_params()
+        params['arrays'] = (arr_mortality, arr_edge_offsets, arr_start, arr_end, arr_proportion)
+        self._run_on_subdomains('mortality_and_transitions', ['geographic_condition'], params)
+
+    def run_seasonal_dynamics(self, nb_steps, schedule, geographic_condition=None, increment_feeding=False,
+                              position_attribute='position'):
+        """
+        Same as the method of SeasonalDynamicsEngine, executed by the workers. Each worker brings the vertices of its
+        subdomains forward by nb_steps timesteps without any synchronisation.
+        """
+        if increment_feeding:
+            self._check_feeding()
+        self.tick.invalidate_tick_count_cache()
+        first_day = self.tick.engine_day % schedule.period
+        self.tick.engine_day += nb_steps
+        if nb_steps == 0:
+            return
+        self._share_geographic_condition(geographic_condition)
+        list_names = ['geographic_condition']
+        params = self._get_base_params()
+        params.update({'first_day': first_day, 'nb_steps': nb_steps,
+                       'arrays': (schedule.arr_season_of_day, schedule.arr_mortality, schedule.arr_edge_offsets,
+                                  schedule.arr_start, schedule.arr_end, schedule.arr_proportion)})
+        if increment_feeding:
+            arr_host_offsets, arr_entry_host, arr_entry_stage, arr_entry_offset, arr_released = \
+                self.tick._take_released_ticks(nb_steps, position_attribute=position_attribute)
+            self._share('host_offsets', arr_host_offsets)
+            self._share('released', arr_released)
+            list_names += ['host_offsets', 'released']
+            params['feeding_arrays'] = (arr_entry_host, arr_entry_stage, arr_entry_offset)
+        self._run_on_subdomains('seasonal_dynamics', list_names, params)
+
+    def run(self, n_steps, schedule, sync_points=None, callback=None, geographic_condition=None,
+            increment_feeding=False, position_attribute='position'):
+        """
+        Same as the method run of SeasonalDynamicsEngine, the timesteps between two synchronisation points being
+        executed by the workers. The callback is called in the main process with the tick object, and can use this
+        object to run the other decomposed processes.
+        """
+        for nb_steps, is_sync_point in get_sync_chunks(n_steps, sync_points):
+            self.run_seasonal_dynamics(nb_steps, schedule, geographic_condition=geographic_condition,
+                                       increment_feeding=increment_feeding, position_attribute=position_attribute)
+            if callback is not None and is_sync_point:
+                callback(self.tick, self.tick.engine_day)
+
+    def proportion_based_dispersal(self, feeding_status, disease_status, array_proportion):
+        """
+        Same as the method of ProportionBasedDispersal, executed by the workers in two phases: all the subdomains
+        compute the ticks leaving their vertices, and then gather the ticks arriving on their vertices.
+        """
+        tick = self.tick
+        tick.invalidate_tick_count_cache()
+        if tick.arr_dispersal_offsets is None:
+            tick.build_dispersal_adjacency()
+        list_names = ['offsets', 'in_offsets', 'in_sources', 'in_edges', 'outflow']
+        for name in list_names[:-1]:
+            self._share(name, getattr(tick, 'arr_dispersal_' + name))
+        # the subdomains cover all the rows, which are all overwritten by the first phase
+        self._get_buffer('outflow', tick.pop_per_vertex.shape[2:], np.int64)
+
+        params = self._get_base_params()
+        params.update({'feeding_index': FEEDING_STATUS_INDEX[feeding_status],
+                       'disease_index': DISEASE_STATUS_INDEX[disease_status],
+                       'array_proportion': np.asarray(array_proportion, dtype=float),
+                       'rotation': tick.dispersal_counter})
+        tick.dispersal_counter += 1
+        self._run_on_subdomains('dispersal_outflow', list_names, params)
+        self._run_on_subdomains('dispersal_inflow', list_names, params)
+        if tick.active_vertex_threshold is not None:
+            tick.update_active_vertices()
+
+    def _check_feeding(self):
+        if not isinstance(self.tick, FeedingSingleGraph) or \
+                type(self.tick).increment_feeding_stage is not FeedingSingleGraph.increment_feeding_stage:
+            raise ValueError("Decomposed feeding is only available with the building block FeedingSingleGraph.")
+        if self.tick.nb_replicates > 1:
+            raise ValueError("Decomposed feeding is not available with several replicates of the tick population.")
+
+    def attach_to_host_to_feed(self, rng_seed, list_stage_hosts_prob, position_attribute='position'):
+        """
+        Same as the method of FeedingSingleGraph, executed by the workers. Each subdomain uses its own random stream,
+        so that the ticks attaching do not depend on the number of workers, but are different from the ones drawn by
+        the method of the tick object.
+        """
+        self._check_feeding()
+        tick = self.tick
+        tick.invalidate_tick_count_cache()
+        arr_seeds = np.random.SeedSequence(rng_seed).generate_state(len(list_stage_hosts_prob) * self.nb_subdomains)
+        arr_seeds = arr_seeds.reshape((len(list_stage_hosts_prob), self.nb_subdomains))
+        dict_host_index = tick._get_host_vertex_indexes(list_stage_hosts_prob, position_attribute=position_attribute)
+        for index_item, item in enumerate(list_stage_hosts_prob):
+            stage = item[0]
+            list_names = []
+            list_proba = []
+            list_nb_agents = []
+            for i, (host, proba) in enumerate(item[1:]):
+                host_index = dict_host_index[host]
+                list_nb_agents.append(host_index.arr_agent_ids.shape[0])
+                self._share('offsets_' + str(i), host_index.arr_offsets)
+                self._share('agent_ids_' + str(i), host_index.arr_agent_ids)
+                for name in ['col_tick_' + str(i), 'col_tick_inf_' + str(i)]:
+                    self._get_buffer(name, host_index.arr_agent_ids.shape, np.int64)[...] = 0
+                list_names += ['offsets_' + str(i), 'agent_ids_' + str(i), 'col_tick_' + str(i),
+                               'col_tick_inf_' + str(i)]
+                list_proba.append(proba)
+
+            params = {'nb_hosts': len(item) - 1, 'seeds': arr_seeds[index_item], 'stage': stage,
+                      'arr_proba': np.array(list_proba, dtype=float)}
+            self._run_on_subdomains('attach', list_names, params)
+
+            for i, (host, proba) in enumerate(item[1:]):
+                host_df = tick.dict_hosts[host][0].df_attributes
+                for infected, name in [(False, 'col_tick_' + str(i)), (True, 'col_tick_inf_' + str(i))]:
+                    col_name = tick.get_feeding_column_name(stage, 0, infected=infected)
+                    host_df[col_name] = host_df[col_name] + self._get_buffer(name, (list_nb_agents[i],), np.int64)
+
+    def increment_feeding_stage(self, position_attribute='position'):
+        """
+        Same as the method of FeedingSingleGraph, the fed ticks being released by the workers on the vertices of their
+        subdomains.
+        """
+        self._check_feeding()
+        tick = self.tick
+        tick.invalidate_tick_count_cache()
+        last_slot = (tick.feeding_ring_head - 1) % tick.nb_timesteps_feeding
+        for host_key, (host, list_stages) in tick.dict_hosts.items():
+            array_pos = host.df_attributes[position_attribute]
+            host_index = tick.get_host_vertex_index(host_key, position_attribute=position_attribute)
+            self._share('offsets', host_index.arr_offsets)
+            self._share('agent_ids', host_index.arr_agent_ids)
+            for stage in list_stages:
+                name_col_fed = 'tick_stage_' + str(stage) + '_slot_' + str(last_slot)
+                col_fed = host.df_attributes[name_col_fed]
+                col_fed_inf = host.df_attributes[name_col_fed + '_inf']
+                self._share('col_fed', col_fed)
+                self._share('col_fed_inf', col_fed_inf)
+                self._run_on_subdomains('release', ['offsets', 'agent_ids', 'col_fed', 'col_fed_inf'],
+                                        {'stage': stage})
+
+                if tick.active_vertex_threshold is not None:
+                    tick._mark_vertices_active(array_pos[(col_fed > 0) | (col_fed_inf > 0)])
+                host.df_attributes[name_col_fed] = 0
+                host.df_attributes[name_col_fed + '_inf'] = 0
+
+        tick.feeding_ring_head = last_slot
+
+    def close(self):
+        """
+        Stop the workers, copy the tick population back in the memory of the main process and free the shared memory.
+        """
+        if self.is_closed:
+            return
+        self.executor.shutdown()
+        self.tick._set_pop_per_vertex(np.array(self.tick.pop_per_vertex))
+        for shm, _ in self.dict_blocks.values():
+            shm.close()
+            shm.unlink()
+        self.dict_blocks = {}
+        self.is_closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,241 @@
+import numpy as np
+from .combined_dynamics import get_combined_dynamics_arrays
+from .jit_compiled_functions import (engine_run_seasonal_dynamics,
+                                     engine_run_seasonal_dynamics_parallel,
+                                     engine_run_seasonal_dynamics_on_vertices,
+                                     engine_run_seasonal_dynamics_on_vertices_parallel,
+                                     engine_run_seasonal_dynamics_with_feeding,
+                                     engine_run_seasonal_dynamics_with_feeding_parallel,
+                                     engine_run_seasonal_dynamics_with_feeding_on_vertices,
+                                     engine_run_seasonal_dynamics_with_feeding_on_vertices_parallel)
+
+
+def get_sync_chunks(n_steps, sync_points=None):
+    """
+    Split n_steps timesteps into the chunks executed between two synchronisation points (see the method run of
+    SeasonalDynamicsEngine for the meaning of sync_points).
+
+    :param n_steps: non-negative integer, number of timesteps.
+    :param sync_points: optional, default None. Positive integer, iterable of integers, or None.
+
+    :return: list of pairs (nb_steps, is_sync_point), where nb_steps is the number of timesteps of the chunk and
+             is_sync_point is True if the callback should be called at the end of the chunk.
+    """
+    if sync_points is None:
+        set_sync_points = {n_steps}
+    elif isinstance(sync_points, (int, np.integer)):
+        set_sync_points = set(range(sync_points, n_steps + 1, sync_points))
+    else:
+        set_sync_points = set(int(step) for step in sync_points if 0 < step <= n_steps)
+
+    list_chunks = []
+    nb_steps_done = 0
+    for step in sorted(set_sync_points | {n_steps}):
+        if step == 0:
+            continue
+        list_chunks.append((step - nb_steps_done, step in set_sync_points))
+        nb_steps_done = step
+    return list_chunks
+
+
+class SeasonalSchedule:
+    """
+    Time-indexed parameters of the tick population dynamics, meant to be built once and then given to the method run
+    of the engine. The year (or any other period) is described day by day by the season each day belongs to, and each
+    season has its own mortality and transitions, in the format used by proportion_based_mortality_and_transitions.
+    All the seasons are compiled into flat arrays when the schedule is built, so that no dictionary has to be read
+    during the simulation.
+
+    A parameter that changes every day is modelled by giving each day its own season.
+
+    :param nb_stages: integer, number of stages of the tick population.
+    :param list_season_of_day: list of seasons (any hashable object, like strings), one per day of the period. The
+                               timestep t of the simulation uses the season list_season_of_day[t % period].
+    :param dict_mortality: optional, dict, default None. Keyes are seasons and values are dictionaries of mortality
+                           (see proportion_based_mortality_and_transitions). Seasons that are not in dict_mortality
+                           have no mortality.
+    :param dict_transitions: optional, dict, default None. Keyes are seasons and values are dictionaries of transitions
+                             (see proportion_based_mortality_and_transitions). Seasons that are not in dict_transitions
+                             have no transitions.
+
+    attributes:
+        - nb_stages: integer.
+        - list_seasons: list of the distinct seasons, in their order of first appearance in list_season_of_day.
+        - arr_season_of_day: 1D array of int, index in list_seasons of the season of each day of the period.
+        - arr_mortality: 4D array of float of shape (nb_seasons, 2, 2, nb_stages).
+        - arr_edge_offsets: 2D array of int of shape (nb_seasons, 5), offsets of the transitions of each season and
+                            compartment in arr_start, arr_end and arr_proportion.
+        - arr_start, arr_end, arr_proportion: 1D arrays, concatenation of the transition plans of all the seasons.
+    """
+    def __init__(self, nb_stages, list_season_of_day, dict_mortality=None, dict_transitions=None):
+        if len(list_season_of_day) == 0:
+            raise ValueError("The schedule should contain at least one day.")
+        dict_mortality = {} if dict_mortality is None else dict_mortality
+        dict_transitions = {} if dict_transitions is None else dict_transitions
+        self.nb_stages = nb_stages
+        self.list_seasons = list(dict.fromkeys(list_season_of_day))
+        for season in list(dict_mortality) + list(dict_transitions):
+            if season not in self.list_seasons:
+                raise ValueError("The season " + str(season) + " does not appear in list_season_of_day.")
+        dict_index = {season: index for index, season in enumerate(self.list_seasons)}
+        self.arr_season_of_day = np.array([dict_index[season] for season in list_season_of_day], dtype=np.int64)
+
+        self.arr_mortality = np.full((len(self.list_seasons), 2, 2, nb_stages), 0.)
+        self.arr_edge_offsets = np.full((len(self.list_seasons), 5), 0, dtype=np.int64)
+        list_start, list_end, list_proportion = [], [], []
+        nb_edges = 0
+        for index, season in enumerate(self.list_seasons):
+            arr_mortality, arr_edge_offsets, arr_start, arr_end, arr_proportion = \
+                get_combined_dynamics_arrays(nb_stages, dict_mortality.get(season), dict_transitions.get(season))
+            if (arr_mortality < 0.).any() or (arr_mortality > 1.).any():
+                raise ValueError("Mortality arrays have values that are not between 0 and 1.")
+            self.arr_mortality[index] = arr_mortality
+            self.arr_edge_offsets[index] = arr_edge_offsets + nb_edges
+            nb_edges += arr_start.shape[0]
+            list_start.append(arr_start)
+            list_end.append(arr_end)
+            list_proportion.append(arr_proportion)
+        self.arr_start = np.concatenate(list_start).astype(np.int64)
+        self.arr_end = np.concatenate(list_end).astype(np.int64)
+        self.arr_proportion = np.concatenate(list_proportion).astype(float)
+        if self.arr_start.shape[0] > 0 and max(self.arr_start.max(), self.arr_end.max()) >= nb_stages:
+            raise ValueError("Some transitions involve stages that do not exist.")
+
+    @property
+    def period(self):
+        return self.arr_season_of_day.shape[0]
+
+
+class SeasonalDynamicsEngine:
+    """
+    Building block running many timesteps of tick population dynamics at once. At each timestep, the mortality and
+    the transitions of the season of the day (given by a SeasonalSchedule) are applied to all the compartments, like
+    proportion_based_mortality_and_transitions would. The timesteps between two synchronisation points are executed
+    inside a single compiled kernel, without going back to python.
+
+    Processes that involve the hosts or the neighbouring vertices (feeding, host movement, dispersal, transmission)
+    and the recording of outputs are performed in a python callback, called by the method run at the synchronisation
+    points chosen by the user. With FeedingSingleGraph, the daily release of the fed ticks can be left to the kernel
+    (see the argument increment_feeding of run), the callback then only moving the hosts and attaching new ticks.
+
+    attributes created:
+        - engine_day: integer, number of timesteps executed by the engine so far. The season of the next timestep is
+                      the one of the day engine_day % period of the schedule.
+    """
+    def __init__(self, **kwargs):
+        self.engine_day = 0
+
+    def _sampy_debug_run_seasonal_dynamics(self, nb_steps, schedule, geographic_condition=None,
+                                           increment_feeding=False, position_attribute='position'):
+        if nb_steps < 0:
+            raise ValueError("The number of timesteps should be a non-negative integer.")
+        if schedule.nb_stages != self.pop_per_vertex.shape[3]:
+            raise ValueError("The schedule has not been built for the number of stages of the tick population.")
+        if geographic_condition is not None and \
+                geographic_condition.shape not in [(self.graph.number_vertices,), (self.pop_per_vertex.shape[2],)]:
+            raise ValueError("The geographic condition should be a 1D array with one value per vertex.")
+        if increment_feeding and not hasattr(self, '_take_released_ticks'):
+            raise ValueError("The feeding clock can only be advanced by the engine with the building block "
+                             "FeedingSingleGraph.")
+
+    def run_seasonal_dynamics(self, nb_steps, schedule, geographic_condition=None, increment_feeding=False,
+                              position_attribute='position'):
+        """
+        Apply nb_steps timesteps of seasonal mortality and transitions, in a single call to a compiled kernel. The
+        result is the same as calling proportion_based_mortality_and_transitions nb_steps times with the parameters of
+        the successive days of the schedule, starting from the day engine_day.
+
+        :param nb_steps: non-negative integer, number of timesteps.
+        :param schedule: SeasonalSchedule object.
+        :param geographic_condition: optional, 1D array of bool, default None. If given, mortality is only applied on
+                                     the vertices where the condition is True. Transitions are applied everywhere.
+                                     With several replicates, the condition can be given once for all replicates.
+        :param increment_feeding: optional, boolean, default False. If True (only with FeedingSingleGraph), the
+                                  feeding clock is advanced at the end of each timestep inside the same kernel, as
+                                  calling increment_feeding_stage after each timestep would. The hosts are assumed not
+                                  to move during those timesteps.
+        :param position_attribute: optional, string, default 'position'. Name of the column of the hosts'
+                                   df_attributes containing their position, used when increment_feeding is True.
+        """
+        self.invalidate_tick_count_cache()
+        first_day = self.engine_day % schedule.period
+        self.engine_day += nb_steps
+        if nb_steps == 0:
+            return
+
+        if geographic_condition is None:
+            geographic_condition = np.full(self.pop_per_vertex.shape[2], True)
+        else:
+            geographic_condition = self._replicate_vertex_array(geographic_condition)
+        args = (self.pop_per_vertex, schedule.arr_season_of_day, first_day, nb_steps, schedule.arr_mortality,
+                schedule.arr_edge_offsets, schedule.arr_start, schedule.arr_end, schedule.arr_proportion,
+                geographic_condition)
+
+        if increment_feeding:
+            # the vertices receiving fed ticks are marked active before the active vertices are read
+            args += self._take_released_ticks(nb_steps, position_attribute=position_attribute)
+            kernel, kernel_parallel = (engine_run_seasonal_dynamics_with_feeding,
+                                       engine_run_seasonal_dynamics_with_feeding_parallel)
+            kernel_on_vertices, kernel_on_vertices_parallel = \
+                (engine_run_seasonal_dynamics_with_feeding_on_vertices,
+                 engine_run_seasonal_dynamics_with_feeding_on_vertices_parallel)
+        else:
+            kernel, kernel_parallel = engine_run_seasonal_dynamics, engine_run_seasonal_dynamics_parallel
+            kernel_on_vertices, kernel_on_vertices_parallel = (engine_run_seasonal_dynamics_on_vertices,
+                                                               engine_run_seasonal_dynamics_on_vertices_parallel)
+
+        # mortality and transitions never bring ticks on a vertex, so the active vertices stay the same.
+        arr_active_vertices = self._get_active_vertices()
+        if arr_active_vertices is not None:
+            if self._use_parallel_kernels(arr_active_vertices.shape[0]):
+                self._run_parallel_kernel(kernel_on_vertices_parallel, *args, arr_active_vertices)
+            else:
+                kernel_on_vertices(*args, arr_active_vertices)
+        elif self._use_parallel_kernels(self.pop_per_vertex.shape[2]):
+            self._run_parallel_kernel(kernel_parallel, *args)
+        else:
+            kernel(*args)
+
+    def _sampy_debug_run(self, n_steps, schedule, sync_points=None, callback=None, geographic_condition=None,
+                         increment_feeding=False, position_attribute='position'):
+        if n_steps < 0:
+            raise ValueError("The number of timesteps should be a non-negative integer.")
+        if isinstance(sync_points, (int, np.integer)) and sync_points < 1:
+            raise ValueError("The interval between synchronisation points should be a positive integer.")
+        if sync_points is not None and callback is None:
+            raise ValueError("Synchronisation points are given without any callback.")
+        self._sampy_debug_run_seasonal_dynamics(n_steps, schedule, geographic_condition=geographic_condition,
+                                                increment_feeding=increment_feeding,
+                                                position_attribute=position_attribute)
+
+    def run(self, n_steps, schedule, sync_points=None, callback=None, geographic_condition=None,
+            increment_feeding=False, position_attribute='position'):
+        """
+        Run n_steps timesteps of seasonal tick population dynamics (see run_seasonal_dynamics), returning to python
+        only at the synchronisation points. At each of those points, callback(self, engine_day) is called, engine_day
+        being the number of timesteps executed by the engine so far. The callback is where the user moves the hosts,
+        feeds the ticks, records outputs, or changes the schedule for the next calls.
+
+        For instance, with a schedule of 365 days, run(10 * 365, schedule, sync_points=7, callback=weekly_update) runs
+        ten years of dynamics and calls weekly_update once every seven days.
+
+        With increment_feeding=True, the release of the fed ticks and the feeding clock are handled by the kernel at
+        each timestep, using the index of the agents per vertex built at the previous synchronisation point, so that
+        the callback only has to move the hosts and attach new ticks.
+
+        :param n_steps: non-negative integer, number of timesteps.
+        :param schedule: SeasonalSchedule object.
+        :param sync_points: optional, default None. Either a positive integer k, in which case the callback is called
+                            every k timesteps, or an iterable of integers between 1 and n_steps, in which case the
+                            callback is called after each of those numbers of timesteps (counted from the beginning of
+                            this call). If None, the callback is only called once at the end.
+        :param callback: optional, callable, default None. Function called at the synchronisation points.
+        :param geographic_condition: optional, 1D array of bool, default None. See run_seasonal_dynamics.
+        :param increment_feeding: optional, boolean, default False. See run_seasonal_dynamics.
+        :param position_attribute: optional, string, default 'position'. See run_seasonal_dynamics.
+        """
+        for nb_steps, is_sync_point in get_sync_chunks(n_steps, sync_points):
+            self.run_seasonal_dynamics(nb_steps, schedule, geographic_condition=geographic_condition,
+                                       increment_feeding=increment_feeding, position_attribute=position_attribute)
+            if callback is not None and is_sync_point:
+                callback(self, self.engine_day)
@@ -1,8 +1,98 @@
+import json
+import os
+import re
 import numpy as np
-from .jit_compiled_functions import feeding_release_fed_ticks
+from .base import write_file_atomically
+from .jit_compiled_functions import (feeding_release_fed_ticks,
+                                     feeding_build_vertex_agent_index,
+                                     feeding_update_vertex_agent_index,
+                                     feeding_release_fed_ticks_from_index_parallel,
+                                     feeding_release_fed_ticks_from_index_replicates,
+                                     feeding_release_fed_ticks_from_index_replicates_parallel,
+                                     feeding_attach_to_host_to_feed,
+                                     feeding_attach_to_host_to_feed_replicates,
+                                     feeding_attach_to_host_to_feed_replicates_parallel,
+                                     feeding_release_fed_ticks_through_mapping,
+                                     feeding_release_fed_ticks_through_mapping_parallel,
+                                     feeding_attach_to_host_to_feed_through_mapping,
+                                     feeding_release_fed_ticks_from_cohorts,
+                                     feeding_release_fed_ticks_from_cohorts_parallel,
+                                     feeding_attach_to_host_to_feed_in_cohorts,
+                                     feeding_move_cohorts_with_hosts)
 from numba.typed import List as NumbaList
 
 
+class HostVertexIndex:
+    """
+    CSR-like index of the agents of a host population on each vertex of a graph. The agents on the vertex of index i
+    are the agents whose row index is in arr_agent_ids[arr_offsets[i]:arr_offsets[i + 1]]. The index keeps a copy of
+    the positions it has been built from, so that it can be cheaply refreshed when only some agents moved.
+
+    attributes:
+        - nb_vertex: integer, number of vertices of the graph.
+        - arr_offsets: 1D array of int of length nb_vertex + 1.
+        - arr_agent_ids: 1D array of int, row index of the agents, sorted by vertex.
+        - arr_slot: 1D array of int, inverse of arr_agent_ids.
+        - arr_positions: 1D array of int, copy of the positions used to build the index.
+        - max_fraction_moved: float, proportion of moved agents above which the method update always rebuilds the
+                              index.
+    """
+    def __init__(self, nb_vertex, max_fraction_moved=0.05):
+        self.nb_vertex = nb_vertex
+        self.max_fraction_moved = max_fraction_moved
+        self.arr_offsets = None
+        self.arr_agent_ids = None
+        self.arr_slot = None
+        self.arr_positions = None
+
+    def rebuild(self, array_pos):
+        """
+        Build the index from scratch using a single bucket pass over the agents.
+
+        :param array_pos: 1D array of int, position of each agent.
+        """
+        self.arr_offsets, self.arr_agent_ids = feeding_build_vertex_agent_index(array_pos, self.nb_vertex)
+        self.arr_slot = np.full(self.arr_agent_ids.shape[0], 0, dtype=np.int64)
+        self.arr_slot[self.arr_agent_ids] = np.arange(self.arr_agent_ids.shape[0])
+        self.arr_positions = np.array(array_pos, dtype=np.int64)
+
+    def update(self, array_pos):
+        """
+        Make the index consistent with the given positions. If the number of agents changed, the index is rebuilt.
+        Otherwise, only the agents whose position changed are moved, unless moving them one by one is more costly
+        than rebuilding the whole index.
+
+        Moving an agent from vertex a to vertex b shifts the boundaries of the |b - a| buckets in between, so the cost
+        of the incremental update is the sum of those distances, while a rebuild costs one pass over the agents and
+        one over the vertices. On a grid of side L numbered row by row, a move along a column costs L, so that a
+        rebuild is usually cheaper as soon as a small fraction of the agents moved. The number of moved agents is
+        first compared to max_fraction_moved, so that the distances are only computed when an update is plausible.
+
+        :param array_pos: 1D array of int, position of each agent.
+        """
+        if self.arr_positions is None or self.arr_positions.shape[0] != array_pos.shape[0]:
+            self.rebuild(array_pos)
+            return
+        arr_moved = np.flatnonzero(self.arr_positions != array_pos)
+        if arr_moved.shape[0] == 0:
+            return
+        if arr_moved.shape[0] > self.max_fraction_moved * array_pos.shape[0]:
+            self.rebuild(array_pos)
+            return
+        arr_new_pos = np.array(array_pos, dtype=np.int64)
+        cost_update = np.abs(arr_new_pos[arr_moved] - self.arr_positions[arr_moved]).sum()
+        if cost_update > array_pos.shape[0] + self.nb_vertex:
+            self.rebuild(array_pos)
+            return
+        feeding_update_vertex_agent_index(self.arr_offsets, self.arr_agent_ids, self.arr_slot, arr_moved,
+                                          self.arr_positions, arr_new_pos)
+        self.arr_positions = arr_new_pos
+
+    @property
+    def count_per_vertex(self):
+        return np.diff(self.arr_offsets)
+
+
 class FeedingSingleGraph:
     """
     This building-blocks provides tool to link the population of ticks to a single or several hosts, 
@@ -11,6 +101,18 @@ class FeedingSingleGraph:
 
     add new columns to the hosts df_population
 
+    The ticks attached to each agent are stored in a circular buffer made of nb_timesteps_feeding columns per stage
+    (and as many for infected ticks), named 'tick_stage_{stage}_slot_{k}' and 'tick_stage_{stage}_slot_{k}_inf'. The
+    attribute 'feeding_ring_head' gives the slot corresponding to the first feeding timestep, so that the feeding
+    clock advances by moving this head instead of shifting columns. Storing the slots as columns of df_attributes
+    ensures that they follow the agents when those are born, die or are reordered. Use the methods
+    'get_feeding_column_name' and 'get_feeding_column' to access the ticks attached since a given number of timesteps.
+
+    With several replicates of the tick population (kwarg 'nb_replicates' of the base), all the replicates feed on
+    the same agents, which move in the same way, but each replicate has its own ticks attached to them: every column
+    of the circular buffer is then duplicated once per replicate, with the suffix '_rep_{r}'. Attaching and releasing
+    ticks is done for all the replicates by a single kernel call, each replicate using its own random stream.
+
     Mandatory kwargs:
         - dict_hosts: dictionnary whose keyes are hashable identifiers that the user chose to use
                       to identify the hosts (usually a string), and values are lists of the form
@@ -28,81 +130,930 @@ class FeedingSingleGraph:
         self.dict_hosts = dict_hosts
         self.nb_timesteps_feeding = nb_timesteps_feeding
 
+        # slot of the circular buffer containing the ticks that attached during the current timestep
+        self.feeding_ring_head = 0
+
+        # index of the agents of each host per vertex, shared by all the methods and stages
+        self.dict_host_vertex_index = {}
+
         for _, values in self.dict_hosts.items():
             host, list_stages = values
             for stage in list_stages:
-                for i in range(self.nb_timesteps_feeding):
-                    host.df_attributes['tick_stage_' + str(stage) + '_timestep_' + str(i)] = 0
-                    host.df_attributes['tick_stage_' + str(stage) + '_timestep_' + str(i) + '_inf'] = 0
+                for k in range(self.nb_timesteps_feeding):
+                    for name in self._get_slot_column_names(stage, k) + \
+                            self._get_slot_column_names(stage, k, infected=True):
+                        host.df_attributes[name] = 0
 
-    def increment_feeding_stage(self, position_attribute='position'):
+    def _get_slot_column_names(self, stage, slot, infected=False):
+        """
+        Names of the columns of a slot of the circular buffer, one per replicate of the tick population.
+
+        :return: list of strings
+        """
+        name = 'tick_stage_' + str(stage) + '_slot_' + str(slot) + ('_inf' if infected else '')
+        if self.nb_replicates == 1:
+            return [name]
+        return [name + '_rep_' + str(r) for r in range(self.nb_replicates)]
+
+    def get_feeding_column_name(self, stage, timestep, infected=False, replicate=None):
+        """
+        Name of the df_attributes column containing, for each agent, the number of ticks of the given stage that have
+        been feeding on it for the given number of timesteps.
+
+        :param stage: integer, stage of the ticks.
+        :param timestep: integer between 0 and nb_timesteps_feeding - 1. 0 corresponds to ticks that attached during
+                         the current timestep.
+        :param infected: optional, boolean, default False. If True, the column of infected ticks is returned.
+        :param replicate: optional, integer, default None. Replicate of the tick population, mandatory when there are
+                          several replicates.
+
+        :return: string
+        """
+        if not (0 <= timestep < self.nb_timesteps_feeding):
+            raise ValueError("The timestep should be between 0 and nb_timesteps_feeding - 1.")
+        if self.nb_replicates > 1 and replicate is None:
+            raise ValueError("With several replicates of the tick population, the replicate should be given.")
+        slot = (self.feeding_ring_head + timestep) % self.nb_timesteps_feeding
+        return self._get_slot_column_names(stage, slot, infected=infected)[0 if replicate is None else replicate]
+
+    def get_feeding_column(self, host_key, column_name, replicate=None):
+        """
+        Compatibility accessor returning the column of a host that would have been named 'column_name' if the feeding
+        timesteps were stored in fixed columns, that is using names of the form 'tick_stage_{stage}_timestep_{i}' or
+        'tick_stage_{stage}_timestep_{i}_inf'.
+
+        :param host_key: key of the host in dict_hosts.
+        :param column_name: string, old style column name.
+        :param replicate: optional, integer, default None. See get_feeding_column_name.
+
+        :return: 1D array of integers, number of ticks attached to each agent.
+        """
+        match = re.fullmatch(r'tick_stage_(\d+)_timestep_(\d+)(_inf)?', column_name)
+        if match is None:
+            raise ValueError("The column name should be of the form 'tick_stage_{stage}_timestep_{i}[_inf]'.")
+        column_name = self.get_feeding_column_name(int(match.group(1)), int(match.group(2)),
+                                                   infected=match.group(3) is not None, replicate=replicate)
+        return self.dict_hosts[host_key][0].df_attributes[column_name]
+
+    def get_host_vertex_index(self, host_key, position_attribute='position'):
+        """
+        Return the index of the agents of the given host on each vertex, after making sure it is consistent with the
+        current positions of the agents. The index is built once and then updated, which requires comparing the
+        positions of all the agents with the ones seen at the previous call. Methods using the index of several stages
+        should therefore get it once per call (see _get_host_vertex_indexes).
+
+        :param host_key: key of the host in dict_hosts.
+        :param position_attribute: optional, string, default 'position'. Name of the column of the hosts' 
+                                   df_attributes containing their position.
+
+        :return: HostVertexIndex object.
+        """
+        if host_key not in self.dict_host_vertex_index:
+            self.dict_host_vertex_index[host_key] = HostVertexIndex(self.graph.number_vertices)
+        host_index = self.dict_host_vertex_index[host_key]
+        host_index.update(self.dict_hosts[host_key][0].df_attributes[position_attribute])
+        return host_index
+
+    def _get_host_vertex_indexes(self, list_stage_hosts_prob, position_attribute='position'):
         """
-        todo
+        Get the index of each host appearing in list_stage_hosts_prob (see attach_to_host_to_feed) once, so that each
+        index is only brought up to date once per call, whatever the number of stages feeding on the host.
+
+        :return: dict associating to each host its HostVertexIndex object.
+        """
+        list_hosts = list(dict.fromkeys(host for item in list_stage_hosts_prob for host, _ in item[1:]))
+        return {host: self.get_host_vertex_index(host, position_attribute=position_attribute) for host in list_hosts}
+
+    def save_feeding_state(self, path, compress=False):
         """
+        Save the ticks attached to the hosts in the directory 'path'. For each host, a 2D array with one row per agent
+        is written, whose columns are the feeding columns ordered by stage, then feeding timestep, then disease status
+        (susceptible first), then replicate. This method is called by save_state, and should usually not be called
+        directly.
+
+        :param path: string, path of the directory, which should already exist.
+        :param compress: optional, boolean, default False. If True, the arrays are compressed.
+        """
+        list_hosts = []
+        for index_host, (host_key, (host, list_stages)) in enumerate(self.dict_hosts.items()):
+            list_columns = [host.df_attributes[self.get_feeding_column_name(stage, timestep, infected=infected,
+                                                                            replicate=replicate)]
+                            for stage in list_stages
+                            for timestep in range(self.nb_timesteps_feeding)
+                            for infected in [False, True]
+                            for replicate in range(self.nb_replicates)]
+            array_feeding = np.column_stack(list_columns) if list_columns else np.full((0, 0), 0, dtype=np.int64)
+            file_name = 'feeding_host_' + str(index_host)
+            if compress:
+                write_file_atomically(os.path.join(path, file_name + '.npz'),
+                                      lambda file: np.savez_compressed(file, feeding=array_feeding))
+            else:
+                write_file_atomically(os.path.join(path, file_name + '.npy'), lambda file: np.save(file, array_feeding))
+            list_hosts.append({'host_key': str(host_key), 'stages': list(list_stages),
+                               'nb_agents': array_feeding.shape[0]})
+
+        metadata = {'nb_timesteps_feeding': self.nb_timesteps_feeding, 'nb_replicates': self.nb_replicates,
+                    'compress': compress, 'hosts': list_hosts}
+        write_file_atomically(os.path.join(path, 'feeding_state.json'), lambda file: json.dump(metadata, file),
+                              mode='w')
+
+    def load_feeding_state(self, path):
+        """
+        Restore the ticks attached to the hosts saved with save_feeding_state. The host populations should contain
+        the same agents, in the same order, as when the state was saved. This method is called by load_state, and
+        should usually not be called directly.
+
+        :param path: string, path of the directory.
+        """
+        with open(os.path.join(path, 'feeding_state.json'), 'r') as file:
+            metadata = json.load(file)
+        if metadata['nb_timesteps_feeding'] != self.nb_timesteps_feeding or \
+                metadata.get('nb_replicates', 1) != self.nb_replicates or \
+                len(metadata['hosts']) != len(self.dict_hosts):
+            raise ValueError("The saved feeding state is not compatible with this object.")
+
+        self.feeding_ring_head = 0
+        self.dict_host_vertex_index = {}
+        for index_host, (host_key, (host, list_stages)) in enumerate(self.dict_hosts.items()):
+            host_metadata = metadata['hosts'][index_host]
+            if host_metadata['host_key'] != str(host_key) or host_metadata['stages'] != list(list_stages):
+                raise ValueError("The saved feeding state of host " + str(host_key) + " is not compatible with "
+                                 "this object.")
+
+            file_name = os.path.join(path, 'feeding_host_' + str(index_host))
+            if metadata['compress']:
+                with np.load(file_name + '.npz') as archive:
+                    array_feeding = archive['feeding']
+            else:
+                array_feeding = np.load(file_name + '.npy', mmap_mode='r')
+            nb_agents = host.df_attributes[self._get_slot_column_names(list_stages[0], 0)[0]].shape[0] \
+                if list_stages else 0
+            if array_feeding.shape[0] != nb_agents:
+                raise ValueError("The number of agents of host " + str(host_key) + " changed since the state was "
+                                 "saved.")
+
+            index_col = 0
+            for stage in list_stages:
+                for timestep in range(self.nb_timesteps_feeding):
+                    for infected in [False, True]:
+                        for replicate in range(self.nb_replicates):
+                            host.df_attributes[self.get_feeding_column_name(stage, timestep, infected=infected,
+                                                                            replicate=replicate)] = \
+                                np.array(array_feeding[:, index_col])
+                            index_col += 1
+
+    def _sampy_debug_increment_feeding_stage(self, position_attribute='position'):
+        nb_vertex = self.graph.number_vertices
         for host, list_stages in self.dict_hosts.values():
+            array_pos = host.df_attributes[position_attribute]
+            for stage in list_stages:
+                for disease_index, infected in [(0, False), (1, True)]:
+                    for replicate in range(self.nb_replicates):
+                        array_pop = self.pop_per_vertex[1, disease_index,
+                                                        replicate * nb_vertex:(replicate + 1) * nb_vertex]
+                        col = host.df_attributes[self.get_feeding_column_name(stage, self.nb_timesteps_feeding - 1,
+                                                                              infected=infected, replicate=replicate)]
+                        self._check_tick_count_overflow(array_pop[:, stage].astype(np.int64) +
+                                                        np.bincount(array_pos, weights=col,
+                                                                    minlength=nb_vertex).astype(np.int64))
+
+    def increment_feeding_stage(self, position_attribute='position'):
+        """
+        Advance the feeding clock by one timestep. The ticks that have been feeding for nb_timesteps_feeding
+        timesteps are released as fed ticks on the vertex of their host, and the slot they occupied in the circular
+        buffer becomes the one where the ticks attaching during the next timestep are stored.
+
+        :param position_attribute: optional, string, default 'position'. Name of the column of the hosts' 
+                                   df_attributes containing their position.
+        """
+        self.invalidate_tick_count_cache()
+        last_slot = (self.feeding_ring_head - 1) % self.nb_timesteps_feeding
+        for host_key, (host, list_stages) in self.dict_hosts.items():
+            array_pos = host.df_attributes[position_attribute]
+
+            # with several threads, the scatter of the released ticks toward the host positions is replaced by a gather
+            # on each vertex, using the index of the agents per vertex. The gather is also used to release the ticks of
+            # all the replicates at once.
+            use_parallel = self._use_parallel_kernels(array_pos.shape[0] * self.nb_replicates)
+            if use_parallel or self.nb_replicates > 1:
+                host_index = self.get_host_vertex_index(host_key, position_attribute=position_attribute)
+
+            for stage in list_stages:
+                list_names_fed = self._get_slot_column_names(stage, last_slot)
+                list_names_fed_inf = self._get_slot_column_names(stage, last_slot, infected=True)
+                if self.nb_replicates > 1:
+                    for array_pop, list_names in [(self.pop_per_vertex[1, 0], list_names_fed),
+                                                  (self.pop_per_vertex[1, 1], list_names_fed_inf)]:
+                        arr_nb_tick_fed = np.stack([host.df_attributes[name] for name in list_names])
+                        if use_parallel:
+                            self._run_parallel_kernel(feeding_release_fed_ticks_from_index_replicates_parallel,
+                                                      array_pop, host_index.arr_offsets, host_index.arr_agent_ids,
+                                                      arr_nb_tick_fed, stage)
+                        else:
+                            feeding_release_fed_ticks_from_index_replicates(array_pop, host_index.arr_offsets,
+                                                                            host_index.arr_agent_ids, arr_nb_tick_fed,
+                                                                            stage)
+                elif use_parallel:
+                    self._run_parallel_kernel(feeding_release_fed_ticks_from_index_parallel, self.pop_per_vertex_fed,
+                                              host_index.arr_offsets, host_index.arr_agent_ids,
+                                              host.df_attributes[list_names_fed[0]], stage)
+                    self._run_parallel_kernel(feeding_release_fed_ticks_from_index_parallel,
+                                              self.pop_per_vertex_fed_inf, host_index.arr_offsets,
+                                              host_index.arr_agent_ids, host.df_attributes[list_names_fed_inf[0]],
+                                              stage)
+                else:
+                    feeding_release_fed_ticks(self.pop_per_vertex_fed, array_pos,
+                                              host.df_attributes[list_names_fed[0]], stage)
+                    feeding_release_fed_ticks(self.pop_per_vertex_fed_inf, array_pos,
+                                              host.df_attributes[list_names_fed_inf[0]], stage)
+
+                if self.active_vertex_threshold is not None:
+                    for replicate, (name_fed, name_fed_inf) in enumerate(zip(list_names_fed, list_names_fed_inf)):
+                        is_releasing = (host.df_attributes[name_fed] > 0) | (host.df_attributes[name_fed_inf] > 0)
+                        self._mark_vertices_active(array_pos[is_releasing] + replicate * self.graph.number_vertices)
+
+                for name in list_names_fed + list_names_fed_inf:
+                    host.df_attributes[name] = 0
+
+        self.feeding_ring_head = last_slot
+
+    def _take_released_ticks(self, nb_steps, position_attribute='position'):
+        """
+        Advance the feeding clock by nb_steps timesteps at once, as nb_steps calls to increment_feeding_stage would,
+        but without releasing the ticks: they are returned in the order of the index of the agents per vertex of each
+        host, so that a kernel can release them vertex by vertex at the right timestep (see the method
+        run_seasonal_dynamics of SeasonalDynamicsEngine). Since no tick attaches in between, only the first
+        nb_timesteps_feeding timesteps release ticks.
+
+        :param nb_steps: positive integer, number of timesteps.
+        :param position_attribute: optional, string, default 'position'. Name of the column of the hosts'
+                                   df_attributes containing their position.
+
+        :return: tuple (arr_host_offsets, arr_entry_host, arr_entry_stage, arr_entry_offset, arr_released), see
+                 engine_run_seasonal_dynamics_with_feeding.
+        """
+        if type(self).increment_feeding_stage is not FeedingSingleGraph.increment_feeding_stage:
+            raise ValueError("The feeding clock can only be advanced by the engine with the building block "
+                             "FeedingSingleGraph.")
+        self.invalidate_tick_count_cache()
+        nb_release_steps = min(nb_steps, self.nb_timesteps_feeding)
+        list_slots = [(self.feeding_ring_head - 1 - t) % self.nb_timesteps_feeding for t in range(nb_release_steps)]
+
+        list_offsets, list_entry_host, list_entry_stage, list_entry_offset = [], [], [], []
+        # the empty first array keeps the concatenation valid when no stage feeds on the hosts
+        list_released = [np.full((nb_release_steps, 2, self.nb_replicates, 0), 0, dtype=np.int64)]
+        nb_values = 0
+        for index_host, (host_key, (host, list_stages)) in enumerate(self.dict_hosts.items()):
+            array_pos = host.df_attributes[position_attribute]
+            host_index = self.get_host_vertex_index(host_key, position_attribute=position_attribute)
+            list_offsets.append(host_index.arr_offsets)
             for stage in list_stages:
-                feeding_release_fed_ticks(self.pop_per_vertex_fed, 
-                                          host.df_attribute[position_attribute],
-                                          host.df_attributes['tick_stage_' + str(stage) + '_timestep_' + \
-                                                              str(stage + 1)],
-                                          stage)
-                feeding_release_fed_ticks(self.pop_per_vertex_fed_inf, 
-                                          host.df_attribute[position_attribute],
-                                          host.df_attributes['tick_stage_' + str(stage) + '_timestep_' + \
-                                                              str(stage + 1) + '_inf'],
-                                          stage)
-
-                for i in range(self.nb_timesteps_feeding - 1):
-                    index_sup = self.nb_timesteps_feeding - 1 - i
-
-                    host.df_attributes['tick_stage_' + str(stage) + '_timestep_' + str(index_sup)] = \
-                        host.df_attributes['tick_stage_' + str(stage) + '_timestep_' + str(index_sup - 1)]
-                    host.df_attributes['tick_stage_' + str(stage) + '_timestep_' + str(index_sup) + '_inf'] = \
-                        host.df_attributes['tick_stage_' + str(stage) + '_timestep_' + str(index_sup - 1) + '_inf']
-                    
-                host.df_attributes['tick_stage_' + str(stage) + '_timestep_0'] = 0
-                host.df_attributes['tick_stage_' + str(stage) + '_timestep_0_inf'] = 0
-                    
-    def _sampy_debug_attach_to_host_to_feed(self, list_host_stage_prob):
-        pass
+                arr_released = np.full((nb_release_steps, 2, self.nb_replicates, host_index.arr_agent_ids.shape[0]), 0,
+                                       dtype=np.int64)
+                for t, slot in enumerate(list_slots):
+                    list_names_fed = self._get_slot_column_names(stage, slot)
+                    list_names_fed_inf = self._get_slot_column_names(stage, slot, infected=True)
+                    for replicate, (name_fed, name_fed_inf) in enumerate(zip(list_names_fed, list_names_fed_inf)):
+                        col_fed = host.df_attributes[name_fed]
+                        col_fed_inf = host.df_attributes[name_fed_inf]
+                        arr_released[t, 0, replicate] = col_fed[host_index.arr_agent_ids]
+                        arr_released[t, 1, replicate] = col_fed_inf[host_index.arr_agent_ids]
+                        if self.active_vertex_threshold is not None:
+                            self._mark_vertices_active(array_pos[(col_fed > 0) | (col_fed_inf > 0)] +
+                                                       replicate * self.graph.number_vertices)
+                    for name in list_names_fed + list_names_fed_inf:
+                        host.df_attributes[name] = 0
+                list_entry_host.append(index_host)
+                list_entry_stage.append(stage)
+                list_entry_offset.append(nb_values)
+                list_released.append(arr_released)
+                nb_values += arr_released.shape[3]
+
+        self.feeding_ring_head = (self.feeding_ring_head - nb_steps) % self.nb_timesteps_feeding
+        arr_host_offsets = np.array(list_offsets, dtype=np.int64).reshape((len(list_offsets),
+                                                                           self.graph.number_vertices + 1))
+        return (arr_host_offsets, np.array(list_entry_host, dtype=np.int64),
+                np.array(list_entry_stage, dtype=np.int64), np.array(list_entry_offset, dtype=np.int64),
+                np.concatenate(list_released, axis=3))
+
+    def _sampy_debug_attach_to_host_to_feed(self, rng_seed, list_stage_hosts_prob, position_attribute='position'):
+        for item in list_stage_hosts_prob:
+            stage = item[0]
+            for host, proba in item[1:]:
+                if host not in self.dict_hosts:
+                    raise ValueError("The host " + str(host) + " is not in dict_hosts.")
+                if stage not in self.dict_hosts[host][1]:
+                    raise ValueError("The stage " + str(stage) + " does not feed on the host " + str(host) + ".")
+                if not (0. <= proba <= 1.):
+                    raise ValueError("Attachment probabilities should be floats between 0 and 1.")
 
     def attach_to_host_to_feed(self, rng_seed, list_stage_hosts_prob, position_attribute='position'):
         """
         Attach ticks to their hosts, using the followin methodology:
             1) the user gives to each pair of host and stage a probability.
-            2) this probability is the probability for a tick in this stage to attach to an host of
+            2) this probability is the probability for a tick in this stage to attach to a given agent of
                the corresponding population.
-            3) for each given cell, the number of tick that attach to a given agent is obtained using
-               a multinomial distribution using the probabilities given by the user. 
+            3) for each given cell, the number of tick that attach to each host population is drawn from a
+               multinomial distribution (if the sum of the probabilities of all the agents in the cell is bigger
+               than 1, they are normalized and all the ticks attach), and then the ticks attaching to a
+               population are uniformly split among its agents in the cell. Both draws are done using sequential
+               conditional binomials, so that no array depending on the number of agents is allocated.
+
+        The unfed ticks of the given stage, susceptible and infected, are removed from the tick population and stored
+        in the first feeding timestep of their host.
 
         IMPORTANT: this method used numba random number generation, which we try to avoid as much
-                   as possible. However, in this case it would require a lot of work, and probably
-                   the development of a function converting uniform number into a multinomial
-                   distrib. This will be changed in the future.
+                   as possible.
+
+        With several replicates, the replicate r draws its ticks from the streams derived from the r-th child of
+        np.random.SeedSequence(rng_seed).spawn(nb_replicates), so that the replicates are independent from each other
+        and the result does not depend on the number of threads.
 
         :param rng_seed: seed used inside the numba compiled function
         :param list_stage_hosts_prob: list of lists of the form [stage, (host_string_1, p1), ..., 
                                                                  (host_string_k, pk)].
+        :param position_attribute: optional, string, default 'position'. Name of the column of the hosts' 
+                                   df_attributes containing their position.
         """
-        for item in list_stage_hosts_prob:
+        self.invalidate_tick_count_cache()
+
+        # each stage (and each replicate) gets its own independent random stream
+        if self.nb_replicates == 1:
+            arr_seeds = np.random.SeedSequence(rng_seed).generate_state(len(list_stage_hosts_prob))[:, None]
+        else:
+            arr_seeds = np.column_stack([seed_sequence.generate_state(len(list_stage_hosts_prob)) for seed_sequence
+                                         in np.random.SeedSequence(rng_seed).spawn(self.nb_replicates)])
+        dict_host_index = self._get_host_vertex_indexes(list_stage_hosts_prob, position_attribute=position_attribute)
+        for index_item, item in enumerate(list_stage_hosts_prob):
             stage = item[0]
 
             # we first create the DataStructures that will be needed by the Numba Compiled function below
-            list_counts = NumbaList()
-            list_positions_argsort = NumbaList() # this is needed for technical reasons in the Numba func,
-                                                 # it is the argsort of positions of each host
+            list_offsets = NumbaList()
+            list_agent_ids = NumbaList()
             list_proba = []
             list_col_tick = NumbaList()
             list_col_tick_inf = NumbaList()
 
             # now we fill those data structure
             for host, proba in item[1:]:
-                list_counts.append(self.dict_hosts[host].count_pop_per_vertex(position_attribute=position_attribute))
-                list_positions_argsort.append(np.argsort(self.dict_hosts[host].df_attributes[position_attribute]))
+                host_index = dict_host_index[host]
+                host_df = self.dict_hosts[host][0].df_attributes
+                list_offsets.append(host_index.arr_offsets)
+                list_agent_ids.append(host_index.arr_agent_ids)
+                list_proba.append(proba)
+                if self.nb_replicates == 1:
+                    list_col_tick.append(host_df[self.get_feeding_column_name(stage, 0)])
+                    list_col_tick_inf.append(host_df[self.get_feeding_column_name(stage, 0, infected=True)])
+                else:
+                    # the columns of the replicates are stacked, so that a single kernel call processes all of them
+                    list_col_tick.append(np.stack([host_df[self.get_feeding_column_name(stage, 0, replicate=r)]
+                                                   for r in range(self.nb_replicates)]))
+                    list_col_tick_inf.append(np.stack([host_df[self.get_feeding_column_name(stage, 0, infected=True,
+                                                                                            replicate=r)]
+                                                       for r in range(self.nb_replicates)]))
+            arr_proba = np.array(list_proba, dtype=float)
+
+            if self.nb_replicates == 1:
+                feeding_attach_to_host_to_feed(arr_seeds[index_item, 0], list_offsets, list_agent_ids,
+                                               self.pop_per_vertex_unfed, self.pop_per_vertex_unfed_inf, stage,
+                                               arr_proba, list_col_tick, list_col_tick_inf)
+                continue
+
+            if self._use_parallel_kernels(self.pop_per_vertex.shape[2]):
+                self._run_parallel_kernel(feeding_attach_to_host_to_feed_replicates_parallel, arr_seeds[index_item],
+                                          list_offsets, list_agent_ids, self.pop_per_vertex_unfed,
+                                          self.pop_per_vertex_unfed_inf, stage, arr_proba, list_col_tick,
+                                          list_col_tick_inf)
+            else:
+                feeding_attach_to_host_to_feed_replicates(arr_seeds[index_item], list_offsets, list_agent_ids,
+                                                          self.pop_per_vertex_unfed, self.pop_per_vertex_unfed_inf,
+                                                          stage, arr_proba, list_col_tick, list_col_tick_inf)
+            for (host, _), col_tick, col_tick_inf in zip(item[1:], list_col_tick, list_col_tick_inf):
+                host_df = self.dict_hosts[host][0].df_attributes
+                for r in range(self.nb_replicates):
+                    host_df[self.get_feeding_column_name(stage, 0, replicate=r)] = col_tick[r]
+                    host_df[self.get_feeding_column_name(stage, 0, infected=True, replicate=r)] = col_tick_inf[r]
+
+
+class HostTickVertexMapping:
+    """
+    Mapping between the vertices of the graph on which a host population lives and the vertices of the graph of the
+    ticks. Each edge (h, t, w) of the mapping means that the agents living on the host vertex h spend a proportion w
+    of their time on the tick vertex t. The weights are normalized so that they sum to 1 on each host vertex.
+
+    The mapping is stored twice: sorted by host vertex (to know where fed ticks are released) and sorted by tick
+    vertex (to know which agents ticks can attach to). Since building it requires sorting all the edges, it should be
+    built once and reused.
+
+    :param nb_host_vertex: integer, number of vertices of the host graph.
+    :param nb_tick_vertex: integer, number of vertices of the tick graph.
+    :param arr_host_vertices: 1D array of int, host vertex of each edge.
+    :param arr_tick_vertices: 1D array of int, tick vertex of each edge.
+    :param arr_weights: optional, 1D array of positive floats, default None. Weight of each edge. If None, all the
+                        edges of a host vertex have the same weight.
+
+    attributes:
+        - nb_host_vertex, nb_tick_vertex: integers.
+        - arr_host_offsets: 1D array of int of length nb_host_vertex + 1. The edges of the host vertex h are the edges
+                            arr_host_offsets[h] to arr_host_offsets[h + 1] - 1 of the arrays sorted by host vertex.
+        - arr_host_tick_vertices, arr_host_weights: 1D arrays, tick vertex and normalized weight of each edge, sorted
+                                                   by host vertex.
+        - arr_tick_offsets: 1D array of int of length nb_tick_vertex + 1, same as arr_host_offsets for tick vertices.
+        - arr_tick_host_vertices, arr_tick_weights: 1D arrays, host vertex and normalized weight of each edge, sorted
+                                                   by tick vertex.
+        - arr_tick_cum_low, arr_tick_cum_high: 1D arrays of float, cumulative weight of the host vertex before and up
+                                               to each edge, sorted by tick vertex. Used to release ticks.
+    """
+    def __init__(self, nb_host_vertex, nb_tick_vertex, arr_host_vertices, arr_tick_vertices, arr_weights=None):
+        arr_host_vertices = np.asarray(arr_host_vertices, dtype=np.int64)
+        arr_tick_vertices = np.asarray(arr_tick_vertices, dtype=np.int64)
+        arr_weights = np.full(arr_host_vertices.shape[0], 1.) if arr_weights is None else \
+            np.asarray(arr_weights, dtype=np.float64)
+        if arr_host_vertices.shape != arr_tick_vertices.shape or arr_host_vertices.shape != arr_weights.shape:
+            raise ValueError("The arrays describing the edges of the mapping should have the same shape.")
+        if arr_host_vertices.shape[0] > 0 and \
+                (arr_host_vertices.min() < 0 or arr_host_vertices.max() >= nb_host_vertex or
+                 arr_tick_vertices.min() < 0 or arr_tick_vertices.max() >= nb_tick_vertex):
+            raise ValueError("Some edges of the mapping refer to vertices that do not exist.")
+        if (arr_weights <= 0.).any():
+            raise ValueError("The weights of the mapping should be positive.")
+        if (np.bincount(arr_host_vertices, minlength=nb_host_vertex) == 0).any():
+            raise ValueError("Each host vertex should be mapped to at least one tick vertex.")
+        self.nb_host_vertex = nb_host_vertex
+        self.nb_tick_vertex = nb_tick_vertex
+
+        order = np.lexsort((arr_tick_vertices, arr_host_vertices))
+        arr_host_sorted = arr_host_vertices[order]
+        self.arr_host_offsets = np.concatenate([[0], np.cumsum(np.bincount(arr_host_sorted,
+                                                                           minlength=nb_host_vertex))])
+        self.arr_host_tick_vertices = arr_tick_vertices[order]
+        arr_total_weight = np.bincount(arr_host_sorted, weights=arr_weights[order], minlength=nb_host_vertex)
+        self.arr_host_weights = arr_weights[order] / arr_total_weight[arr_host_sorted]
+
+        # cumulative weights of each host vertex, the last one being exactly 1 so that no tick is lost when releasing.
+        arr_cum_high = np.cumsum(self.arr_host_weights)
+        arr_cum_high -= np.repeat(np.concatenate([[0.], arr_cum_high[self.arr_host_offsets[1:-1] - 1]]),
+                                  np.diff(self.arr_host_offsets))
+        arr_cum_high = np.minimum(arr_cum_high, 1.)
+        arr_cum_high[self.arr_host_offsets[1:] - 1] = 1.
+        arr_cum_low = np.full(arr_cum_high.shape[0], 0.)
+        arr_cum_low[1:] = arr_cum_high[:-1]
+        arr_cum_low[self.arr_host_offsets[:-1]] = 0.
+
+        order_tick = np.argsort(self.arr_host_tick_vertices, kind='stable')
+        self.arr_tick_offsets = np.concatenate([[0], np.cumsum(np.bincount(self.arr_host_tick_vertices,
+                                                                           minlength=nb_tick_vertex))])
+        self.arr_tick_host_vertices = arr_host_sorted[order_tick]
+        self.arr_tick_weights = self.arr_host_weights[order_tick]
+        self.arr_tick_cum_low = arr_cum_low[order_tick]
+        self.arr_tick_cum_high = arr_cum_high[order_tick]
+
+    @classmethod
+    def from_host_vertex_of_tick_vertex(cls, nb_host_vertex, arr_host_vertex):
+        """
+        Build the mapping in the common case where each tick vertex is included in a single host vertex (for instance
+        when the tick graph is a refinement of the host graph). The fed ticks released on a host vertex are evenly
+        spread over the tick vertices it contains.
+
+        :param nb_host_vertex: integer, number of vertices of the host graph.
+        :param arr_host_vertex: 1D array of int, arr_host_vertex[t] is the host vertex containing the tick vertex t.
+
+        :return: HostTickVertexMapping object.
+        """
+        arr_host_vertex = np.asarray(arr_host_vertex, dtype=np.int64)
+        return cls(nb_host_vertex, arr_host_vertex.shape[0], arr_host_vertex, np.arange(arr_host_vertex.shape[0]))
+
+    def get_tick_vertices(self, arr_host_vertices):
+        """
+        Tick vertices mapped to at least one of the given host vertices.
+
+        :param arr_host_vertices: 1D array of int, host vertices.
+
+        :return: 1D array of bool, one value per tick vertex.
+        """
+        is_selected_host = np.full(self.nb_host_vertex, False)
+        is_selected_host[arr_host_vertices] = True
+        arr_edge_tick_vertices = np.repeat(np.arange(self.nb_tick_vertex), np.diff(self.arr_tick_offsets))
+        is_selected_tick = np.full(self.nb_tick_vertex, False)
+        is_selected_tick[arr_edge_tick_vertices[is_selected_host[self.arr_tick_host_vertices]]] = True
+        return is_selected_tick
+
+
+class FeedingMultiGraph(FeedingSingleGraph):
+    """
+    Variant of FeedingSingleGraph for host populations living on their own graphs, usually coarser than the one of the
+    ticks (for instance deer on a hexagonal grid of a few kilometers and ticks on a fine habitat grid). Each host
+    population is linked to the tick graph through a HostTickVertexMapping, built once by the user, and the positions
+    of its agents are vertices of its own graph. Ticks on a tick vertex can attach to the agents living on the host
+    vertices mapped to it, and fed ticks are released on the tick vertices mapped to the host vertex of their agent,
+    proportionally to the weights of the mapping.
+
+    Apart from that, this building block works exactly as FeedingSingleGraph, and provides the same methods.
+
+    Mandatory kwargs:
+        - dict_hosts: same as FeedingSingleGraph.
+        - nb_timesteps_feeding: same as FeedingSingleGraph.
+        - dict_vertex_mappings: dictionnary whose keyes are the keyes of dict_hosts and values HostTickVertexMapping
+                                objects.
+    """
+    def __init__(self, dict_hosts=None, nb_timesteps_feeding=None, dict_vertex_mappings=None, **kwargs):
+        if getattr(self, 'nb_replicates', 1) > 1:
+            raise ValueError("Feeding on several graphs is not available with several replicates of the tick "
+                             "population. Use FeedingSingleGraph, whose feeding columns are duplicated for each "
+                             "replicate.")
+        FeedingSingleGraph.__init__(self, dict_hosts=dict_hosts, nb_timesteps_feeding=nb_timesteps_feeding, **kwargs)
+        if dict_vertex_mappings is None:
+            raise ValueError("No 'dict_vertex_mappings' provided for tick's feeding behavior on several graphs.")
+        for host_key in self.dict_hosts:
+            if host_key not in dict_vertex_mappings:
+                raise ValueError("No vertex mapping provided for the host " + str(host_key) + ".")
+            if dict_vertex_mappings[host_key].nb_tick_vertex != self.pop_per_vertex.shape[2]:
+                raise ValueError("The vertex mapping of the host " + str(host_key) + " does not match the graph of "
+                                 "the ticks.")
+        self.dict_vertex_mappings = dict_vertex_mappings
+
+    def get_host_vertex_index(self, host_key, position_attribute='position'):
+        """
+        Same as the method of FeedingSingleGraph, the index being built on the graph of the host.
+        """
+        if host_key not in self.dict_host_vertex_index:
+            self.dict_host_vertex_index[host_key] = HostVertexIndex(self.dict_vertex_mappings[host_key].nb_host_vertex)
+        host_index = self.dict_host_vertex_index[host_key]
+        host_index.update(self.dict_hosts[host_key][0].df_attributes[position_attribute])
+        return host_index
+
+    def _sampy_debug_increment_feeding_stage(self, position_attribute='position'):
+        for host_key, (host, list_stages) in self.dict_hosts.items():
+            mapping = self.dict_vertex_mappings[host_key]
+            array_pos = host.df_attributes[position_attribute]
+            if array_pos.shape[0] > 0 and (array_pos.min() < 0 or array_pos.max() >= mapping.nb_host_vertex):
+                raise ValueError("Some agents of the host " + str(host_key) + " are not on its graph.")
+            for stage in list_stages:
+                for infected, array_pop in [(False, self.pop_per_vertex_fed), (True, self.pop_per_vertex_fed_inf)]:
+                    col = host.df_attributes[self.get_feeding_column_name(stage, self.nb_timesteps_feeding - 1,
+                                                                          infected=infected)]
+                    array_released = np.full((array_pop.shape[0], 1), 0, dtype=np.int64)
+                    feeding_release_fed_ticks_through_mapping(array_released, array_pos, col, 0,
+                                                              mapping.nb_host_vertex, mapping.arr_tick_offsets,
+                                                              mapping.arr_tick_host_vertices, mapping.arr_tick_cum_low,
+                                                              mapping.arr_tick_cum_high)
+                    self._check_tick_count_overflow(array_pop[:, stage].astype(np.int64) + array_released[:, 0])
+
+    def increment_feeding_stage(self, position_attribute='position'):
+        """
+        Same as the method of FeedingSingleGraph, the fed ticks being released through the vertex mapping of their
+        host.
+
+        :param position_attribute: optional, string, default 'position'. Name of the column of the hosts'
+                                   df_attributes containing their position.
+        """
+        self.invalidate_tick_count_cache()
+        last_slot = (self.feeding_ring_head - 1) % self.nb_timesteps_feeding
+        use_parallel = self._use_parallel_kernels(self.pop_per_vertex.shape[2])
+        for host_key, (host, list_stages) in self.dict_hosts.items():
+            mapping = self.dict_vertex_mappings[host_key]
+            array_pos = host.df_attributes[position_attribute]
+
+            for stage in list_stages:
+                name_col_fed = 'tick_stage_' + str(stage) + '_slot_' + str(last_slot)
+                col_fed = host.df_attributes[name_col_fed]
+                col_fed_inf = host.df_attributes[name_col_fed + '_inf']
+                for array_pop, col in [(self.pop_per_vertex_fed, col_fed), (self.pop_per_vertex_fed_inf, col_fed_inf)]:
+                    if use_parallel:
+                        self._run_parallel_kernel(feeding_release_fed_ticks_through_mapping_parallel, array_pop,
+                                                  array_pos, col, stage, mapping.nb_host_vertex,
+                                                  mapping.arr_tick_offsets, mapping.arr_tick_host_vertices,
+                                                  mapping.arr_tick_cum_low, mapping.arr_tick_cum_high)
+                    else:
+                        feeding_release_fed_ticks_through_mapping(array_pop, array_pos, col, stage,
+                                                                  mapping.nb_host_vertex, mapping.arr_tick_offsets,
+                                                                  mapping.arr_tick_host_vertices,
+                                                                  mapping.arr_tick_cum_low, mapping.arr_tick_cum_high)
+
+                if self.active_vertex_threshold is not None:
+                    self._mark_vertices_active(mapping.get_tick_vertices(array_pos[(col_fed > 0) | (col_fed_inf > 0)]))
+
+                host.df_attributes[name_col_fed] = 0
+                host.df_attributes[name_col_fed + '_inf'] = 0
+
+        self.feeding_ring_head = last_slot
+
+    def attach_to_host_to_feed(self, rng_seed, list_stage_hosts_prob, position_attribute='position'):
+        """
+        Same as the method of FeedingSingleGraph, except that a tick on a given tick vertex attaches to a given agent
+        living on a host vertex mapped to it with probability p * w, where p is the probability given by the user for
+        the host population and w the weight of the mapping edge.
+
+        :param rng_seed: seed used inside the numba compiled function
+        :param list_stage_hosts_prob: list of lists of the form [stage, (host_string_1, p1), ...,
+                                                                 (host_string_k, pk)].
+        :param position_attribute: optional, string, default 'position'. Name of the column of the hosts'
+                                   df_attributes containing their position.
+        """
+        self.invalidate_tick_count_cache()
+
+        # each stage gets its own independent random stream
+        arr_seeds = np.random.SeedSequence(rng_seed).generate_state(len(list_stage_hosts_prob))
+        dict_host_index = self._get_host_vertex_indexes(list_stage_hosts_prob, position_attribute=position_attribute)
+        for index_item, item in enumerate(list_stage_hosts_prob):
+            stage = item[0]
+
+            list_map_offsets = NumbaList()
+            list_map_host_vertices = NumbaList()
+            list_map_weights = NumbaList()
+            list_offsets = NumbaList()
+            list_agent_ids = NumbaList()
+            list_proba = []
+            list_col_tick = NumbaList()
+            list_col_tick_inf = NumbaList()
+
+            for host, proba in item[1:]:
+                mapping = self.dict_vertex_mappings[host]
+                host_index = dict_host_index[host]
+                host_df = self.dict_hosts[host][0].df_attributes
+                list_map_offsets.append(mapping.arr_tick_offsets)
+                list_map_host_vertices.append(mapping.arr_tick_host_vertices)
+                list_map_weights.append(mapping.arr_tick_weights)
+                list_offsets.append(host_index.arr_offsets)
+                list_agent_ids.append(host_index.arr_agent_ids)
+                list_proba.append(proba)
+                list_col_tick.append(host_df[self.get_feeding_column_name(stage, 0)])
+                list_col_tick_inf.append(host_df[self.get_feeding_column_name(stage, 0, infected=True)])
+            arr_proba = np.array(list_proba, dtype=float)
+
+            feeding_attach_to_host_to_feed_through_mapping(arr_seeds[index_item], list_map_offsets,
+                                                           list_map_host_vertices, list_map_weights, list_offsets,
+                                                           list_agent_ids, self.pop_per_vertex_unfed,
+                                                           self.pop_per_vertex_unfed_inf, stage, arr_proba,
+                                                           list_col_tick, list_col_tick_inf)
+
+
+class FeedingVertexCohorts:
+    """
+    Alternative to FeedingSingleGraph for simulations that only need per-vertex feeding totals. Instead of adding
+    2 * len(stages) * nb_timesteps_feeding columns to the df_attributes of each host, the ticks attached to a host
+    population are stored as cohorts per vertex: for each host population, a single array of shape
+    (2, nb_vertex, nb_stages_host, nb_timesteps_feeding) gives, for each disease status (susceptible, infected), each
+    vertex and each stage feeding on the host, the number of ticks attached to the agents of the population on this
+    vertex since a given number of timesteps. The last axis is a circular buffer whose head is feeding_ring_head,
+    exactly as the slots of FeedingSingleGraph. The memory used therefore depends on the number of vertices instead of
+    the number of agents, and the hosts are not modified at all.
+
+    The cohorts follow the agents in bulk (see move_feeding_cohorts). This has a cost in accuracy compared to
+    FeedingSingleGraph, which the user should be aware of:
+        - the ticks of a vertex are considered as evenly spread among the agents of the population on this vertex.
+          An agent leaving a vertex carries its share of the cohorts of the vertex (rounded down), not the ticks that
+          actually attached to it. Heterogeneous tick burdens among agents are therefore not represented;
+        - movements are detected by comparing the positions of the agents with the ones seen at the previous call,
+          which is only meaningful if the agents were neither created, killed, nor reordered in between. When the
+          number of agents changed, no movement is detected, and the cohorts of the vertices that lost agents are
+          reduced proportionally (the ticks die with their hosts). Calling move_feeding_cohorts right after the hosts
+          move, and before they reproduce or die, keeps the cohorts as accurate as possible;
+        - the per-agent information needed by HostTickTransmission is not available, so that both building blocks
+          cannot be used together.
+
+    The methods attach_to_host_to_feed and increment_feeding_stage have the same signatures and the same outputs on
+    the tick population as the ones of FeedingSingleGraph (the ticks attaching to each host population on each vertex
+    follow the same distribution), so that this building block can be used as a drop-in replacement.
+
+    Mandatory kwargs:
+        - dict_hosts: same as FeedingSingleGraph.
+        - nb_timesteps_feeding: same as FeedingSingleGraph.
+
+    attributes created:
+        - dict_feeding_cohorts: dict associating to each key of dict_hosts the 4D array of its cohorts.
+        - dict_cohort_positions: dict associating to each key of dict_hosts a copy of the positions of its agents seen
+                                 at the last call to move_feeding_cohorts.
+        - dict_cohort_host_counts: dict associating to each key of dict_hosts the number of its agents on each vertex,
+                                   according to dict_cohort_positions.
+    """
+    def __init__(self, dict_hosts=None, nb_timesteps_feeding=None, **kwargs):
+        if dict_hosts is None:
+            raise ValueError("No 'dict_hosts' provided for tick's feeding behavior.")
+        if nb_timesteps_feeding is None:
+            raise ValueError("No 'nb_timesteps_feeding' provided for tick's feeding behavior.")
+
+        if getattr(self, 'nb_replicates', 1) > 1:
+            raise ValueError("Feeding in cohorts is not available with several replicates of the tick population. Use "
+                             "FeedingSingleGraph, whose feeding columns are duplicated for each replicate.")
+
+        self.dict_hosts = dict_hosts
+        self.nb_timesteps_feeding = nb_timesteps_feeding
+        self.feeding_ring_head = 0
+
+        self.dict_feeding_cohorts = {}
+        self.dict_cohort_positions = {}
+        self.dict_cohort_host_counts = {}
+        for host_key, (host, list_stages) in self.dict_hosts.items():
+            self.dict_feeding_cohorts[host_key] = np.full((2, self.pop_per_vertex.shape[2], len(list_stages),
+                                                           self.nb_timesteps_feeding), 0, dtype=self.tick_count_dtype)
+
+    def get_feeding_cohort(self, host_key, stage, timestep, infected=False):
+        """
+        Number of ticks of the given stage that have been feeding on the agents of a host population for the given
+        number of timesteps, on each vertex.
+
+        :param host_key: key of the host in dict_hosts.
+        :param stage: integer, stage of the ticks.
+        :param timestep: integer between 0 and nb_timesteps_feeding - 1. 0 corresponds to ticks that attached during
+                         the current timestep.
+        :param infected: optional, boolean, default False. If True, the cohort of infected ticks is returned.
+
+        :return: 1D array of int, view on the cohorts with one value per vertex.
+        """
+        if not (0 <= timestep < self.nb_timesteps_feeding):
+            raise ValueError("The timestep should be between 0 and nb_timesteps_feeding - 1.")
+        slot = (self.feeding_ring_head + timestep) % self.nb_timesteps_feeding
+        index_stage = list(self.dict_hosts[host_key][1]).index(stage)
+        return self.dict_feeding_cohorts[host_key][int(infected), :, index_stage, slot]
+
+    def move_feeding_cohorts(self, position_attribute='position'):
+        """
+        Make the cohorts follow the agents that changed vertex since the last call (see the class docstring for the
+        assumptions made). This method is called at the beginning of attach_to_host_to_feed and
+        increment_feeding_stage, but can also be called by the user right after moving the hosts.
+
+        :param position_attribute: optional, string, default 'position'. Name of the column of the hosts'
+                                   df_attributes containing their position.
+        """
+        nb_vertex = self.pop_per_vertex.shape[2]
+        for host_key, (host, list_stages) in self.dict_hosts.items():
+            array_pos = host.df_attributes[position_attribute]
+            arr_old_pos = self.dict_cohort_positions.get(host_key)
+            arr_cohort = self.dict_feeding_cohorts[host_key]
+
+            if arr_old_pos is not None and arr_old_pos.shape[0] != array_pos.shape[0]:
+                # agents were created or killed, the ticks of the agents that disappeared are lost
+                arr_count_old = self.dict_cohort_host_counts[host_key]
+                arr_count_new = np.bincount(array_pos, minlength=nb_vertex)
+                arr_shrinking = np.where(arr_count_new < arr_count_old)[0]
+                arr_cohort[:, arr_shrinking] = arr_cohort[:, arr_shrinking].astype(np.int64) * \
+                    arr_count_new[arr_shrinking, None, None] // arr_count_old[arr_shrinking, None, None]
+                self.dict_cohort_host_counts[host_key] = arr_count_new
+            elif arr_old_pos is not None:
+                arr_moved = np.where(arr_old_pos != array_pos)[0]
+                if arr_moved.shape[0] > 0:
+                    arr_moved = arr_moved[np.argsort(arr_old_pos[arr_moved], kind='stable')]
+                    arr_sources = arr_old_pos[arr_moved]
+                    arr_destinations = np.array(array_pos[arr_moved], dtype=np.int64)
+                    arr_count = self.dict_cohort_host_counts[host_key]
+                    feeding_move_cohorts_with_hosts(arr_cohort, arr_count, arr_sources, arr_destinations)
+                    np.subtract.at(arr_count, arr_sources, 1)
+                    np.add.at(arr_count, arr_destinations, 1)
+            else:
+                self.dict_cohort_host_counts[host_key] = np.bincount(array_pos, minlength=nb_vertex)
+            self.dict_cohort_positions[host_key] = np.array(array_pos, dtype=np.int64)
+
+    def save_feeding_state(self, path, compress=False):
+        """
+        Save the feeding cohorts in the directory 'path', the feeding timesteps being stored in increasing order. This
+        method is called by save_state, and should usually not be called directly.
+
+        :param path: string, path of the directory, which should already exist.
+        :param compress: optional, boolean, default False. If True, the arrays are compressed.
+        """
+        arr_slots = (self.feeding_ring_head + np.arange(self.nb_timesteps_feeding)) % self.nb_timesteps_feeding
+        list_hosts = []
+        for index_host, (host_key, (host, list_stages)) in enumerate(self.dict_hosts.items()):
+            array_feeding = self.dict_feeding_cohorts[host_key][..., arr_slots]
+            file_name = 'feeding_cohorts_host_' + str(index_host)
+            if compress:
+                write_file_atomically(os.path.join(path, file_name + '.npz'),
+                                      lambda file: np.savez_compressed(file, feeding=array_feeding))
+            else:
+                write_file_atomically(os.path.join(path, file_name + '.npy'), lambda file: np.save(file, array_feeding))
+            list_hosts.append({'host_key': str(host_key), 'stages': list(list_stages),
+                               'positions_seen': host_key in self.dict_cohort_positions})
+            if host_key in self.dict_cohort_positions:
+                write_file_atomically(os.path.join(path, file_name + '_positions.npy'),
+                                      lambda file: np.save(file, self.dict_cohort_positions[host_key]))
+
+        metadata = {'nb_timesteps_feeding': self.nb_timesteps_feeding, 'compress': compress, 'cohorts': True,
+                    'hosts': list_hosts}
+        write_file_atomically(os.path.join(path, 'feeding_state.json'), lambda file: json.dump(metadata, file),
+                              mode='w')
+
+    def load_feeding_state(self, path):
+        """
+        Restore the feeding cohorts saved with save_feeding_state. This method is called by load_state, and should
+        usually not be called directly.
+
+        :param path: string, path of the directory.
+        """
+        with open(os.path.join(path, 'feeding_state.json'), 'r') as file:
+            metadata = json.load(file)
+        if not metadata.get('cohorts', False) or metadata['nb_timesteps_feeding'] != self.nb_timesteps_feeding or \
+                len(metadata['hosts']) != len(self.dict_hosts):
+            raise ValueError("The saved feeding state is not compatible with this object.")
+
+        self.feeding_ring_head = 0
+        self.dict_cohort_positions = {}
+        self.dict_cohort_host_counts = {}
+        for index_host, (host_key, (host, list_stages)) in enumerate(self.dict_hosts.items()):
+            host_metadata = metadata['hosts'][index_host]
+            if host_metadata['host_key'] != str(host_key) or host_metadata['stages'] != list(list_stages):
+                raise ValueError("The saved feeding state of host " + str(host_key) + " is not compatible with "
+                                 "this object.")
+
+            file_name = os.path.join(path, 'feeding_cohorts_host_' + str(index_host))
+            if metadata['compress']:
+                with np.load(file_name + '.npz') as archive:
+                    array_feeding = archive['feeding']
+            else:
+                array_feeding = np.load(file_name + '.npy')
+            if array_feeding.shape != self.dict_feeding_cohorts[host_key].shape:
+                raise ValueError("The saved feeding cohorts of host " + str(host_key) + " do not have the expected "
+                                 "shape.")
+            self.dict_feeding_cohorts[host_key] = np.array(array_feeding, dtype=self.tick_count_dtype)
+
+            if host_metadata['positions_seen']:
+                arr_positions = np.load(file_name + '_positions.npy')
+                self.dict_cohort_positions[host_key] = arr_positions
+                self.dict_cohort_host_counts[host_key] = np.bincount(arr_positions,
+                                                                     minlength=self.pop_per_vertex.shape[2])
+
+    def _sampy_debug_increment_feeding_stage(self, position_attribute='position'):
+        last_slot = (self.feeding_ring_head - 1) % self.nb_timesteps_feeding
+        for host_key, (host, list_stages) in self.dict_hosts.items():
+            arr_cohort = self.dict_feeding_cohorts[host_key]
+            for index_stage, stage in enumerate(list_stages):
+                for infected, array_pop in [(False, self.pop_per_vertex_fed), (True, self.pop_per_vertex_fed_inf)]:
+                    self._check_tick_count_overflow(array_pop[:, stage].astype(np.int64) +
+                                                    arr_cohort[int(infected), :, index_stage, last_slot])
+
+    def increment_feeding_stage(self, position_attribute='position'):
+        """
+        Advance the feeding clock by one timestep. The ticks that have been feeding for nb_timesteps_feeding
+        timesteps are released as fed ticks on the vertex of their cohort, and the slot they occupied in the circular
+        buffer becomes the one where the ticks attaching during the next timestep are stored.
+
+        :param position_attribute: optional, string, default 'position'. Name of the column of the hosts'
+                                   df_attributes containing their position.
+        """
+        self.invalidate_tick_count_cache()
+        self.move_feeding_cohorts(position_attribute=position_attribute)
+        last_slot = (self.feeding_ring_head - 1) % self.nb_timesteps_feeding
+        use_parallel = self._use_parallel_kernels(self.pop_per_vertex.shape[2])
+        for host_key, (host, list_stages) in self.dict_hosts.items():
+            arr_cohort = self.dict_feeding_cohorts[host_key]
+            if self.active_vertex_threshold is not None:
+                self._mark_vertices_active(arr_cohort[:, :, :, last_slot].any(axis=(0, 2)))
+            arr_stages = np.array(list_stages, dtype=np.int64)
+            for array_pop, arr_cohort_status in [(self.pop_per_vertex_fed, arr_cohort[0]),
+                                                 (self.pop_per_vertex_fed_inf, arr_cohort[1])]:
+                if use_parallel:
+                    self._run_parallel_kernel(feeding_release_fed_ticks_from_cohorts_parallel, array_pop,
+                                              arr_cohort_status, arr_stages, last_slot)
+                else:
+                    feeding_release_fed_ticks_from_cohorts(array_pop, arr_cohort_status, arr_stages, last_slot)
+
+        self.feeding_ring_head = last_slot
+
+    def _sampy_debug_attach_to_host_to_feed(self, rng_seed, list_stage_hosts_prob, position_attribute='position'):
+        for item in list_stage_hosts_prob:
+            stage = item[0]
+            for host, proba in item[1:]:
+                if host not in self.dict_hosts:
+                    raise ValueError("The host " + str(host) + " is not in dict_hosts.")
+                if stage not in self.dict_hosts[host][1]:
+                    raise ValueError("The stage " + str(stage) + " does not feed on the host " + str(host) + ".")
+                if not (0. <= proba <= 1.):
+                    raise ValueError("Attachment probabilities should be floats between 0 and 1.")
+
+    def attach_to_host_to_feed(self, rng_seed, list_stage_hosts_prob, position_attribute='position'):
+        """
+        Attach ticks to their hosts, using the same methodology as the method of FeedingSingleGraph, except that the
+        ticks attaching to a host population on a vertex are added to its cohort of the first feeding timestep instead
+        of being split between its agents.
+
+        IMPORTANT: this method used numba random number generation, which we try to avoid as much
+                   as possible.
+
+        :param rng_seed: seed used inside the numba compiled function
+        :param list_stage_hosts_prob: list of lists of the form [stage, (host_string_1, p1), ...,
+                                                                 (host_string_k, pk)].
+        :param position_attribute: optional, string, default 'position'. Name of the column of the hosts'
+                                   df_attributes containing their position.
+        """
+        self.invalidate_tick_count_cache()
+        self.move_feeding_cohorts(position_attribute=position_attribute)
+
+        # each stage gets its own independent random stream
+        arr_seeds = np.random.SeedSequence(rng_seed).generate_state(len(list_stage_hosts_prob))
+        for index_item, item in enumerate(list_stage_hosts_prob):
+            stage = item[0]
+            list_host_counts = NumbaList()
+            list_cohort = NumbaList()
+            list_stage_index = []
+            list_proba = []
+            for host, proba in item[1:]:
+                list_host_counts.append(self.dict_cohort_host_counts[host])
+                list_cohort.append(self.dict_feeding_cohorts[host])
+                list_stage_index.append(list(self.dict_hosts[host][1]).index(stage))
                 list_proba.append(proba)
-                list_col_tick.append(self.dict_hosts[host].df_attributes['tick_stage_' + str(stage) + '_timestep_0'])
-                list_col_tick_inf.append(self.dict_hosts[host].df_attributes['tick_stage_' + str(stage) + '_timestep_0_inf'])
-            arr_proba = np.array(list_proba)
-            
 
-                
+            feeding_attach_to_host_to_feed_in_cohorts(arr_seeds[index_item], list_host_counts,
+                                                      self.pop_per_vertex_unfed, self.pop_per_vertex_unfed_inf, stage,
+                                                      np.array(list_proba, dtype=float), list_cohort,
+                                                      np.array(list_stage_index, dtype=np.int64),
+                                                      self.feeding_ring_head)
@@ -1,110 +1,1126 @@
+import types
 import numba as nb
 import numpy as np
 
+# All the kernels are cached on disk (in the __pycache__ folder next to this file, or in NUMBA_CACHE_DIR if set), so
+# that only the first process using a given signature pays for its compilation. See tick.compilation to populate the
+# cache ahead of time.
 
-@nb.njit
+
+@nb.njit(cache=True)
 def base_count_tick_per_vertex_with_stages(array_pop, index_start, index_end):
     """
     Simple nested loop counting the number of tick at a given stage.
 
-    :param array_pop: 2d array of int
-    :param index_start: index on axis 2 corresponding to beginning of the stage
-    :param index_end: index on axis 2 corresponding to the end of the stage.
+    :param array_pop: 4d array of int, of shape (nb_feeding_status, nb_disease_status, nb_vertex, nb_stages). Usually
+                      a view on the compartment tensor of the tick population.
+    :param index_start: index on axis 3 corresponding to beginning of the stage
+    :param index_end: index on axis 3 corresponding to the end of the stage.
 
     :return: 1D array of int
     """
-    rv = np.full((array_pop.shape[0],), 0, dtype=int)
-    for i in range(array_pop.shape[0]):
-        for j in range(index_start, index_end + 1):
-            rv[i] += array_pop[j]
+    rv = np.full((array_pop.shape[2],), 0, dtype=np.int64)
+    for i in nb.prange(array_pop.shape[2]):
+        for f in range(array_pop.shape[0]):
+            for d in range(array_pop.shape[1]):
+                for j in range(index_start, index_end + 1):
+                    rv[i] += array_pop[f, d, i, j]
     return rv
 
 
-@nb.njit
-def stage_transition_proportion_based_transition_from_matrix(trans_matrix, 
-                                                             population_array):
-    set_output_transition = set()
-    for _ in range(trans_matrix.shape[0]):
-        for i in range(trans_matrix.shape[0]):
-            curr_index = trans_matrix.shape[0] - i - 1
+@nb.njit(cache=True)
+def base_count_tick_per_vertex_with_stages_on_vertices(array_pop, index_start, index_end, arr_vertices_index):
+    """
+    Same as base_count_tick_per_vertex_with_stages, but only the vertices in arr_vertices_index are counted. The
+    other vertices are given a count of 0.
+    """
+    rv = np.full((array_pop.shape[2],), 0, dtype=np.int64)
+    for k in nb.prange(arr_vertices_index.shape[0]):
+        i = arr_vertices_index[k]
+        for f in range(array_pop.shape[0]):
+            for d in range(array_pop.shape[1]):
+                for j in range(index_start, index_end + 1):
+                    rv[i] += array_pop[f, d, i, j]
+    return rv
 
-            # if this index has been seen already, we skip.
-            if curr_index in set_output_transition:
-                break
 
-            # now we check if this index is 'valid'. That is there is no population supposed to 
-            # "leave" curr_index status
-            is_valid = True
-            for j in range(trans_matrix.shape[0]):
-                if trans_matrix[curr_index, j] > 0. and (j not in set_output_transition):
-                    is_valid = False
+@nb.njit(cache=True)
+def base_find_active_vertices(array_pop):
+    """
+    Find the vertices that contain at least one tick.
+
+    :param array_pop: 4d array of int, compartment tensor of the tick population.
+
+    :return: 1D array of bool
+    """
+    rv = np.full((array_pop.shape[2],), False)
+    for i in nb.prange(array_pop.shape[2]):
+        for f in range(array_pop.shape[0]):
+            for d in range(array_pop.shape[1]):
+                for j in range(array_pop.shape[3]):
+                    if array_pop[f, d, i, j] > 0:
+                        rv[i] = True
+                        break
+                if rv[i]:
                     break
+            if rv[i]:
+                break
+    return rv
 
-            # if the index is valid, we make the transitions toward curr_index
-            if is_valid:
-                set_output_transition.add(curr_index)
 
-                for k in range(trans_matrix.shape[0]):
-                    if trans_matrix[k, curr_index] > 0.:
-                        for u in range(population_array.shape[0]):
-                            pop_moved = np.floor(population_array[u, k] * trans_matrix[k, curr_index])
-                            population_array[u, k] -= pop_moved
-                            population_array[u, curr_index] += pop_moved
+@nb.njit(cache=True)
+def base_aggregate_tick_counts(array_pop, arr_phase_of_stage):
+    """
+    Count, in a single pass over the compartment tensor, the number of ticks on each vertex in each phase and each
+    (feeding status, disease status) compartment.
 
-                break
+    :param array_pop: 4d array of int, compartment tensor of the tick population.
+    :param arr_phase_of_stage: 1D array of int, arr_phase_of_stage[j] is the phase (0 for egg, 1 for larva, 2 for
+                               nymph and 3 for adult) of the stage j.
+
+    :return: 4D array of int of shape (nb_vertex, 4, nb_feeding_status, nb_disease_status)
+    """
+    rv = np.full((array_pop.shape[2], 4, array_pop.shape[0], array_pop.shape[1]), 0, dtype=np.int64)
+    for i in nb.prange(array_pop.shape[2]):
+        for f in range(array_pop.shape[0]):
+            for d in range(array_pop.shape[1]):
+                for j in range(array_pop.shape[3]):
+                    rv[i, arr_phase_of_stage[j], f, d] += array_pop[f, d, i, j]
+    return rv
+
+
+@nb.njit(cache=True)
+def base_aggregate_tick_counts_on_vertices(array_pop, arr_phase_of_stage, arr_vertices_index):
+    """
+    Same as base_aggregate_tick_counts, but only the vertices in arr_vertices_index are counted. The other vertices
+    are given counts of 0.
+    """
+    rv = np.full((array_pop.shape[2], 4, array_pop.shape[0], array_pop.shape[1]), 0, dtype=np.int64)
+    for k in nb.prange(arr_vertices_index.shape[0]):
+        i = arr_vertices_index[k]
+        for f in range(array_pop.shape[0]):
+            for d in range(array_pop.shape[1]):
+                for j in range(array_pop.shape[3]):
+                    rv[i, arr_phase_of_stage[j], f, d] += array_pop[f, d, i, j]
+    return rv
+
+
+@nb.njit(cache=True)
+def stage_transition_apply_transition_plan(arr_start, arr_end, arr_proportion, population_array):
+    """
+    Apply the sparse and ordered list of transitions of a TransitionPlan to a population array.
+
+    :param arr_start: 1D array of int, starting stage of each transition.
+    :param arr_end: 1D array of int, ending stage of each transition.
+    :param arr_proportion: 1D array of float, proportion of the starting stage population that transitions.
+    :param population_array: 2D array of int of shape (nb_vertex, nb_stages)
+    """
+    for u in nb.prange(population_array.shape[0]):
+        for e in range(arr_start.shape[0]):
+            pop_moved = np.floor(population_array[u, arr_start[e]] * arr_proportion[e])
+            population_array[u, arr_start[e]] -= pop_moved
+            population_array[u, arr_end[e]] += pop_moved
+
+
+@nb.njit(cache=True)
+def stage_transition_apply_transition_plan_on_vertices(arr_start, arr_end, arr_proportion, population_array,
+                                                       arr_vertices_index):
+    """
+    Same as stage_transition_apply_transition_plan, restricted to the vertices in arr_vertices_index.
+    """
+    for k in nb.prange(arr_vertices_index.shape[0]):
+        u = arr_vertices_index[k]
+        for e in range(arr_start.shape[0]):
+            pop_moved = np.floor(population_array[u, arr_start[e]] * arr_proportion[e])
+            population_array[u, arr_start[e]] -= pop_moved
+            population_array[u, arr_end[e]] += pop_moved
 
 
-@nb.njit
+@nb.njit(cache=True)
 def mortality_proportion_based_mortality_all_graph(array_proportion, array_pop, array_vertices):
-    for i in range(array_pop.shape[0]):
+    for i in nb.prange(array_pop.shape[0]):
+        if array_vertices[i]:
+            for j in range(array_pop.shape[1]):
+                array_pop[i, j] -= np.floor(array_pop[i, j] * array_proportion[j])
+
+
+@nb.njit(cache=True)
+def mortality_proportion_based_mortality_on_vertices(array_proportion, array_pop, array_vertices,
+                                                     arr_vertices_index):
+    """
+    Same as mortality_proportion_based_mortality_all_graph, restricted to the vertices in arr_vertices_index.
+    """
+    for k in nb.prange(arr_vertices_index.shape[0]):
+        i = arr_vertices_index[k]
         if array_vertices[i]:
             for j in range(array_pop.shape[1]):
                 array_pop[i, j] -= np.floor(array_pop[i, j] * array_proportion[j])
 
 
-@nb.njit
+@nb.njit(cache=True)
+def mortality_vertex_specific_mortality(array_proportion, array_pop):
+    """
+    Kill, in place, a proportion of ticks specific to each vertex and each stage.
+
+    :param array_proportion: 2D array of float, array_proportion[i, j] is the proportion of ticks killed on the vertex
+                             i at stage j. If it has less rows than array_pop (which happens when there are several
+                             replicates), the row i of array_pop uses the row i % array_proportion.shape[0].
+    :param array_pop: 2D array of int, one compartment of the tick population.
+    """
+    for i in nb.prange(array_pop.shape[0]):
+        i_proportion = i % array_proportion.shape[0]
+        for j in range(array_pop.shape[1]):
+            array_pop[i, j] -= np.floor(array_pop[i, j] * array_proportion[i_proportion, j])
+
+
+@nb.njit(cache=True)
+def mortality_vertex_specific_mortality_on_vertices(array_proportion, array_pop, arr_vertices_index):
+    """
+    Same as mortality_vertex_specific_mortality, restricted to the vertices in arr_vertices_index.
+    """
+    for k in nb.prange(arr_vertices_index.shape[0]):
+        i = arr_vertices_index[k]
+        i_proportion = i % array_proportion.shape[0]
+        for j in range(array_pop.shape[1]):
+            array_pop[i, j] -= np.floor(array_pop[i, j] * array_proportion[i_proportion, j])
+
+
+@nb.njit(cache=True)
+def mortality_class_based_mortality(arr_class_table, arr_vertex_class, array_pop):
+    """
+    Kill, in place, a proportion of ticks depending on the class (for instance the habitat type) of each vertex.
+
+    :param arr_class_table: 2D array of float, arr_class_table[c, j] is the proportion of ticks killed at stage j on
+                            the vertices of class c.
+    :param arr_vertex_class: 1D array of int, class of each vertex. If it is shorter than array_pop (which happens
+                             when there are several replicates), the row i of array_pop uses the class
+                             arr_vertex_class[i % arr_vertex_class.shape[0]].
+    :param array_pop: 2D array of int, one compartment of the tick population.
+    """
+    for i in nb.prange(array_pop.shape[0]):
+        c = arr_vertex_class[i % arr_vertex_class.shape[0]]
+        for j in range(array_pop.shape[1]):
+            array_pop[i, j] -= np.floor(array_pop[i, j] * arr_class_table[c, j])
+
+
+@nb.njit(cache=True)
+def mortality_class_based_mortality_on_vertices(arr_class_table, arr_vertex_class, array_pop, arr_vertices_index):
+    """
+    Same as mortality_class_based_mortality, restricted to the vertices in arr_vertices_index.
+    """
+    for k in nb.prange(arr_vertices_index.shape[0]):
+        i = arr_vertices_index[k]
+        c = arr_vertex_class[i % arr_vertex_class.shape[0]]
+        for j in range(array_pop.shape[1]):
+            array_pop[i, j] -= np.floor(array_pop[i, j] * arr_class_table[c, j])
+
+
+@nb.njit(cache=True)
 def feeding_release_fed_ticks(array_pop, array_pos, array_nb_tick_fed, stage):
     for i in range(array_nb_tick_fed.shape[0]):
         array_pop[array_pos[i], stage] += array_nb_tick_fed[i]
 
 
-@nb.njit
-def feeding_attach_to_host_to_feed(rng_seed, list_counts, arr_ticks, stage, arr_proba,
-                                   list_pos_argsort, list_col_tick):
+@nb.njit(cache=True)
+def feeding_build_vertex_agent_index(array_pos, nb_vertex):
+    """
+    Bucket the agents by vertex (counting sort), giving a CSR-like index of the agents living on each vertex.
+
+    :param array_pos: 1D array of int, position of each agent.
+    :param nb_vertex: integer, number of vertices of the graph.
+
+    :return: a pair of 1D arrays of int (arr_offsets, arr_agent_ids), such that the agents on vertex i are the
+             arr_agent_ids[arr_offsets[i]:arr_offsets[i + 1]].
+    """
+    arr_offsets = np.full(nb_vertex + 1, 0, dtype=np.int64)
+    for i in range(array_pos.shape[0]):
+        arr_offsets[array_pos[i] + 1] += 1
+    for i in range(nb_vertex):
+        arr_offsets[i + 1] += arr_offsets[i]
+
+    arr_agent_ids = np.full(array_pos.shape[0], 0, dtype=np.int64)
+    arr_filled = arr_offsets[:-1].copy()
+    for i in range(array_pos.shape[0]):
+        arr_agent_ids[arr_filled[array_pos[i]]] = i
+        arr_filled[array_pos[i]] += 1
+    return arr_offsets, arr_agent_ids
+
+
+@nb.njit(cache=True)
+def feeding_update_vertex_agent_index(arr_offsets, arr_agent_ids, arr_slot, arr_moved, arr_old_pos, arr_new_pos):
+    """
+    Update in place the index built by feeding_build_vertex_agent_index when some agents moved. An agent moving from
+    vertex a to vertex b is carried through the buckets between a and b by swapping it with the last (or first) agent
+    of each bucket and shifting the bucket boundary, so that the cost of a move is O(|b - a|).
+
+    :param arr_offsets: 1D array of int, offsets of the index.
+    :param arr_agent_ids: 1D array of int, agent ids of the index.
+    :param arr_slot: 1D array of int, inverse of arr_agent_ids, that is arr_agent_ids[arr_slot[i]] == i.
+    :param arr_moved: 1D array of int, ids of the agents that moved.
+    :param arr_old_pos: 1D array of int, positions used to build the index.
+    :param arr_new_pos: 1D array of int, current positions.
+    """
+    for index_moved in range(arr_moved.shape[0]):
+        agent = arr_moved[index_moved]
+        start = arr_old_pos[agent]
+        end = arr_new_pos[agent]
+        if start < end:
+            # move the agent at the end of its bucket, then push it through the next buckets
+            for c in range(start, end):
+                other_slot = arr_offsets[c + 1] - 1
+                other = arr_agent_ids[other_slot]
+                arr_agent_ids[arr_slot[agent]] = other
+                arr_slot[other] = arr_slot[agent]
+                arr_agent_ids[other_slot] = agent
+                arr_slot[agent] = other_slot
+                arr_offsets[c + 1] -= 1
+        elif start > end:
+            # move the agent at the beginning of its bucket, then push it through the previous buckets
+            for c in range(start, end, -1):
+                other_slot = arr_offsets[c]
+                other = arr_agent_ids[other_slot]
+                arr_agent_ids[arr_slot[agent]] = other
+                arr_slot[other] = arr_slot[agent]
+                arr_agent_ids[other_slot] = agent
+                arr_slot[agent] = other_slot
+                arr_offsets[c] += 1
+
+
+@nb.njit(cache=True)
+def feeding_release_fed_ticks_from_index(array_pop, arr_offsets, arr_agent_ids, array_nb_tick_fed, stage):
+    """
+    Same as feeding_release_fed_ticks, but the scatter is replaced by a gather on each vertex using the index built
+    by feeding_build_vertex_agent_index. Each vertex is only written by the iteration processing it, so that the
+    vertices can safely be processed in parallel.
+    """
+    for u in nb.prange(arr_offsets.shape[0] - 1):
+        nb_tick_released = 0
+        for k in range(arr_offsets[u], arr_offsets[u + 1]):
+            nb_tick_released += array_nb_tick_fed[arr_agent_ids[k]]
+        array_pop[u, stage] += nb_tick_released
+
+
+@nb.njit(cache=True)
+def feeding_release_fed_ticks_from_index_replicates(array_pop, arr_offsets, arr_agent_ids, arr_nb_tick_fed, stage):
+    """
+    Same as feeding_release_fed_ticks_from_index, for several replicates of the tick population feeding on the same
+    hosts.
+
+    :param array_pop: 2D array of int, one compartment of the tick population. Its rows are the vertices of each
+                      replicate, the row i corresponding to the vertex i % nb_vertex of the replicate i // nb_vertex.
+    :param arr_offsets: 1D array of int of length nb_vertex + 1, offsets of the vertex index of the host.
+    :param arr_agent_ids: 1D array of int, agent ids of the vertex index of the host.
+    :param arr_nb_tick_fed: 2D array of int of shape (nb_replicates, nb_agents), ticks released by each agent in each
+                            replicate.
+    :param stage: integer, stage of the ticks released.
+    """
+    nb_vertex = arr_offsets.shape[0] - 1
+    for i in nb.prange(array_pop.shape[0]):
+        u = i % nb_vertex
+        r = i // nb_vertex
+        nb_tick_released = 0
+        for k in range(arr_offsets[u], arr_offsets[u + 1]):
+            nb_tick_released += arr_nb_tick_fed[r, arr_agent_ids[k]]
+        array_pop[i, stage] += nb_tick_released
+
+
+@nb.njit(cache=True)
+def feeding_split_ticks_between_hosts(nb_ticks, arr_prob_host, arr_nb_drawn):
+    """
+    Draw how many of nb_ticks ticks go to each host population using sequential conditional binomials. This is
+    equivalent to a multinomial draw where the last category (not attaching) has probability 1 - sum(arr_prob_host).
+
+    :param nb_ticks: integer, number of ticks to split.
+    :param arr_prob_host: 1D array of float, probability for a tick to go to each host population. Their sum should
+                          be lower or equal to 1.
+    :param arr_nb_drawn: 1D array of int, same shape as arr_prob_host, used as output.
+
+    :return: integer, total number of ticks attributed to a host population.
+    """
+    remaining_ticks = nb_ticks
+    remaining_prob = 1.
+    for i in range(arr_prob_host.shape[0]):
+        arr_nb_drawn[i] = 0
+        if remaining_ticks == 0 or arr_prob_host[i] <= 0.:
+            continue
+        if arr_prob_host[i] >= remaining_prob:
+            arr_nb_drawn[i] = remaining_ticks
+        else:
+            arr_nb_drawn[i] = np.random.binomial(remaining_ticks, arr_prob_host[i] / remaining_prob)
+        remaining_ticks -= arr_nb_drawn[i]
+        remaining_prob -= arr_prob_host[i]
+    return nb_ticks - remaining_ticks
+
+
+@nb.njit(cache=True)
+def feeding_split_ticks_between_agents(nb_ticks, arr_agents, index_start, nb_agents, col_tick):
+    """
+    Uniformly split nb_ticks ticks between nb_agents agents using sequential conditional binomials. The agents are
+    arr_agents[index_start:index_start + nb_agents], and the ticks are added to col_tick.
+    """
+    remaining_ticks = nb_ticks
+    for j in range(nb_agents):
+        if remaining_ticks == 0:
+            break
+        if j == nb_agents - 1:
+            nb_attached = remaining_ticks
+        else:
+            nb_attached = np.random.binomial(remaining_ticks, 1. / (nb_agents - j))
+        col_tick[arr_agents[index_start + j]] += nb_attached
+        remaining_ticks -= nb_attached
+
+
+@nb.njit(cache=True)
+def feeding_attach_to_host_to_feed(rng_seed, list_offsets, list_agent_ids, arr_ticks, arr_ticks_inf, stage,
+                                   arr_proba, list_col_tick, list_col_tick_inf):
+    """
+    Attach unfed ticks of a given stage to the agents of several host populations, vertex by vertex. See the
+    method attach_to_host_to_feed of FeedingSingleGraph for the methodology.
+
+    :param rng_seed: integer, seed of numba random number generator.
+    :param list_offsets: list of 1D arrays of int, offsets of the vertex index of each host population (see
+                         feeding_build_vertex_agent_index).
+    :param list_agent_ids: list of 1D arrays of int, agent ids of the vertex index of each host population.
+    :param arr_ticks: 2D array of int, unfed susceptible ticks.
+    :param arr_ticks_inf: 2D array of int, unfed infected ticks.
+    :param stage: integer, stage of the ticks attaching.
+    :param arr_proba: 1D array of float, probability for a tick to attach to a given agent of each host population.
+    :param list_col_tick: list of 1D arrays of int, column of each host population receiving susceptible ticks.
+    :param list_col_tick_inf: list of 1D arrays of int, column of each host population receiving infected ticks.
+    """
     np.random.seed(rng_seed)
-    nb_host_pop = len(list_counts)
-    arr_counter_host = np.full(nb_host_pop, 0, dtype=int) # used when 
+    nb_host_pop = len(list_offsets)
 
-    for pos in range(list_counts[0].shape[0]):
+    # scratch buffers, allocated once and reused on each vertex
+    arr_prob_host = np.full(nb_host_pop, 0., dtype=np.float64)
+    arr_nb_drawn = np.full(nb_host_pop, 0, dtype=np.int64)
 
-        nb_agents = 0
+    for pos in range(list_offsets[0].shape[0] - 1):
+
+        tot_prob = 0.
         for i in range(nb_host_pop):
-            nb_agents += list_counts[i][pos]
-
-        # this following section is, by itself, a good enough reason to recode a multinomial
-        # generator given that it is just made to satisfy numpy.random.multinomial
-        # construction. This will be done later.
-        arr_prob_extended = np.full(nb_agents + 1, 0., dtype=float)
-        tot_sum_prob_extended = 0.
-        counter = 0
+            arr_prob_host[i] = arr_proba[i] * (list_offsets[i][pos + 1] - list_offsets[i][pos])
+            tot_prob += arr_prob_host[i]
+
+        if tot_prob > 0.:
+            if tot_prob > 1.:
+                for i in range(nb_host_pop):
+                    arr_prob_host[i] /= tot_prob
+
+            nb_attached = feeding_split_ticks_between_hosts(np.int64(arr_ticks[pos, stage]), arr_prob_host,
+                                                            arr_nb_drawn)
+            arr_ticks[pos, stage] -= nb_attached
+            for i in range(nb_host_pop):
+                feeding_split_ticks_between_agents(arr_nb_drawn[i], list_agent_ids[i], list_offsets[i][pos],
+                                                   list_offsets[i][pos + 1] - list_offsets[i][pos],
+                                                   list_col_tick[i])
+
+            nb_attached = feeding_split_ticks_between_hosts(np.int64(arr_ticks_inf[pos, stage]), arr_prob_host,
+                                                            arr_nb_drawn)
+            arr_ticks_inf[pos, stage] -= nb_attached
+            for i in range(nb_host_pop):
+                feeding_split_ticks_between_agents(arr_nb_drawn[i], list_agent_ids[i], list_offsets[i][pos],
+                                                   list_offsets[i][pos + 1] - list_offsets[i][pos],
+                                                   list_col_tick_inf[i])
+
+
+@nb.njit(cache=True)
+def feeding_attach_to_host_to_feed_replicates(arr_seeds, list_offsets, list_agent_ids, arr_ticks, arr_ticks_inf,
+                                              stage, arr_proba, list_col_tick, list_col_tick_inf):
+    """
+    Same as feeding_attach_to_host_to_feed, for several replicates of the tick population feeding on the same hosts.
+    Each replicate has its own random stream, seeded at the beginning of its iteration, so that the result does not
+    depend on the order in which the replicates are processed.
+
+    :param arr_seeds: 1D array of int, seed of the random stream of each replicate.
+    :param arr_ticks: 3D array of int of shape (nb_replicates, nb_vertex, nb_stages), unfed susceptible ticks.
+    :param arr_ticks_inf: 3D array of int of shape (nb_replicates, nb_vertex, nb_stages), unfed infected ticks.
+    :param list_col_tick: list of 2D arrays of int of shape (nb_replicates, nb_agents), ticks of each host population
+                          attached in each replicate, receiving susceptible ticks.
+    :param list_col_tick_inf: list of 2D arrays of int of shape (nb_replicates, nb_agents), same for infected ticks.
+    """
+    for r in nb.prange(arr_seeds.shape[0]):
+        list_col_tick_replicate = nb.typed.List()
+        list_col_tick_inf_replicate = nb.typed.List()
+        for i in range(len(list_col_tick)):
+            list_col_tick_replicate.append(list_col_tick[i][r])
+            list_col_tick_inf_replicate.append(list_col_tick_inf[i][r])
+        feeding_attach_to_host_to_feed(arr_seeds[r], list_offsets, list_agent_ids, arr_ticks[r], arr_ticks_inf[r],
+                                       stage, arr_proba, list_col_tick_replicate, list_col_tick_inf_replicate)
+
+
+@nb.njit(cache=True)
+def feeding_release_fed_ticks_through_mapping(array_pop, array_pos, array_nb_tick_fed, stage, nb_host_vertex,
+                                              arr_tick_offsets, arr_tick_host_vertices, arr_tick_cum_low,
+                                              arr_tick_cum_high):
+    """
+    Release fed ticks from agents living on a host graph into the vertices of the tick graph. The ticks released on
+    each host vertex are first summed, and then split between the tick vertices mapped to it using cumulative
+    rounding: the share of the mapping edge e is round(n * cum_high[e]) - round(n * cum_low[e]), where cum_low and
+    cum_high are the cumulative weights of the edges of the host vertex before and after e. Since the cumulative
+    weights of a host vertex go from 0 to exactly 1, all the ticks are released. Each tick vertex is then written by a
+    single iteration, so that they can be processed in parallel.
+
+    :param array_pop: 2D array of int, fed compartment of the tick population.
+    :param array_pos: 1D array of int, position of each agent on the host graph.
+    :param array_nb_tick_fed: 1D array of int, number of ticks released by each agent.
+    :param stage: integer, stage of the ticks.
+    :param nb_host_vertex: integer, number of vertices of the host graph.
+    :param arr_tick_offsets: 1D array of int, offsets of the mapping edges sorted by tick vertex.
+    :param arr_tick_host_vertices: 1D array of int, host vertex of each mapping edge.
+    :param arr_tick_cum_low: 1D array of float, cumulative weight of the host vertex before each edge.
+    :param arr_tick_cum_high: 1D array of float, cumulative weight of the host vertex up to each edge.
+    """
+    arr_released = np.full(nb_host_vertex, 0, dtype=np.int64)
+    for i in range(array_pos.shape[0]):
+        arr_released[array_pos[i]] += array_nb_tick_fed[i]
+
+    for t in nb.prange(arr_tick_offsets.shape[0] - 1):
+        nb_tick_released = 0
+        for e in range(arr_tick_offsets[t], arr_tick_offsets[t + 1]):
+            n = arr_released[arr_tick_host_vertices[e]]
+            if n > 0:
+                nb_tick_released += np.int64(np.floor(n * arr_tick_cum_high[e] + 0.5)) - \
+                    np.int64(np.floor(n * arr_tick_cum_low[e] + 0.5))
+        array_pop[t, stage] += nb_tick_released
+
+
+@nb.njit(cache=True)
+def feeding_attach_to_host_to_feed_through_mapping(rng_seed, list_map_offsets, list_map_host_vertices,
+                                                   list_map_weights, list_offsets, list_agent_ids, arr_ticks,
+                                                   arr_ticks_inf, stage, arr_proba, list_col_tick, list_col_tick_inf):
+    """
+    Same as feeding_attach_to_host_to_feed, but the host populations live on their own graphs. On each tick vertex,
+    the candidates are the pairs (host population, host vertex) mapped to it, and a tick attaches to a given agent
+    of the host population i living on the host vertex h with probability arr_proba[i] * w, where w is the weight of
+    the mapping edge between h and the tick vertex.
+
+    :param rng_seed: integer, seed of numba random number generator.
+    :param list_map_offsets: list of 1D arrays of int, for each host population, offsets of the mapping edges sorted
+                             by tick vertex.
+    :param list_map_host_vertices: list of 1D arrays of int, host vertex of each mapping edge.
+    :param list_map_weights: list of 1D arrays of float, weight of each mapping edge.
+    :param list_offsets: list of 1D arrays of int, offsets of the vertex index of each host population, on its graph.
+    :param list_agent_ids: list of 1D arrays of int, agent ids of the vertex index of each host population.
+    :param arr_ticks: 2D array of int, unfed susceptible ticks.
+    :param arr_ticks_inf: 2D array of int, unfed infected ticks.
+    :param stage: integer, stage of the ticks attaching.
+    :param arr_proba: 1D array of float, probability for a tick to attach to a given agent of each host population.
+    :param list_col_tick: list of 1D arrays of int, column of each host population receiving susceptible ticks.
+    :param list_col_tick_inf: list of 1D arrays of int, column of each host population receiving infected ticks.
+    """
+    np.random.seed(rng_seed)
+    nb_host_pop = len(list_offsets)
+
+    # scratch buffers, allocated once and reused on each vertex
+    max_nb_candidates = 0
+    for t in range(arr_ticks.shape[0]):
+        nb_candidates = 0
         for i in range(nb_host_pop):
-            tot_sum_prob_extended =+ arr_proba[i] * list_counts[i][pos]
-            for _ in range(list_counts[i][pos]):
-                arr_prob_extended[counter] = arr_proba[i]
-                counter += 1
-        
-        if tot_sum_prob_extended > 1.:
-            arr_prob_extended /= tot_sum_prob_extended
-        else:
-            arr_prob_extended[-1] = 1. - tot_sum_prob_extended
-        
-        multinom_sample = np.random.multinomial(arr_ticks[pos, stage], arr_prob_extended)
+            nb_candidates += list_map_offsets[i][t + 1] - list_map_offsets[i][t]
+        max_nb_candidates = max(max_nb_candidates, nb_candidates)
+    arr_candidate_pop = np.full(max_nb_candidates, 0, dtype=np.int64)
+    arr_candidate_vertex = np.full(max_nb_candidates, 0, dtype=np.int64)
+    arr_prob_candidate = np.full(max_nb_candidates, 0., dtype=np.float64)
+    arr_nb_drawn = np.full(max_nb_candidates, 0, dtype=np.int64)
+
+    for t in range(arr_ticks.shape[0]):
+        if arr_ticks[t, stage] == 0 and arr_ticks_inf[t, stage] == 0:
+            continue
+
+        nb_candidates = 0
+        tot_prob = 0.
+        for i in range(nb_host_pop):
+            for e in range(list_map_offsets[i][t], list_map_offsets[i][t + 1]):
+                h = list_map_host_vertices[i][e]
+                nb_agents = list_offsets[i][h + 1] - list_offsets[i][h]
+                if nb_agents > 0:
+                    arr_candidate_pop[nb_candidates] = i
+                    arr_candidate_vertex[nb_candidates] = h
+                    arr_prob_candidate[nb_candidates] = arr_proba[i] * list_map_weights[i][e] * nb_agents
+                    tot_prob += arr_prob_candidate[nb_candidates]
+                    nb_candidates += 1
+
+        if tot_prob > 0.:
+            if tot_prob > 1.:
+                for k in range(nb_candidates):
+                    arr_prob_candidate[k] /= tot_prob
+
+            nb_attached = feeding_split_ticks_between_hosts(np.int64(arr_ticks[t, stage]),
+                                                            arr_prob_candidate[:nb_candidates],
+                                                            arr_nb_drawn[:nb_candidates])
+            arr_ticks[t, stage] -= nb_attached
+            for k in range(nb_candidates):
+                i, h = arr_candidate_pop[k], arr_candidate_vertex[k]
+                feeding_split_ticks_between_agents(arr_nb_drawn[k], list_agent_ids[i], list_offsets[i][h],
+                                                   list_offsets[i][h + 1] - list_offsets[i][h], list_col_tick[i])
+
+            nb_attached = feeding_split_ticks_between_hosts(np.int64(arr_ticks_inf[t, stage]),
+                                                            arr_prob_candidate[:nb_candidates],
+                                                            arr_nb_drawn[:nb_candidates])
+            arr_ticks_inf[t, stage] -= nb_attached
+            for k in range(nb_candidates):
+                i, h = arr_candidate_pop[k], arr_candidate_vertex[k]
+                feeding_split_ticks_between_agents(arr_nb_drawn[k], list_agent_ids[i], list_offsets[i][h],
+                                                   list_offsets[i][h + 1] - list_offsets[i][h],
+                                                   list_col_tick_inf[i])
+
+
+@nb.njit(cache=True)
+def feeding_release_fed_ticks_from_cohorts(array_pop, arr_cohort, arr_stages, slot):
+    """
+    Release the ticks of one slot of the feeding cohorts of a host population on the vertex they belong to, and empty
+    this slot.
+
+    :param array_pop: 2D array of int, fed compartment of the tick population.
+    :param arr_cohort: 3D array of int of shape (nb_vertex, nb_stages_host, nb_timesteps_feeding), feeding cohorts of
+                       one disease status of the host population.
+    :param arr_stages: 1D array of int, stage of the ticks corresponding to each index of the second axis of
+                       arr_cohort.
+    :param slot: integer, slot of the circular buffer to release.
+    """
+    for u in nb.prange(arr_cohort.shape[0]):
+        for k in range(arr_stages.shape[0]):
+            array_pop[u, arr_stages[k]] += arr_cohort[u, k, slot]
+            arr_cohort[u, k, slot] = 0
 
-        counter = 0
+
+@nb.njit(cache=True)
+def feeding_attach_to_host_to_feed_in_cohorts(rng_seed, list_host_counts, arr_ticks, arr_ticks_inf, stage, arr_proba,
+                                              list_cohort, arr_stage_index, slot):
+    """
+    Attach unfed ticks of a given stage to several host populations, vertex by vertex, and store them in the feeding
+    cohorts of the host populations. The number of ticks attaching to each host population on a vertex is drawn as in
+    feeding_attach_to_host_to_feed, but the ticks are not split between the agents.
+
+    :param rng_seed: integer, seed of numba random number generator.
+    :param list_host_counts: list of 1D arrays of int, number of agents of each host population on each vertex.
+    :param arr_ticks: 2D array of int, unfed susceptible ticks.
+    :param arr_ticks_inf: 2D array of int, unfed infected ticks.
+    :param stage: integer, stage of the ticks attaching.
+    :param arr_proba: 1D array of float, probability for a tick to attach to a given agent of each host population.
+    :param list_cohort: list of 4D arrays of int of shape (2, nb_vertex, nb_stages_host, nb_timesteps_feeding),
+                        feeding cohorts of each host population. The first axis is the disease status (susceptible,
+                        infected).
+    :param arr_stage_index: 1D array of int, index of the stage on the third axis of the cohorts of each host
+                            population.
+    :param slot: integer, slot of the circular buffer receiving the ticks.
+    """
+    np.random.seed(rng_seed)
+    nb_host_pop = len(list_host_counts)
+
+    # scratch buffers, allocated once and reused on each vertex
+    arr_prob_host = np.full(nb_host_pop, 0., dtype=np.float64)
+    arr_nb_drawn = np.full(nb_host_pop, 0, dtype=np.int64)
+
+    for pos in range(list_host_counts[0].shape[0]):
+
+        tot_prob = 0.
         for i in range(nb_host_pop):
-            for j in range(list_counts[i][pos]):
-                list_col_tick[i][list_pos_argsort[i][arr_counter_host[i]]] += multinom_sample[counter]
-                arr_ticks[pos, stage] -= multinom_sample[counter]
-                counter += 1
-                arr_counter_host[i] += 1
+            arr_prob_host[i] = arr_proba[i] * list_host_counts[i][pos]
+            tot_prob += arr_prob_host[i]
+
+        if tot_prob > 0.:
+            if tot_prob > 1.:
+                for i in range(nb_host_pop):
+                    arr_prob_host[i] /= tot_prob
+
+            nb_attached = feeding_split_ticks_between_hosts(np.int64(arr_ticks[pos, stage]), arr_prob_host,
+                                                            arr_nb_drawn)
+            arr_ticks[pos, stage] -= nb_attached
+            for i in range(nb_host_pop):
+                list_cohort[i][0, pos, arr_stage_index[i], slot] += arr_nb_drawn[i]
+
+            nb_attached = feeding_split_ticks_between_hosts(np.int64(arr_ticks_inf[pos, stage]), arr_prob_host,
+                                                            arr_nb_drawn)
+            arr_ticks_inf[pos, stage] -= nb_attached
+            for i in range(nb_host_pop):
+                list_cohort[i][1, pos, arr_stage_index[i], slot] += arr_nb_drawn[i]
+
+
+@nb.njit(cache=True)
+def feeding_move_cohorts_with_hosts(arr_cohort, arr_count_before, arr_sources, arr_destinations):
+    """
+    Move the feeding cohorts of a host population along with the agents that changed vertex. The ticks of a vertex
+    are assumed to be evenly spread among the agents it contained before the movement: if k of its n agents leave,
+    they carry floor(c * k / n) of each cohort c, split between them using cumulative rounding so that no tick is
+    created nor lost.
+
+    :param arr_cohort: 4D array of int of shape (2, nb_vertex, nb_stages_host, nb_timesteps_feeding).
+    :param arr_count_before: 1D array of int, number of agents on each vertex before the movement.
+    :param arr_sources: 1D array of int, sorted, previous vertex of each agent that moved.
+    :param arr_destinations: 1D array of int, new vertex of each agent that moved.
+    """
+    nb_moved = arr_sources.shape[0]
+    arr_carried = np.full((nb_moved, arr_cohort.shape[0], arr_cohort.shape[2], arr_cohort.shape[3]), 0,
+                          dtype=np.int64)
+
+    # first pass: remove the ticks carried away from their source vertex
+    start = 0
+    while start < nb_moved:
+        u = arr_sources[start]
+        end = start
+        while end < nb_moved and arr_sources[end] == u:
+            end += 1
+        n = np.int64(arr_count_before[u])
+        for d in range(arr_cohort.shape[0]):
+            for k in range(arr_cohort.shape[2]):
+                for t in range(arr_cohort.shape[3]):
+                    c = np.int64(arr_cohort[d, u, k, t])
+                    if c == 0:
+                        continue
+                    previous = 0
+                    for j in range(start, end):
+                        cumulated = (c * (j - start + 1)) // n
+                        arr_carried[j, d, k, t] = cumulated - previous
+                        previous = cumulated
+                    arr_cohort[d, u, k, t] -= previous
+        start = end
+
+    # second pass: add them on their destination vertex
+    for j in range(nb_moved):
+        v = arr_destinations[j]
+        for d in range(arr_cohort.shape[0]):
+            for k in range(arr_cohort.shape[2]):
+                for t in range(arr_cohort.shape[3]):
+                    arr_cohort[d, v, k, t] += arr_carried[j, d, k, t]
+
+
+@nb.njit(cache=True)
+def transmission_hosts_and_feeding_ticks(rng_seed, arr_host_infected, list_col_tick, list_col_tick_inf,
+                                         p_host_to_tick, p_tick_to_host, p_cofeeding):
+    """
+    Pathogen transmission between the agents of a host population and the ticks feeding on them. For each agent, the
+    number of infected ticks attached to it and its infection status are read before any transmission, so that the
+    three processes below do not depend on the order in which they are applied:
+        - host to tick: each susceptible tick feeding on an infected agent becomes infected with probability
+          p_host_to_tick.
+        - co-feeding: each susceptible tick becomes infected with probability p_cofeeding for each infected tick
+          feeding on the same agent.
+        - tick to host: a susceptible agent becomes infected with probability p_tick_to_host for each infected tick
+          feeding on it.
+
+    :param rng_seed: integer, seed of numba random number generator.
+    :param arr_host_infected: 1D array of bool, infection status of each agent. Modified in place.
+    :param list_col_tick: list of 1D arrays of int, columns of the host population containing susceptible feeding
+                          ticks (one column per stage and feeding timestep).
+    :param list_col_tick_inf: list of 1D arrays of int, corresponding columns of infected feeding ticks.
+    :param p_host_to_tick: float, probability of host to tick transmission.
+    :param p_tick_to_host: float, probability of tick to host transmission, per infected tick.
+    :param p_cofeeding: float, probability of co-feeding transmission, per infected tick.
+
+    :return: a pair of integers (number of agents infected, number of ticks infected)
+    """
+    np.random.seed(rng_seed)
+    nb_hosts_infected = 0
+    nb_ticks_infected = 0
+    for a in range(arr_host_infected.shape[0]):
+        nb_inf = 0
+        for c in range(len(list_col_tick_inf)):
+            nb_inf += list_col_tick_inf[c][a]
+        host_is_infected = arr_host_infected[a]
+
+        # probability for a susceptible tick feeding on this agent to become infected
+        proba_tick = p_host_to_tick if host_is_infected else 0.
+        if nb_inf > 0 and p_cofeeding > 0.:
+            proba_tick = 1. - (1. - proba_tick) * (1. - p_cofeeding) ** nb_inf
+        if proba_tick > 0.:
+            for c in range(len(list_col_tick)):
+                if list_col_tick[c][a] > 0:
+                    nb_new = np.random.binomial(list_col_tick[c][a], proba_tick)
+                    list_col_tick[c][a] -= nb_new
+                    list_col_tick_inf[c][a] += nb_new
+                    nb_ticks_infected += nb_new
+
+        if not host_is_infected and nb_inf > 0 and p_tick_to_host > 0.:
+            if np.random.random() < 1. - (1. - p_tick_to_host) ** nb_inf:
+                arr_host_infected[a] = True
+                nb_hosts_infected += 1
+    return nb_hosts_infected, nb_ticks_infected
+
+
+@nb.njit(cache=True)
+def combined_dynamics_mortality_and_transitions(array_pop, arr_mortality, arr_edge_offsets, arr_start, arr_end,
+                                                arr_proportion, array_vertices):
+    """
+    Apply, in a single pass over the vertices, the proportion based mortality and then the proportion based
+    transitions to all the (feeding status, disease status) compartments of the tick population.
+
+    :param array_pop: 4D array of int of shape (2, 2, nb_vertex, nb_stages), compartment tensor of the ticks.
+    :param arr_mortality: 3D array of float of shape (2, 2, nb_stages), proportion of ticks killed in each stage.
+    :param arr_edge_offsets: 1D array of int of length 5. The transitions of the compartment (f, d) are the ones
+                             whose index is between arr_edge_offsets[2 * f + d] (included) and
+                             arr_edge_offsets[2 * f + d + 1] (excluded).
+    :param arr_start: 1D array of int, concatenation of the starting stages of the transition plans.
+    :param arr_end: 1D array of int, concatenation of the ending stages of the transition plans.
+    :param arr_proportion: 1D array of float, concatenation of the proportions of the transition plans.
+    :param array_vertices: 1D array of bool, vertices on which the mortality is applied.
+    """
+    for u in nb.prange(array_pop.shape[2]):
+        for f in range(array_pop.shape[0]):
+            for d in range(array_pop.shape[1]):
+                if array_vertices[u]:
+                    for j in range(array_pop.shape[3]):
+                        array_pop[f, d, u, j] -= np.floor(array_pop[f, d, u, j] * arr_mortality[f, d, j])
+
+                for e in range(arr_edge_offsets[2 * f + d], arr_edge_offsets[2 * f + d + 1]):
+                    pop_moved = np.floor(array_pop[f, d, u, arr_start[e]] * arr_proportion[e])
+                    array_pop[f, d, u, arr_start[e]] -= pop_moved
+                    array_pop[f, d, u, arr_end[e]] += pop_moved
+
+
+@nb.njit(cache=True)
+def combined_dynamics_mortality_and_transitions_on_vertices(array_pop, arr_mortality, arr_edge_offsets, arr_start,
+                                                            arr_end, arr_proportion, array_vertices,
+                                                            arr_vertices_index):
+    """
+    Same as combined_dynamics_mortality_and_transitions, restricted to the vertices in arr_vertices_index.
+    """
+    for index_vertex in nb.prange(arr_vertices_index.shape[0]):
+        u = arr_vertices_index[index_vertex]
+        for f in range(array_pop.shape[0]):
+            for d in range(array_pop.shape[1]):
+                if array_vertices[u]:
+                    for j in range(array_pop.shape[3]):
+                        array_pop[f, d, u, j] -= np.floor(array_pop[f, d, u, j] * arr_mortality[f, d, j])
+
+                for e in range(arr_edge_offsets[2 * f + d], arr_edge_offsets[2 * f + d + 1]):
+                    pop_moved = np.floor(array_pop[f, d, u, arr_start[e]] * arr_proportion[e])
+                    array_pop[f, d, u, arr_start[e]] -= pop_moved
+                    array_pop[f, d, u, arr_end[e]] += pop_moved
+
+
+@nb.njit(cache=True)
+def engine_run_seasonal_dynamics(array_pop, arr_season_of_day, first_day, nb_steps, arr_mortality, arr_edge_offsets,
+                                 arr_start, arr_end, arr_proportion, array_vertices):
+    """
+    Apply nb_steps consecutive timesteps of combined mortality and transitions to the tick population, the parameters
+    of each timestep being those of its season. Since those processes do not move ticks between vertices, each vertex
+    is brought forward by nb_steps timesteps before moving to the next one.
+
+    :param array_pop: 4D array of int of shape (2, 2, nb_vertex, nb_stages), compartment tensor of the ticks.
+    :param arr_season_of_day: 1D array of int, arr_season_of_day[t] is the index of the season of the day t of the
+                              period.
+    :param first_day: integer, day of the period of the first timestep.
+    :param nb_steps: integer, number of timesteps to apply.
+    :param arr_mortality: 4D array of float of shape (nb_seasons, 2, 2, nb_stages), proportion of ticks killed.
+    :param arr_edge_offsets: 2D array of int of shape (nb_seasons, 5). The transitions of the compartment (f, d) during
+                             the season s are the ones whose index is between arr_edge_offsets[s, 2 * f + d] (included)
+                             and arr_edge_offsets[s, 2 * f + d + 1] (excluded).
+    :param arr_start: 1D array of int, concatenation of the starting stages of the transition plans.
+    :param arr_end: 1D array of int, concatenation of the ending stages of the transition plans.
+    :param arr_proportion: 1D array of float, concatenation of the proportions of the transition plans.
+    :param array_vertices: 1D array of bool, vertices on which the mortality is applied.
+    """
+    period = arr_season_of_day.shape[0]
+    for u in nb.prange(array_pop.shape[2]):
+        for t in range(nb_steps):
+            s = arr_season_of_day[(first_day + t) % period]
+            for f in range(array_pop.shape[0]):
+                for d in range(array_pop.shape[1]):
+                    if array_vertices[u]:
+                        for j in range(array_pop.shape[3]):
+                            array_pop[f, d, u, j] -= np.floor(array_pop[f, d, u, j] * arr_mortality[s, f, d, j])
+
+                    for e in range(arr_edge_offsets[s, 2 * f + d], arr_edge_offsets[s, 2 * f + d + 1]):
+                        pop_moved = np.floor(array_pop[f, d, u, arr_start[e]] * arr_proportion[e])
+                        array_pop[f, d, u, arr_start[e]] -= pop_moved
+                        array_pop[f, d, u, arr_end[e]] += pop_moved
+
+
+@nb.njit(cache=True)
+def engine_run_seasonal_dynamics_on_vertices(array_pop, arr_season_of_day, first_day, nb_steps, arr_mortality,
+                                             arr_edge_offsets, arr_start, arr_end, arr_proportion, array_vertices,
+                                             arr_vertices_index):
+    """
+    Same as engine_run_seasonal_dynamics, restricted to the vertices in arr_vertices_index.
+    """
+    period = arr_season_of_day.shape[0]
+    for index_vertex in nb.prange(arr_vertices_index.shape[0]):
+        u = arr_vertices_index[index_vertex]
+        for t in range(nb_steps):
+            s = arr_season_of_day[(first_day + t) % period]
+            for f in range(array_pop.shape[0]):
+                for d in range(array_pop.shape[1]):
+                    if array_vertices[u]:
+                        for j in range(array_pop.shape[3]):
+                            array_pop[f, d, u, j] -= np.floor(array_pop[f, d, u, j] * arr_mortality[s, f, d, j])
+
+                    for e in range(arr_edge_offsets[s, 2 * f + d], arr_edge_offsets[s, 2 * f + d + 1]):
+                        pop_moved = np.floor(array_pop[f, d, u, arr_start[e]] * arr_proportion[e])
+                        array_pop[f, d, u, arr_start[e]] -= pop_moved
+                        array_pop[f, d, u, arr_end[e]] += pop_moved
+
+
+@nb.njit(cache=True)
+def engine_run_seasonal_dynamics_with_feeding(array_pop, arr_season_of_day, first_day, nb_steps, arr_mortality,
+                                              arr_edge_offsets, arr_start, arr_end, arr_proportion, array_vertices,
+                                              arr_host_offsets, arr_entry_host, arr_entry_stage, arr_entry_offset,
+                                              arr_released):
+    """
+    Same as engine_run_seasonal_dynamics, the feeding clock being advanced at the end of each timestep: the ticks
+    released by the agents on a vertex are added to its fed ticks, gathered using the index of the agents per vertex
+    of each host (see feeding_build_vertex_agent_index). Each vertex is only written by the iteration processing it.
+
+    :param arr_host_offsets: 2D array of int of shape (nb_hosts, nb_vertex + 1), offsets of the index of the agents
+                             per vertex of each host.
+    :param arr_entry_host: 1D array of int, host of each pair (host, stage) releasing ticks.
+    :param arr_entry_stage: 1D array of int, stage of each pair (host, stage) releasing ticks.
+    :param arr_entry_offset: 1D array of int, position of the ticks of each pair (host, stage) in the last axis of
+                             arr_released.
+    :param arr_released: 4D array of int of shape (nb_release_steps, 2, nb_replicates, nb_values). For the pair e, the
+                         number of ticks of disease status d released in replicate r at the end of the timestep t by
+                         the k-th agent of the index of its host is arr_released[t, d, r, arr_entry_offset[e] + k].
+                         No tick is released after nb_release_steps timesteps.
+    """
+    period = arr_season_of_day.shape[0]
+    nb_vertex = arr_host_offsets.shape[1] - 1
+    for u in nb.prange(array_pop.shape[2]):
+        v = u % nb_vertex
+        r = u // nb_vertex
+        for t in range(nb_steps):
+            s = arr_season_of_day[(first_day + t) % period]
+            for f in range(array_pop.shape[0]):
+                for d in range(array_pop.shape[1]):
+                    if array_vertices[u]:
+                        for j in range(array_pop.shape[3]):
+                            array_pop[f, d, u, j] -= np.floor(array_pop[f, d, u, j] * arr_mortality[s, f, d, j])
+
+                    for e in range(arr_edge_offsets[s, 2 * f + d], arr_edge_offsets[s, 2 * f + d + 1]):
+                        pop_moved = np.floor(array_pop[f, d, u, arr_start[e]] * arr_proportion[e])
+                        array_pop[f, d, u, arr_start[e]] -= pop_moved
+                        array_pop[f, d, u, arr_end[e]] += pop_moved
+
+            if t < arr_released.shape[0]:
+                for e in range(arr_entry_host.shape[0]):
+                    h = arr_entry_host[e]
+                    for d in range(array_pop.shape[1]):
+                        nb_tick_released = 0
+                        for k in range(arr_entry_offset[e] + arr_host_offsets[h, v],
+                                       arr_entry_offset[e] + arr_host_offsets[h, v + 1]):
+                            nb_tick_released += arr_released[t, d, r, k]
+                        array_pop[1, d, u, arr_entry_stage[e]] += nb_tick_released
+
+
+@nb.njit(cache=True)
+def engine_run_seasonal_dynamics_with_feeding_on_vertices(array_pop, arr_season_of_day, first_day, nb_steps,
+                                                          arr_mortality, arr_edge_offsets, arr_start, arr_end,
+                                                          arr_proportion, array_vertices, arr_host_offsets,
+                                                          arr_entry_host, arr_entry_stage, arr_entry_offset,
+                                                          arr_released, arr_vertices_index):
+    """
+    Same as engine_run_seasonal_dynamics_with_feeding, restricted to the vertices in arr_vertices_index.
+    """
+    period = arr_season_of_day.shape[0]
+    nb_vertex = arr_host_offsets.shape[1] - 1
+    for index_vertex in nb.prange(arr_vertices_index.shape[0]):
+        u = arr_vertices_index[index_vertex]
+        v = u % nb_vertex
+        r = u // nb_vertex
+        for t in range(nb_steps):
+            s = arr_season_of_day[(first_day + t) % period]
+            for f in range(array_pop.shape[0]):
+                for d in range(array_pop.shape[1]):
+                    if array_vertices[u]:
+                        for j in range(array_pop.shape[3]):
+                            array_pop[f, d, u, j] -= np.floor(array_pop[f, d, u, j] * arr_mortality[s, f, d, j])
+
+                    for e in range(arr_edge_offsets[s, 2 * f + d], arr_edge_offsets[s, 2 * f + d + 1]):
+                        pop_moved = np.floor(array_pop[f, d, u, arr_start[e]] * arr_proportion[e])
+                        array_pop[f, d, u, arr_start[e]] -= pop_moved
+                        array_pop[f, d, u, arr_end[e]] += pop_moved
+
+            if t < arr_released.shape[0]:
+                for e in range(arr_entry_host.shape[0]):
+                    h = arr_entry_host[e]
+                    for d in range(array_pop.shape[1]):
+                        nb_tick_released = 0
+                        for k in range(arr_entry_offset[e] + arr_host_offsets[h, v],
+                                       arr_entry_offset[e] + arr_host_offsets[h, v + 1]):
+                            nb_tick_released += arr_released[t, d, r, k]
+                        array_pop[1, d, u, arr_entry_stage[e]] += nb_tick_released
+
+
+@nb.njit(cache=True)
+def dispersal_compute_outflow(array_pop, array_proportion, arr_offsets, nb_vertex, arr_outflow):
+    """
+    First pass of the dispersal: remove from each vertex the ticks leaving it, and store their number in arr_outflow.
+    Ticks never leave a vertex without neighbours. Every row of arr_outflow is overwritten, so that it can be reused
+    between calls without being reset.
+
+    :param array_pop: 2D array of int, one compartment of the tick population. Its rows are the vertices of each
+                      replicate, the row i corresponding to the vertex i % nb_vertex.
+    :param array_proportion: 1D array of float, proportion of ticks leaving their vertex at each stage.
+    :param arr_offsets: 1D array of int, offsets of the CSR adjacency of the graph.
+    :param nb_vertex: integer, number of vertices of the graph.
+    :param arr_outflow: 2D array of int, same shape as array_pop, filled with the number of ticks leaving each cell.
+    """
+    for i in nb.prange(array_pop.shape[0]):
+        v = i % nb_vertex
+        if arr_offsets[v + 1] > arr_offsets[v]:
+            for j in range(array_pop.shape[1]):
+                out = np.floor(array_pop[i, j] * array_proportion[j])
+                array_pop[i, j] -= out
+                arr_outflow[i, j] = out
+        else:
+            for j in range(array_pop.shape[1]):
+                arr_outflow[i, j] = 0
+
+
+@nb.njit(cache=True)
+def dispersal_compute_outflow_on_vertices(array_pop, array_proportion, arr_offsets, nb_vertex, arr_outflow,
+                                          arr_vertices_index):
+    """
+    Same as dispersal_compute_outflow, restricted to the rows in arr_vertices_index. Only those rows of arr_outflow are
+    overwritten, the other ones being expected to be 0.
+    """
+    for k in nb.prange(arr_vertices_index.shape[0]):
+        i = arr_vertices_index[k]
+        v = i % nb_vertex
+        if arr_offsets[v + 1] > arr_offsets[v]:
+            for j in range(array_pop.shape[1]):
+                out = np.floor(array_pop[i, j] * array_proportion[j])
+                array_pop[i, j] -= out
+                arr_outflow[i, j] = out
+        else:
+            for j in range(array_pop.shape[1]):
+                arr_outflow[i, j] = 0
+
+
+@nb.njit(cache=True)
+def dispersal_gather_inflow(array_pop, arr_outflow, arr_offsets, arr_in_offsets, arr_in_sources, arr_in_edges,
+                            nb_vertex, rotation):
+    """
+    Second pass of the dispersal: each vertex collects its share of the ticks leaving its neighbours. The ticks leaving
+    a vertex of degree n are split evenly between its neighbours, and the remaining (outflow % n) ticks are given one by
+    one to the neighbours starting from the one of rank 'rotation' modulo n, so that the total number of ticks is
+    conserved. Since each vertex only writes in its own row, the vertices can be processed in parallel.
+
+    :param array_pop: 2D array of int, one compartment of the tick population.
+    :param arr_outflow: 2D array of int, output of dispersal_compute_outflow.
+    :param arr_offsets: 1D array of int, offsets of the CSR adjacency of the graph.
+    :param arr_in_offsets: 1D array of int, offsets of the transposed CSR adjacency.
+    :param arr_in_sources: 1D array of int, for each edge of the transposed adjacency, the vertex it comes from.
+    :param arr_in_edges: 1D array of int, for each edge of the transposed adjacency, its index in the CSR adjacency.
+    :param nb_vertex: integer, number of vertices of the graph.
+    :param rotation: integer, rank of the first neighbour receiving the remaining ticks.
+    """
+    for i in nb.prange(array_pop.shape[0]):
+        v = i % nb_vertex
+        row_start = i - v
+        for e in range(arr_in_offsets[v], arr_in_offsets[v + 1]):
+            u = arr_in_sources[e]
+            degree = arr_offsets[u + 1] - arr_offsets[u]
+            rank = (arr_in_edges[e] - arr_offsets[u] - rotation) % degree
+            for j in range(array_pop.shape[1]):
+                out = arr_outflow[row_start + u, j]
+                if out > 0:
+                    array_pop[i, j] += out // degree + (1 if rank < out % degree else 0)
+
+
+@nb.njit(cache=True)
+def dispersal_gather_inflow_on_vertices(array_pop, arr_outflow, arr_offsets, arr_in_offsets, arr_in_sources,
+                                        arr_in_edges, nb_vertex, rotation, arr_vertices_index):
+    """
+    Same as dispersal_gather_inflow, restricted to the rows in arr_vertices_index.
+    """
+    for k in nb.prange(arr_vertices_index.shape[0]):
+        i = arr_vertices_index[k]
+        v = i % nb_vertex
+        row_start = i - v
+        for e in range(arr_in_offsets[v], arr_in_offsets[v + 1]):
+            u = arr_in_sources[e]
+            degree = arr_offsets[u + 1] - arr_offsets[u]
+            rank = (arr_in_edges[e] - arr_offsets[u] - rotation) % degree
+            for j in range(array_pop.shape[1]):
+                out = arr_outflow[row_start + u, j]
+                if out > 0:
+                    array_pop[i, j] += out // degree + (1 if rank < out % degree else 0)
+
+
+@nb.njit(cache=True)
+def dispersal_find_reachable_vertices(arr_offsets, arr_neighbours, nb_vertex, arr_vertices_index, nb_rows):
+    """
+    Find the rows of the tick population that are either in arr_vertices_index or neighbours of one of them.
+
+    :return: 1D array of int, sorted rows.
+    """
+    is_reachable = np.full(nb_rows, False)
+    for k in range(arr_vertices_index.shape[0]):
+        i = arr_vertices_index[k]
+        v = i % nb_vertex
+        is_reachable[i] = True
+        for e in range(arr_offsets[v], arr_offsets[v + 1]):
+            is_reachable[i - v + arr_neighbours[e]] = True
+    return np.where(is_reachable)[0]
+
+
+# Multi-threaded versions of the kernels whose outer loop is over the vertices. Outside a parallel function, prange
+# behaves as range, so that the serial and parallel versions share the same code. Each twin is compiled from a copy of
+# the python function with its own qualified name, so that the serial and parallel versions do not share the same
+# cache files.
+def _make_parallel_twin(kernel):
+    py_func = kernel.py_func
+    twin = types.FunctionType(py_func.__code__, py_func.__globals__, py_func.__name__ + '_parallel',
+                              py_func.__defaults__, py_func.__closure__)
+    twin.__qualname__ = py_func.__qualname__ + '_parallel'
+    twin.__doc__ = py_func.__doc__
+    return nb.njit(parallel=True, cache=True)(twin)
+
 
+base_count_tick_per_vertex_with_stages_parallel = \
+    _make_parallel_twin(base_count_tick_per_vertex_with_stages)
+stage_transition_apply_transition_plan_parallel = \
+    _make_parallel_twin(stage_transition_apply_transition_plan)
+mortality_proportion_based_mortality_all_graph_parallel = \
+    _make_parallel_twin(mortality_proportion_based_mortality_all_graph)
+feeding_release_fed_ticks_from_index_parallel = \
+    _make_parallel_twin(feeding_release_fed_ticks_from_index)
+combined_dynamics_mortality_and_transitions_parallel = \
+    _make_parallel_twin(combined_dynamics_mortality_and_transitions)
+base_count_tick_per_vertex_with_stages_on_vertices_parallel = \
+    _make_parallel_twin(base_count_tick_per_vertex_with_stages_on_vertices)
+base_find_active_vertices_parallel = \
+    _make_parallel_twin(base_find_active_vertices)
+stage_transition_apply_transition_plan_on_vertices_parallel = \
+    _make_parallel_twin(stage_transition_apply_transition_plan_on_vertices)
+mortality_proportion_based_mortality_on_vertices_parallel = \
+    _make_parallel_twin(mortality_proportion_based_mortality_on_vertices)
+combined_dynamics_mortality_and_transitions_on_vertices_parallel = \
+    _make_parallel_twin(combined_dynamics_mortality_and_transitions_on_vertices)
+base_aggregate_tick_counts_parallel = \
+    _make_parallel_twin(base_aggregate_tick_counts)
+base_aggregate_tick_counts_on_vertices_parallel = \
+    _make_parallel_twin(base_aggregate_tick_counts_on_vertices)
+mortality_vertex_specific_mortality_parallel = \
+    _make_parallel_twin(mortality_vertex_specific_mortality)
+mortality_vertex_specific_mortality_on_vertices_parallel = \
+    _make_parallel_twin(mortality_vertex_specific_mortality_on_vertices)
+mortality_class_based_mortality_parallel = \
+    _make_parallel_twin(mortality_class_based_mortality)
+mortality_class_based_mortality_on_vertices_parallel = \
+    _make_parallel_twin(mortality_class_based_mortality_on_vertices)
+dispersal_compute_outflow_parallel = \
+    _make_parallel_twin(dispersal_compute_outflow)
+dispersal_compute_outflow_on_vertices_parallel = \
+    _make_parallel_twin(dispersal_compute_outflow_on_vertices)
+dispersal_gather_inflow_parallel = \
+    _make_parallel_twin(dispersal_gather_inflow)
+dispersal_gather_inflow_on_vertices_parallel = \
+    _make_parallel_twin(dispersal_gather_inflow_on_vertices)
+feeding_release_fed_ticks_through_mapping_parallel = \
+    _make_parallel_twin(feeding_release_fed_ticks_through_mapping)
+feeding_release_fed_ticks_from_index_replicates_parallel = \
+    _make_parallel_twin(feeding_release_fed_ticks_from_index_replicates)
+feeding_attach_to_host_to_feed_replicates_parallel = \
+    _make_parallel_twin(feeding_attach_to_host_to_feed_replicates)
+engine_run_seasonal_dynamics_parallel = \
+    _make_parallel_twin(engine_run_seasonal_dynamics)
+engine_run_seasonal_dynamics_on_vertices_parallel = \
+    _make_parallel_twin(engine_run_seasonal_dynamics_on_vertices)
+engine_run_seasonal_dynamics_with_feeding_parallel = \
+    _make_parallel_twin(engine_run_seasonal_dynamics_with_feeding)
+engine_run_seasonal_dynamics_with_feeding_on_vertices_parallel = \
+    _make_parallel_twin(engine_run_seasonal_dynamics_with_feeding_on_vertices)
+feeding_release_fed_ticks_from_cohorts_parallel = \
+    _make_parallel_twin(feeding_release_fed_ticks_from_cohorts)
@@ -1,5 +1,16 @@
 import numpy as np
-from jit_compiled_functions import mortality_proportion_based_mortality_all_graph
+from .jit_compiled_functions import (mortality_proportion_based_mortality_all_graph,
+                                     mortality_proportion_based_mortality_all_graph_parallel,
+                                     mortality_proportion_based_mortality_on_vertices,
+                                     mortality_proportion_based_mortality_on_vertices_parallel,
+                                     mortality_vertex_specific_mortality,
+                                     mortality_vertex_specific_mortality_parallel,
+                                     mortality_vertex_specific_mortality_on_vertices,
+                                     mortality_vertex_specific_mortality_on_vertices_parallel,
+                                     mortality_class_based_mortality,
+                                     mortality_class_based_mortality_parallel,
+                                     mortality_class_based_mortality_on_vertices,
+                                     mortality_class_based_mortality_on_vertices_parallel)
 
 
 class ProportionBasedTickMortality:
@@ -20,43 +31,112 @@ class ProportionBasedTickMortality:
         :param feeding_status: string, either 'fed' or 'unfed'.
         :param disease_status: string, either 'infected' of 'susceptible'. 
         :param array_proportion: 1D array of float, each between 0 and 1
-        :param geographic_condition: optional, 1D array of bool, default None.
+        :param geographic_condition: optional, 1D array of bool, default None. If there are several replicates, the
+                                     condition can either be given once for all replicates (one value per vertex)
+                                     or for each replicate (nb_replicates * nb_vertex values).
         """
+        self.invalidate_tick_count_cache()
+        array_pop = self._get_compartment(feeding_status, disease_status)
         if geographic_condition is None:
-            geographic_condition = np.full(self.pop_per_vertex_fed.shape[0], True)
-
-        if feeding_status == 'fed' and disease_status == 'susceptible':
-            mortality_proportion_based_mortality_all_graph(array_proportion, 
-                                                           self.pop_per_vertex_fed,
-                                                           geographic_condition)
-        elif feeding_status == 'unfed' and disease_status == 'susceptible':
-            mortality_proportion_based_mortality_all_graph(array_proportion, 
-                                                           self.pop_per_vertex_unfed,
-                                                           geographic_condition)
-        elif feeding_status == 'fed' and disease_status == 'infected':
-            mortality_proportion_based_mortality_all_graph(array_proportion, 
-                                                           self.pop_per_vertex_fed_inf,
-                                                           geographic_condition)
-        elif feeding_status == 'unfed' and disease_status == 'infected':
-            mortality_proportion_based_mortality_all_graph(array_proportion, 
-                                                           self.pop_per_vertex_unfed_inf,
-                                                           geographic_condition)
+            geographic_condition = np.full(array_pop.shape[0], True)
         else:
-            raise ValueError("Not valid choice of feeding status and disease status.")
+            geographic_condition = self._replicate_vertex_array(geographic_condition)
+
+        arr_active_vertices = self._get_active_vertices()
+        if arr_active_vertices is not None:
+            if self._use_parallel_kernels(arr_active_vertices.shape[0]):
+                self._run_parallel_kernel(mortality_proportion_based_mortality_on_vertices_parallel, array_proportion,
+                                          array_pop, geographic_condition, arr_active_vertices)
+            else:
+                mortality_proportion_based_mortality_on_vertices(array_proportion, array_pop, geographic_condition,
+                                                                 arr_active_vertices)
+        elif self._use_parallel_kernels(geographic_condition.shape[0]):
+            self._run_parallel_kernel(mortality_proportion_based_mortality_all_graph_parallel, array_proportion,
+                                      array_pop, geographic_condition)
+        else:
+            mortality_proportion_based_mortality_all_graph(array_proportion, array_pop, geographic_condition)
+
+    def _sampy_debug_vertex_specific_proportion_based_mortality(self, feeding_status, disease_status,
+                                                                array_proportion):
+        if len(array_proportion.shape) != 2 or array_proportion.shape[1] != self.pop_per_vertex.shape[3] or \
+                array_proportion.shape[0] not in [self.graph.number_vertices, self.pop_per_vertex.shape[2]]:
+            raise ValueError("The array of proportions should have shape (nb_vertex, nb_stages).")
+        if (array_proportion < 0.).any() or (array_proportion > 1.).any():
+            raise ValueError("The array of proportions has values that are not between 0 and 1.")
 
     def vertex_specific_proportion_based_mortality(self, feeding_status, disease_status, array_proportion):
         """
-        Kill a user defined proportion of ticks per stage per vertex.
+        Kill a user defined proportion of ticks per stage per vertex. The ticks are killed in place, without
+        allocating any array of the size of the population. If the proportions only depend on a few classes of
+        vertices (for instance habitat types), consider using class_based_mortality, which needs far less memory.
 
         :param feeding_status: string, either 'fed' or 'unfed'.
         :param disease_status: string, either 'infected' of 'susceptible'. 
-        :param array_proportion: 2D array of float, each between 0 and 1.
+        :param array_proportion: 2D array of float, each between 0 and 1, of shape (nb_vertex, nb_stages). If there are
+                                 several replicates, the proportions can either be given once for all replicates or
+                                 for each replicate (shape (nb_replicates * nb_vertex, nb_stages)).
+        """
+        self.invalidate_tick_count_cache()
+        array_pop = self._get_compartment(feeding_status, disease_status)
+
+        arr_active_vertices = self._get_active_vertices()
+        if arr_active_vertices is not None:
+            if self._use_parallel_kernels(arr_active_vertices.shape[0]):
+                self._run_parallel_kernel(mortality_vertex_specific_mortality_on_vertices_parallel, array_proportion,
+                                          array_pop, arr_active_vertices)
+            else:
+                mortality_vertex_specific_mortality_on_vertices(array_proportion, array_pop, arr_active_vertices)
+        elif self._use_parallel_kernels(array_pop.shape[0]):
+            self._run_parallel_kernel(mortality_vertex_specific_mortality_parallel, array_proportion, array_pop)
+        else:
+            mortality_vertex_specific_mortality(array_proportion, array_pop)
+
+    def _sampy_debug_class_based_mortality(self, feeding_status, disease_status, array_vertex_class,
+                                           table_proportion):
+        if len(table_proportion.shape) != 2 or table_proportion.shape[1] != self.pop_per_vertex.shape[3]:
+            raise ValueError("The table of proportions should have shape (nb_classes, nb_stages).")
+        if (table_proportion < 0.).any() or (table_proportion > 1.).any():
+            raise ValueError("The table of proportions has values that are not between 0 and 1.")
+        if len(array_vertex_class.shape) != 1 or \
+                array_vertex_class.shape[0] not in [self.graph.number_vertices, self.pop_per_vertex.shape[2]]:
+            raise ValueError("The array of vertex classes should be a 1D array with one value per vertex.")
+        if not np.issubdtype(array_vertex_class.dtype, np.integer):
+            raise ValueError("The array of vertex classes should be an array of integers.")
+        if array_vertex_class.shape[0] > 0 and \
+                (array_vertex_class.min() < 0 or array_vertex_class.max() >= table_proportion.shape[0]):
+            raise ValueError("Some vertex classes do not correspond to a row of the table of proportions.")
+
+    def class_based_mortality(self, feeding_status, disease_status, array_vertex_class, table_proportion):
         """
-        if feeding_status == 'fed' and disease_status == 'susceptible':
-            self.pop_per_vertex_fed -= np.floor(self.pop_per_vertex_fed * array_proportion)
-        elif feeding_status == 'unfed' and disease_status == 'susceptible':
-            self.pop_per_vertex_unfed -= np.floor(self.pop_per_vertex_unfed * array_proportion)
-        elif feeding_status == 'fed' and disease_status == 'infected':
-            self.pop_per_vertex_fed_inf -= np.floor(self.pop_per_vertex_fed_inf * array_proportion)
-        elif feeding_status == 'unfed' and disease_status == 'infected':
-            self.pop_per_vertex_unfed_inf -= np.floor(self.pop_per_vertex_unfed_inf * array_proportion)
+        Kill a proportion of ticks per stage that depends on the class of each vertex, for instance its habitat type.
+        Instead of a dense (nb_vertex, nb_stages) array of proportions, the user gives the class of each vertex and a
+        small table of proportions per class. Seasonal variations are handled by keeping one table per season and
+        passing the right one at each timestep, the array of classes staying the same.
+
+        The array of classes can use a small integer dtype (like np.uint8 or np.int16) to save memory.
+
+        :param feeding_status: string, either 'fed' or 'unfed'.
+        :param disease_status: string, either 'infected' of 'susceptible'.
+        :param array_vertex_class: 1D array of non-negative integers, array_vertex_class[i] is the class of the vertex
+                                   of index i. If there are several replicates, the classes can either be given once
+                                   for all replicates or for each replicate.
+        :param table_proportion: 2D array of float, each between 0 and 1, of shape (nb_classes, nb_stages).
+                                 table_proportion[c, j] is the proportion of ticks at stage j killed on the vertices
+                                 of class c.
+        """
+        self.invalidate_tick_count_cache()
+        array_pop = self._get_compartment(feeding_status, disease_status)
+
+        arr_active_vertices = self._get_active_vertices()
+        if arr_active_vertices is not None:
+            if self._use_parallel_kernels(arr_active_vertices.shape[0]):
+                self._run_parallel_kernel(mortality_class_based_mortality_on_vertices_parallel, table_proportion,
+                                          array_vertex_class, array_pop, arr_active_vertices)
+            else:
+                mortality_class_based_mortality_on_vertices(table_proportion, array_vertex_class, array_pop,
+                                                            arr_active_vertices)
+        elif self._use_parallel_kernels(array_pop.shape[0]):
+            self._run_parallel_kernel(mortality_class_based_mortality_parallel, table_proportion, array_vertex_class,
+                                      array_pop)
+        else:
+            mortality_class_based_mortality(table_proportion, array_vertex_class, array_pop)
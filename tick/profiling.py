@@ -0,0 +1,205 @@
+import json
+import sys
+import time
+import numba as nb
+import numpy as np
+
+
+# public methods of the tick building blocks that are instrumented. For the methods that modify the tick population,
+# the value is the pair of names of the counters in which the ticks removed from (resp. added to) the tick population
+# are recorded. It is None for the methods that never modify the tick population.
+PROFILED_METHODS = {
+    'count_tick_per_vertex': None,
+    'get_tick_count_tensor': None,
+    'update_active_vertices': None,
+    'proportion_based_mortality_all_graph': ('ticks_killed', None),
+    'vertex_specific_proportion_based_mortality': ('ticks_killed', None),
+    'class_based_mortality': ('ticks_killed', None),
+    'proportion_based_transitions': (None, None),
+    'proportion_based_transition_from_matrix': (None, None),
+    'proportion_based_transition_from_plan': (None, None),
+    'proportion_based_mortality_and_transitions': ('ticks_killed', None),
+    'run_seasonal_dynamics': ('ticks_killed', None),
+    'proportion_based_dispersal': (None, None),
+    'transmission_between_hosts_and_ticks': None,
+    'attach_to_host_to_feed': ('ticks_attached', None),
+    'increment_feeding_stage': (None, 'ticks_released'),
+    'move_feeding_cohorts': None,
+}
+
+# modules of the tick package whose numba kernels are instrumented
+PROFILED_MODULES = ['tick.base', 'tick.mortality', 'tick.stage_transition', 'tick.combined_dynamics', 'tick.feeding',
+                    'tick.dispersal', 'tick.transmission', 'tick.engine']
+
+# instance currently recording the kernel calls, there can only be one at a time since kernels are module globals.
+_kernel_profiler = None
+_original_kernels = {}
+
+COUNTER_NAMES = ['nb_calls', 'wall_time', 'vertices_touched', 'ticks_moved', 'ticks_killed', 'ticks_attached',
+                 'ticks_released']
+
+
+def _new_record():
+    return {name: 0 for name in COUNTER_NAMES}
+
+
+def _make_timed_kernel(name, kernel):
+    def timed_kernel(*args, **kwargs):
+        start = time.perf_counter()
+        rv = kernel(*args, **kwargs)
+        if _kernel_profiler is not None:
+            record = _kernel_profiler._get_profiling_record('kernel.' + name)
+            record['nb_calls'] += 1
+            record['wall_time'] += time.perf_counter() - start
+        return rv
+    timed_kernel.py_func = kernel.py_func
+    return timed_kernel
+
+
+class TickInstrumentation:
+    """
+    Building block providing an opt-in instrumentation of the tick building blocks. When profiling is enabled, each
+    call to one of the methods listed in PROFILED_METHODS records its wall time and the number of vertices it
+    iterated over. Optionally, the numba kernels called by those methods are timed as well, and the flows of ticks
+    caused by the methods modifying the tick population (ticks moved between stages, killed, attached to hosts or
+    released from them) are recorded.
+
+    When profiling is disabled (the default), the methods and kernels are not wrapped at all, so that there is no
+    overhead.
+
+    Note that the time of a method calling another instrumented method includes the time of the latter. The flows of
+    ticks are net figures, computed from the change of the total number of ticks in each (compartment, stage) over
+    the call: 'ticks_moved' is the number of ticks gained by the (compartment, stage) pairs that gained ticks, minus
+    the ticks added to the population. It is therefore a lower bound of the actual number of ticks moved, since ticks
+    going through several stages during the same call, or leaving and entering the same stage, are not counted.
+    Computing those figures requires two passes over the whole population per call, so the wall time of the cheap
+    methods is inflated when they are tracked.
+
+    attributes created:
+        - is_profiling: bool, True if profiling is enabled.
+        - profiling_history: list of dict, one per timestep closed with end_profiling_timestep. Each dict associates
+                             to the name of each instrumented method or kernel a dict of counters (see COUNTER_NAMES).
+        - profiling_current_timestep: dict, records of the timestep in progress.
+        - profiling_tracks_tick_flows: bool, True if the flows of ticks are recorded.
+    """
+    def __init__(self, **kwargs):
+        self.is_profiling = False
+        self.profiling_tracks_tick_flows = False
+        self.profiling_history = []
+        self.profiling_current_timestep = {}
+
+    def _get_profiling_record(self, name):
+        if name not in self.profiling_current_timestep:
+            self.profiling_current_timestep[name] = _new_record()
+        return self.profiling_current_timestep[name]
+
+    def _make_profiled_method(self, name, method):
+        tick_flow_counters = PROFILED_METHODS[name] if self.profiling_tracks_tick_flows else None
+
+        def profiled_method(*args, **kwargs):
+            arr_active_vertices = self._get_active_vertices()
+            if tick_flow_counters is not None:
+                before = self.pop_per_vertex.sum(axis=2, dtype=np.int64)
+            start = time.perf_counter()
+            rv = method(*args, **kwargs)
+            wall_time = time.perf_counter() - start
+
+            record = self._get_profiling_record(name)
+            record['nb_calls'] += 1
+            record['wall_time'] += wall_time
+            record['vertices_touched'] += self.pop_per_vertex.shape[2] if arr_active_vertices is None else \
+                arr_active_vertices.shape[0]
+            if tick_flow_counters is not None:
+                name_removed, name_added = tick_flow_counters
+                delta = self.pop_per_vertex.sum(axis=2, dtype=np.int64) - before
+                nb_added = max(int(delta.sum()), 0)
+                if name_removed is not None:
+                    record[name_removed] += max(-int(delta.sum()), 0)
+                if name_added is not None:
+                    record[name_added] += nb_added
+                record['ticks_moved'] += int(np.clip(delta, 0, None).sum()) - nb_added
+            return rv
+        return profiled_method
+
+    def enable_profiling(self, profile_kernels=False, track_tick_flows=False):
+        """
+        Start recording the calls to the instrumented methods.
+
+        :param profile_kernels: optional, boolean, default False. If True, the numba kernels called by the tick
+                                building blocks are timed too. Since kernels are shared by all the tick objects, only
+                                one object can profile kernels at a time.
+        :param track_tick_flows: optional, boolean, default False. If True, the net flows of ticks caused by the
+                                 methods modifying the tick population are recorded (see the class docstring). This
+                                 adds two passes over the whole population to each of those calls.
+        """
+        global _kernel_profiler
+        if self.is_profiling:
+            return
+        if profile_kernels:
+            if _kernel_profiler is not None:
+                raise ValueError("Another tick object is already profiling the numba kernels.")
+            for module_name in PROFILED_MODULES:
+                module = sys.modules.get(module_name)
+                if module is None:
+                    continue
+                for name, obj in list(vars(module).items()):
+                    if isinstance(obj, nb.core.registry.CPUDispatcher):
+                        _original_kernels[(module_name, name)] = obj
+                        setattr(module, name, _make_timed_kernel(name, obj))
+            _kernel_profiler = self
+
+        self.profiling_tracks_tick_flows = track_tick_flows
+        for name in PROFILED_METHODS:
+            if hasattr(type(self), name):
+                setattr(self, name, self._make_profiled_method(name, getattr(type(self), name).__get__(self)))
+        self.is_profiling = True
+
+    def disable_profiling(self):
+        """
+        Stop recording, and remove all the instrumentation. The records of the timestep in progress are kept.
+        """
+        global _kernel_profiler
+        if not self.is_profiling:
+            return
+        for name in PROFILED_METHODS:
+            self.__dict__.pop(name, None)
+        if _kernel_profiler is self:
+            for (module_name, name), kernel in _original_kernels.items():
+                setattr(sys.modules[module_name], name, kernel)
+            _original_kernels.clear()
+            _kernel_profiler = None
+        self.is_profiling = False
+
+    def end_profiling_timestep(self):
+        """
+        Close the records of the current timestep and append them to profiling_history.
+
+        :return: dict, records of the timestep that has just been closed.
+        """
+        records = self.profiling_current_timestep
+        self.profiling_history.append(records)
+        self.profiling_current_timestep = {}
+        return records
+
+    def get_profiling_summary(self):
+        """
+        Summary of the recorded timesteps, one row per timestep and per instrumented method or kernel.
+
+        :return: list of dict, each having the keys 'timestep', 'name', and the counters listed in COUNTER_NAMES.
+        """
+        list_rows = []
+        for timestep, records in enumerate(self.profiling_history):
+            for name, record in sorted(records.items()):
+                row = {'timestep': timestep, 'name': name}
+                row.update(record)
+                list_rows.append(row)
+        return list_rows
+
+    def export_profiling_summary(self, path):
+        """
+        Write the summary returned by get_profiling_summary in a JSON file.
+
+        :param path: string, path of the file.
+        """
+        with open(path, 'w') as file:
+            json.dump(self.get_profiling_summary(), file, indent=1)
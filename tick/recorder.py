@@ -0,0 +1,206 @@
+import json
+import os
+import queue
+import threading
+import numpy as np
+
+
+class TickCountRecorder:
+    """
+    Record per-vertex tick counts during a simulation, and write them on disk from a background thread so that the
+    simulation loop is not slowed down by I/O.
+
+    Each recorded aggregate is defined by a triplet (stage, feeding_status, disease_status), using the same values as
+    the kwargs of the method count_tick_per_vertex. The counts are copied into preallocated chunks of chunk_size
+    records. Once a chunk is full, it is handed to a writer thread which appends it to one raw binary file per
+    aggregate. At most nb_buffers chunks exist at the same time, so that memory stays bounded: if the disk is slower
+    than the simulation, the call to record eventually waits for a chunk to be written.
+
+    The recording can be down-sampled in time (only one call to record out of timestep_interval is kept) and in
+    space (the counts of the vertices sharing the same group are summed).
+
+    The files can be read back with load_tick_counts.
+
+    :param tick: tick object, providing the methods count_tick_per_vertex and get_tick_count_tensor.
+    :param path: string, directory where the files are written. Created if needed.
+    :param list_aggregates: list of tuples (stage, feeding_status, disease_status).
+    :param chunk_size: optional, integer, default 64. Number of records per chunk.
+    :param nb_buffers: optional, integer, default 4. Number of chunks preallocated.
+    :param timestep_interval: optional, integer, default 1. Only one call to record every timestep_interval calls is
+                              kept.
+    :param vertex_groups: optional, 1D array of non-negative int, default None. If given, vertex_groups[i] is the group
+                          of the vertex of index i, and the counts are summed by group.
+    """
+    def __init__(self, tick, path, list_aggregates, chunk_size=64, nb_buffers=4, timestep_interval=1,
+                 vertex_groups=None):
+        if chunk_size < 1 or nb_buffers < 2 or timestep_interval < 1:
+            raise ValueError("chunk_size and timestep_interval should be positive, and nb_buffers at least 2.")
+        self.tick = tick
+        self.path = path
+        self.list_aggregates = [tuple(aggregate) for aggregate in list_aggregates]
+        self.chunk_size = chunk_size
+        self.timestep_interval = timestep_interval
+
+        self.vertex_groups = None if vertex_groups is None else np.asarray(vertex_groups, dtype=np.int64)
+        nb_columns = tick.graph.number_vertices if vertex_groups is None else int(self.vertex_groups.max()) + 1
+        self.nb_groups = nb_columns
+        self.nb_columns = getattr(tick, 'nb_replicates', 1) * nb_columns
+
+        os.makedirs(path, exist_ok=True)
+        self.list_file_names = ['aggregate_' + str(i) + '.bin' for i in range(len(self.list_aggregates))]
+        for file_name in self.list_file_names + ['timesteps.bin']:
+            open(os.path.join(path, file_name), 'wb').close()
+        self.nb_records_written = 0
+        self._write_metadata()
+
+        self.queue_free = queue.Queue()
+        for _ in range(nb_buffers):
+            self.queue_free.put((np.full((len(self.list_aggregates), chunk_size, self.nb_columns), 0, dtype=np.int64),
+                                 np.full(chunk_size, 0, dtype=np.int64)))
+        self.queue_to_write = queue.Queue()
+        self.writer_error = None
+        self.writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer.start()
+
+        self.current_chunk = None
+        self.nb_records_in_chunk = 0
+        self.counter_calls = 0
+        self.is_closed = False
+
+    def _write_metadata(self):
+        metadata = {'aggregates': [list(aggregate) for aggregate in self.list_aggregates],
+                    'files': self.list_file_names,
+                    'nb_columns': self.nb_columns,
+                    'nb_replicates': getattr(self.tick, 'nb_replicates', 1),
+                    'nb_records': self.nb_records_written,
+                    'timestep_interval': self.timestep_interval,
+                    'grouped_vertices': self.vertex_groups is not None,
+                    'dtype': np.dtype(np.int64).str}
+        with open(os.path.join(self.path, 'recording.json'), 'w') as file:
+            json.dump(metadata, file)
+
+    def _writer_loop(self):
+        while True:
+            item = self.queue_to_write.get()
+            if item is None:
+                self.queue_to_write.task_done()
+                return
+            chunk, arr_timesteps, nb_records = item
+            try:
+                if self.writer_error is None:
+                    for index_aggregate, file_name in enumerate(self.list_file_names):
+                        with open(os.path.join(self.path, file_name), 'ab') as file:
+                            file.write(chunk[index_aggregate, :nb_records].tobytes())
+                    with open(os.path.join(self.path, 'timesteps.bin'), 'ab') as file:
+                        file.write(arr_timesteps[:nb_records].tobytes())
+                    self.nb_records_written += nb_records
+                    self._write_metadata()
+            except Exception as error:
+                self.writer_error = error
+            self.queue_free.put((chunk, arr_timesteps))
+            self.queue_to_write.task_done()
+
+    def _check_writer(self):
+        if self.writer_error is not None:
+            raise RuntimeError("The writer thread of the recorder failed.") from self.writer_error
+
+    def _send_current_chunk(self):
+        if self.current_chunk is not None and self.nb_records_in_chunk > 0:
+            self.queue_to_write.put(self.current_chunk + (self.nb_records_in_chunk,))
+            self.current_chunk = None
+            self.nb_records_in_chunk = 0
+
+    def record(self, timestep=None):
+        """
+        Record the current counts of the tick population, unless this call is skipped by the temporal down-sampling.
+
+        :param timestep: optional, integer, default None. Timestep saved along with the record. If None, the number of
+                         calls to record made before this one is used.
+        """
+        if self.is_closed:
+            raise ValueError("The recorder is closed.")
+        self._check_writer()
+        index_call = self.counter_calls
+        self.counter_calls += 1
+        if index_call % self.timestep_interval != 0:
+            return
+
+        if self.current_chunk is None:
+            self.current_chunk = self.queue_free.get()
+        chunk, arr_timesteps = self.current_chunk
+        # a single pass over the population, after which all the aggregates are read from the cached tensor
+        self.tick.get_tick_count_tensor()
+        for index_aggregate, (stage, feeding_status, disease_status) in enumerate(self.list_aggregates):
+            counts = self.tick.count_tick_per_vertex(stage=stage, feeding_status=feeding_status,
+                                                     disease_status=disease_status)
+            self._store_counts(counts, chunk[index_aggregate, self.nb_records_in_chunk])
+        arr_timesteps[self.nb_records_in_chunk] = index_call if timestep is None else timestep
+        self.nb_records_in_chunk += 1
+
+        if self.nb_records_in_chunk == self.chunk_size:
+            self._send_current_chunk()
+
+    def _store_counts(self, counts, row):
+        """
+        Copy the counts returned by count_tick_per_vertex (1D, or 2D with replicates) in a row of a chunk, summing
+        them by group if needed.
+        """
+        counts = counts.reshape((-1, counts.shape[-1]))
+        if self.vertex_groups is None:
+            row[:] = counts.ravel()
+        else:
+            for r in range(counts.shape[0]):
+                row[r * self.nb_groups:(r + 1) * self.nb_groups] = np.bincount(self.vertex_groups, weights=counts[r],
+                                                                               minlength=self.nb_groups)
+
+    def flush(self):
+        """
+        Send the records of the current, partially filled, chunk to the writer thread and wait for all the records
+        to be written.
+        """
+        self._send_current_chunk()
+        self.queue_to_write.join()
+        self._check_writer()
+
+    def close(self):
+        """
+        Write all the remaining records and stop the writer thread.
+        """
+        if self.is_closed:
+            return
+        self._send_current_chunk()
+        self.queue_to_write.put(None)
+        self.writer.join()
+        self.is_closed = True
+        self._check_writer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def load_tick_counts(path):
+    """
+    Read the files written by a TickCountRecorder.
+
+    :param path: string, directory given to the recorder.
+
+    :return: a pair (arr_timesteps, dict_counts) where arr_timesteps is a 1D array of int and dict_counts associates
+             to each aggregate (stage, feeding_status, disease_status) a read-only memory-mapped 2D array of int of
+             shape (nb_records, nb_columns).
+    """
+    with open(os.path.join(path, 'recording.json'), 'r') as file:
+        metadata = json.load(file)
+    dtype = np.dtype(metadata['dtype'])
+    nb_records = metadata['nb_records']
+    arr_timesteps = np.fromfile(os.path.join(path, 'timesteps.bin'), dtype=dtype)[:nb_records]
+    dict_counts = {}
+    for aggregate, file_name in zip(metadata['aggregates'], metadata['files']):
+        if nb_records == 0:
+            dict_counts[tuple(aggregate)] = np.full((0, metadata['nb_columns']), 0, dtype=dtype)
+        else:
+            dict_counts[tuple(aggregate)] = np.memmap(os.path.join(path, file_name), dtype=dtype, mode='r',
+                                                      shape=(nb_records, metadata['nb_columns']))
+    return arr_timesteps, dict_counts
@@ -1,7 +1,80 @@
-from .jit_compiled_functions import stage_transition_proportion_based_transition_from_matrix
+from .jit_compiled_functions import (stage_transition_apply_transition_plan,
+                                     stage_transition_apply_transition_plan_parallel,
+                                     stage_transition_apply_transition_plan_on_vertices,
+                                     stage_transition_apply_transition_plan_on_vertices_parallel)
+from collections import OrderedDict
 import numpy as np
 
 
+# maximum number of plans kept in the cache of the method 'proportion_based_transitions'. Models usually alternate
+# between a handful of seasonal dictionaries, so a small cache is enough, and the least recently used plan is dropped
+# when a new one is needed.
+MAX_CACHED_TRANSITION_PLANS = 32
+
+
+def get_transition_processing_order(matrix_transitions):
+    """
+    Compute an order in which the destination stages of a transition matrix can be processed, so that ticks that just
+    transitioned toward a stage are not moved a second time during the same timestep. That is, a stage is processed
+    only once all the stages it sends ticks to have been processed.
+
+    :param matrix_transitions: 2D array of floats. matrix_transitions[i, j] is the proportion of ticks that should
+                               go from status i to status j.
+
+    :return: 1D array of int, containing each stage index exactly once.
+    """
+    nb_stages = matrix_transitions.shape[0]
+    nb_out_edges = (matrix_transitions > 0.).sum(axis=1)
+    order = []
+    processed = np.full(nb_stages, False)
+    while len(order) < nb_stages:
+        ready = np.where(~processed & (nb_out_edges == 0))[0]
+        if ready.shape[0] == 0:
+            raise ValueError("There is a loop in the transitions, which is not authorized.")
+        for index in ready[::-1]:
+            processed[index] = True
+            order.append(index)
+            nb_out_edges -= matrix_transitions[:, index] > 0.
+    return np.array(order, dtype=np.int64)
+
+
+class TransitionPlan:
+    """
+    Compiled version of a transition matrix, meant to be built once and then reused at each timestep. The non-zero
+    entries of the matrix are stored as a sparse list of edges (start stage, end stage, proportion), sorted in an
+    order in which they can be applied sequentially (see 'get_transition_processing_order'). Transition matrices
+    containing a loop are rejected when the plan is built.
+
+    attributes:
+        - nb_stages: integer, size of the transition matrix the plan has been built from.
+        - arr_start: 1D array of int, starting stage of each edge.
+        - arr_end: 1D array of int, ending stage of each edge.
+        - arr_proportion: 1D array of float, proportion of the population of the starting stage that transitions.
+    """
+    def __init__(self, matrix_transitions):
+        matrix_transitions = np.asarray(matrix_transitions, dtype=float)
+        if len(matrix_transitions.shape) != 2 or matrix_transitions.shape[0] != matrix_transitions.shape[1]:
+            raise ValueError("The transition matrix should be a square 2D array.")
+        if (matrix_transitions < 0.).any() or (matrix_transitions > 1.).any():
+            raise ValueError("The transition matrix has values that are not between 0 and 1.")
+
+        self.nb_stages = matrix_transitions.shape[0]
+
+        list_start = []
+        list_end = []
+        for end_stage in get_transition_processing_order(matrix_transitions):
+            for start_stage in np.where(matrix_transitions[:, end_stage] > 0.)[0]:
+                list_start.append(start_stage)
+                list_end.append(end_stage)
+        self.arr_start = np.array(list_start, dtype=np.int64)
+        self.arr_end = np.array(list_end, dtype=np.int64)
+        self.arr_proportion = matrix_transitions[self.arr_start, self.arr_end]
+
+    @property
+    def nb_edges(self):
+        return self.arr_start.shape[0]
+
+
 class ProportionBasedStageTransition:
     """
     Building block that provides simple "proportion-based" ways to modelize ticks' stage transitions.
@@ -11,7 +84,19 @@ class ProportionBasedStageTransition:
     Important: the methods provided here do not make assumptions on the various class of population
     """
     def __init__(self, **kwargs):
-        pass
+        # plans compiled from the dictionaries given to 'proportion_based_transitions'. The plans only depend on which
+        # transitions have a positive proportion, so they are keyed on those transitions, and each value is a pair
+        # (plan, list of the keyes of the dictionary in the order of the edges of the plan) used to refresh the
+        # proportions of the plan at each call. The cache is a LRU holding at most MAX_CACHED_TRANSITION_PLANS plans.
+        self.dict_cached_transition_plans = OrderedDict()
+
+    def clear_transition_plan_cache(self):
+        """
+        Empty the cache of transition plans used by the method 'proportion_based_transitions'. The cache is bounded
+        (it keeps the MAX_CACHED_TRANSITION_PLANS most recently used plans), so this is only needed to release memory
+        early, for instance once a model stops using a set of transition dictionaries.
+        """
+        self.dict_cached_transition_plans.clear()
 
     def _sampy_debug_proportion_based_transitions(self, feeding_status, disease_status, dict_transitions):
         if feeding_status not in ['unfed', 'fed']:
@@ -61,21 +146,53 @@ class ProportionBasedStageTransition:
 
         :param feeding_status: string, either 'fed' or 'unfed'.
         :param disease_status: string, either 'infected' of 'susceptible'.
-        :param matrix_transitions: 2D array of floats. matrix_transitions[i, j] is the proportion of ticks that should
-                                   go from status i to status j. Note that the method will be more efficient if there
-                                   are only transitions such that j > i.
+        :param dict_transitions: dict whose keyes are tuples (start_phase, start_stage, end_phase, end_stage) and
+                                 values floats between 0 and 1. The plan compiled from this dict is cached, so that
+                                 using dicts with the same keyes at each timestep does not trigger a new compilation,
+                                 even if the proportions change. Only the MAX_CACHED_TRANSITION_PLANS most recently
+                                 used plans are kept, see also 'clear_transition_plan_cache'.
         """
-        matrix_transitions = np.full((self.pop_per_vertex_fed.shape[1],
-                                      self.pop_per_vertex_fed.shape[1]), 0.)
-        for key, val in dict_transitions.items():
-            start_phase, start_stage, end_phase, end_stage = key
+        key_cache = frozenset(key for key, val in dict_transitions.items() if val > 0.)
+        if key_cache in self.dict_cached_transition_plans:
+            transition_plan, list_edge_keys = self.dict_cached_transition_plans[key_cache]
+            self.dict_cached_transition_plans.move_to_end(key_cache)
+            transition_plan.arr_proportion[:] = [dict_transitions[key] for key in list_edge_keys]
+        else:
+            transition_plan = self.compile_transition_plan(dict_transitions)
+            dict_key_of_edge = {self._get_transition_stage_indexes(key): key for key in key_cache}
+            list_edge_keys = [dict_key_of_edge[(start, end)]
+                              for start, end in zip(transition_plan.arr_start, transition_plan.arr_end)]
+            self.dict_cached_transition_plans[key_cache] = (transition_plan, list_edge_keys)
+            if len(self.dict_cached_transition_plans) > MAX_CACHED_TRANSITION_PLANS:
+                self.dict_cached_transition_plans.popitem(last=False)
+        self.proportion_based_transition_from_plan(feeding_status, disease_status, transition_plan)
+
+    def compile_transition_plan(self, dict_transitions):
+        """
+        Build a TransitionPlan from a dictionary of transitions, using the same format as the one of the method
+        'proportion_based_transitions'. The plan can then be reused at each timestep through the method
+        'proportion_based_transition_from_plan'.
 
-            index_start_stage = getattr(self, 'indexes_' + start_phase + '_stage')[start_stage]
-            index_end_stage = getattr(self, 'indexes_' + end_phase + '_stage')[end_stage]
+        :param dict_transitions: dict whose keyes are tuples (start_phase, start_stage, end_phase, end_stage) and
+                                 values floats between 0 and 1.
 
-            matrix_transitions[index_start_stage, index_end_stage] = val
+        :return: TransitionPlan object.
+        """
+        matrix_transitions = np.full((self.pop_per_vertex.shape[3], self.pop_per_vertex.shape[3]), 0.)
+        for key, val in dict_transitions.items():
+            matrix_transitions[self._get_transition_stage_indexes(key)] = val
+
+        return TransitionPlan(matrix_transitions)
 
-        self.proportion_based_transition_from_matrix(feeding_status, disease_status, matrix_transitions)
+    def _get_transition_stage_indexes(self, key):
+        """
+        Convert a key (start_phase, start_stage, end_phase, end_stage) of a dictionary of transitions into the indexes
+        of its starting and ending stages in the tick population.
+        """
+        start_phase, start_stage, end_phase, end_stage = key
+        index_start_stage = getattr(self, 'indexes_' + start_phase + '_stage')[0] + start_stage
+        index_end_stage = getattr(self, 'indexes_' + end_phase + '_stage')[0] + end_stage
+        return index_start_stage, index_end_stage
 
     def _sampy_debug_proportion_based_transition_from_matrix(self, feeding_status, disease_status, matrix_transitions):
         if feeding_status not in ['unfed', 'fed']:
@@ -88,6 +205,10 @@ class ProportionBasedStageTransition:
             raise ValueError("The transition matrix should be square.")
         if (matrix_transitions < 0.).any() or (matrix_transitions > 1.).any():
             raise ValueError("The transition matrix has values that are not between 0 and 1.")
+        # transitions conserve the number of ticks on each vertex, so that a single cell can at most receive the sum of
+        # the row it belongs to.
+        self._check_tick_count_overflow(self._get_compartment(feeding_status, disease_status).sum(axis=1,
+                                                                                                 dtype=np.int64))
         
     def proportion_based_transition_from_matrix(self, feeding_status, disease_status, matrix_transitions):
         """
@@ -105,18 +226,43 @@ class ProportionBasedStageTransition:
                                    go from status i to status j. Note that the method will be more efficient if there
                                    are only transitions such that j > i.
         """
-        if feeding_status == 'fed' and disease_status == 'susceptible':
-            stage_transition_proportion_based_transition_from_matrix(matrix_transitions, 
-                                                                     self.pop_per_vertex_fed)
-        elif feeding_status == 'unfed' and disease_status == 'susceptible':
-            stage_transition_proportion_based_transition_from_matrix(matrix_transitions, 
-                                                                     self.pop_per_vertex_unfed)
-        elif feeding_status == 'fed' and disease_status == 'infected':
-            stage_transition_proportion_based_transition_from_matrix(matrix_transitions, 
-                                                                     self.pop_per_vertex_fed_inf)
-        elif feeding_status == 'unfed' and disease_status == 'infected':
-            stage_transition_proportion_based_transition_from_matrix(matrix_transitions, 
-                                                                     self.pop_per_vertex_unfed_inf)
+        self.proportion_based_transition_from_plan(feeding_status, disease_status,
+                                                   TransitionPlan(matrix_transitions))
+
+    def _sampy_debug_proportion_based_transition_from_plan(self, feeding_status, disease_status, transition_plan):
+        if feeding_status not in ['unfed', 'fed']:
+            raise ValueError("feeding_status should either be 'fed' or 'unfed'.")
+        if disease_status not in ['infected', 'susceptible']:
+            raise ValueError("disease_status should either be 'infected' or 'susceptible'.")
+        if transition_plan.nb_stages != self.pop_per_vertex.shape[3]:
+            raise ValueError("The transition plan has not been built for the right number of stages.")
+        self._check_tick_count_overflow(self._get_compartment(feeding_status, disease_status).sum(axis=1,
+                                                                                                 dtype=np.int64))
+
+    def proportion_based_transition_from_plan(self, feeding_status, disease_status, transition_plan):
+        """
+        Performs the transitions encoded in a TransitionPlan object. This is the fastest way to perform transitions
+        at each timestep, since the plan is compiled only once and only the non-zero transitions are processed.
+
+        :param feeding_status: string, either 'fed' or 'unfed'.
+        :param disease_status: string, either 'infected' of 'susceptible'.
+        :param transition_plan: TransitionPlan object.
+        """
+        self.invalidate_tick_count_cache()
+        population_array = self._get_compartment(feeding_status, disease_status)
+        arr_active_vertices = self._get_active_vertices()
+        if arr_active_vertices is not None:
+            if self._use_parallel_kernels(arr_active_vertices.shape[0]):
+                self._run_parallel_kernel(stage_transition_apply_transition_plan_on_vertices_parallel,
+                                          transition_plan.arr_start, transition_plan.arr_end,
+                                          transition_plan.arr_proportion, population_array, arr_active_vertices)
+            else:
+                stage_transition_apply_transition_plan_on_vertices(transition_plan.arr_start, transition_plan.arr_end,
+                                                                   transition_plan.arr_proportion, population_array,
+                                                                   arr_active_vertices)
+        elif self._use_parallel_kernels(population_array.shape[0]):
+            self._run_parallel_kernel(stage_transition_apply_transition_plan_parallel, transition_plan.arr_start,
+                                      transition_plan.arr_end, transition_plan.arr_proportion, population_array)
         else:
-            raise ValueError("Not valid choice of feeding status and disease status.")
-        
+            stage_transition_apply_transition_plan(transition_plan.arr_start, transition_plan.arr_end,
+                                                   transition_plan.arr_proportion, population_array)
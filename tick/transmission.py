@@ -0,0 +1,103 @@
+import numpy as np
+from numba.typed import List as NumbaList
+from .jit_compiled_functions import transmission_hosts_and_feeding_ticks
+
+
+class HostTickTransmission:
+    """
+    Building block modelling the transmission of a pathogen between the hosts and the ticks feeding on them. It relies
+    on the columns created by the feeding building block in the hosts' df_attributes, and moves feeding ticks from the
+    susceptible columns 'tick_stage_{stage}_slot_{k}' to the infected ones 'tick_stage_{stage}_slot_{k}_inf'. The
+    infection status of the hosts is read from, and written in, a boolean column of their df_attributes.
+
+    Three processes are modelled (see transmission_between_hosts_and_ticks): host to tick, tick to host and co-feeding
+    transmission. Free-living ticks are never infected by this building block. They only get infected by feeding, and
+    the infected ticks are then released in the infected compartments of the tick population.
+
+    Since the hosts are shared by all the replicates of the tick population, this building block cannot be used with
+    several replicates.
+    """
+    def __init__(self, **kwargs):
+        pass
+
+    def _check_feeding_columns(self):
+        """
+        Make sure the feeding building block stores the ticks attached to each agent, which is not the case of
+        FeedingVertexCohorts.
+        """
+        if not hasattr(self, 'get_feeding_column_name'):
+            raise ValueError("Transmission between hosts and ticks requires the per-agent feeding columns created by "
+                             "FeedingSingleGraph or FeedingMultiGraph, and cannot be used with FeedingVertexCohorts.")
+        if self.nb_replicates > 1:
+            raise ValueError("Transmission between hosts and ticks is not available with several replicates of the "
+                             "tick population, since the infection status of the hosts is shared by all of them.")
+
+    def _sampy_debug_transmission_between_hosts_and_ticks(self, rng_seed, list_host_probabilities,
+                                                          infected_attribute='infected'):
+        self._check_feeding_columns()
+        for item in list_host_probabilities:
+            if len(item) != 4:
+                raise ValueError("Each item should be of the form (host, p_host_to_tick, p_tick_to_host, "
+                                 "p_cofeeding).")
+            if item[0] not in self.dict_hosts:
+                raise ValueError("The host " + str(item[0]) + " is not in dict_hosts.")
+            for proba in item[1:]:
+                if not (0. <= proba <= 1.):
+                    raise ValueError("Transmission probabilities should be floats between 0 and 1.")
+            try:
+                arr_infected = self.dict_hosts[item[0]][0].df_attributes[infected_attribute]
+            except (KeyError, ValueError):
+                raise ValueError("The host " + str(item[0]) + " has no attribute " + str(infected_attribute) + ".")
+            if np.asarray(arr_infected).dtype != np.bool_:
+                raise ValueError("The attribute " + str(infected_attribute) + " of the host " + str(item[0]) +
+                                 " should be an array of bool.")
+
+    def transmission_between_hosts_and_ticks(self, rng_seed, list_host_probabilities, infected_attribute='infected'):
+        """
+        Perform one timestep of pathogen transmission between the agents of the host populations and the ticks feeding
+        on them, whatever their stage and the number of timesteps they have been feeding for. For each agent, the
+        number of infected ticks attached to it and its infection status are taken at the beginning of the call, so
+        that:
+            - each susceptible tick feeding on an infected agent becomes infected with probability p_host_to_tick;
+            - each susceptible tick becomes infected with probability p_cofeeding for each infected tick feeding on
+              the same agent (co-feeding transmission, which does not require the agent to be infected);
+            - each susceptible agent becomes infected with probability p_tick_to_host for each infected tick feeding
+              on it.
+        The number of ticks infected are drawn from binomial distributions, so that all counts stay integers.
+
+        IMPORTANT: this method used numba random number generation, which we try to avoid as much
+                   as possible.
+
+        :param rng_seed: seed used inside the numba compiled function.
+        :param list_host_probabilities: list of tuples of the form (host, p_host_to_tick, p_tick_to_host,
+                                        p_cofeeding), where host is a key of dict_hosts.
+        :param infected_attribute: optional, string, default 'infected'. Name of the boolean column of the hosts'
+                                   df_attributes containing their infection status.
+
+        :return: dict associating to each host given in list_host_probabilities a pair of integers (number of agents
+                 infected, number of feeding ticks infected).
+        """
+        self._check_feeding_columns()
+
+        # each host population gets its own independent random stream
+        arr_seeds = np.random.SeedSequence(rng_seed).generate_state(len(list_host_probabilities))
+        dict_nb_infected = {}
+        for index_item, (host, p_host_to_tick, p_tick_to_host, p_cofeeding) in enumerate(list_host_probabilities):
+            population, list_stages = self.dict_hosts[host]
+            host_df = population.df_attributes
+
+            list_col_tick = NumbaList()
+            list_col_tick_inf = NumbaList()
+            for stage in list_stages:
+                for timestep in range(self.nb_timesteps_feeding):
+                    list_col_tick.append(host_df[self.get_feeding_column_name(stage, timestep)])
+                    list_col_tick_inf.append(host_df[self.get_feeding_column_name(stage, timestep, infected=True)])
+            if len(list_col_tick) == 0:
+                dict_nb_infected[host] = (0, 0)
+                continue
+
+            dict_nb_infected[host] = transmission_hosts_and_feeding_ticks(arr_seeds[index_item],
+                                                                          host_df[infected_attribute], list_col_tick,
+                                                                          list_col_tick_inf, float(p_host_to_tick),
+                                                                          float(p_tick_to_host), float(p_cofeeding))
+        return dict_nb_infected